@@ -0,0 +1,105 @@
+"""
+设备元数据进程内缓存
+截图/推帧等热路径按序列号获取设备主键、名称等元数据时只读缓存，
+缓存未命中或过期才查询数据库（按设备计，而非按帧计）。
+设备保存/删除信号与 ADB 扫描更新会主动失效对应条目。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+# 缓存有效期（秒）
+DEFAULT_TTL = 300.0
+
+
+@dataclass(frozen=True)
+class DeviceMetadata:
+    """设备元数据快照"""
+    id: int
+    device_id: str
+    name: str = ''
+    brand: str = ''
+    model: str = ''
+    width: int = 0
+    height: int = 0
+    status: str = ''
+
+    @property
+    def room(self) -> str:
+        """Socket.IO 设备房间名 device_<pk>"""
+        return f"device_{self.id}"
+
+
+class DeviceMetadataCache:
+    """按序列号缓存设备元数据（含“设备不存在”的否定结果）"""
+
+    FIELDS = ('id', 'device_id', 'name', 'brand', 'model', 'width', 'height', 'status')
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Optional[DeviceMetadata], float]] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'db_queries': 0, 'invalidations': 0}
+
+    def _load(self, serial: str) -> Optional[DeviceMetadata]:
+        from apps.devices.models import Device
+
+        with self._lock:
+            self._stats['db_queries'] += 1
+        row = Device.objects.filter(device_id=serial).values(*self.FIELDS).first()
+        return DeviceMetadata(**row) if row else None
+
+    def get(self, serial: str) -> Optional[DeviceMetadata]:
+        """获取设备元数据，设备不存在或数据库不可用时返回 None"""
+        if not serial:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(serial)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+        try:
+            metadata = self._load(serial)
+        except Exception:
+            # 数据库不可用时不缓存，交由下次重试
+            return None
+        with self._lock:
+            self._entries[serial] = (metadata, now)
+        return metadata
+
+    def invalidate(self, serials: Optional[Iterable[str]] = None):
+        """失效指定序列号的条目，serials 为 None 时全部失效"""
+        with self._lock:
+            if serials is None:
+                self._stats['invalidations'] += len(self._entries)
+                self._entries.clear()
+                return
+            for serial in serials:
+                if self._entries.pop(serial, None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, cached=len(self._entries))
+
+
+device_metadata_cache = DeviceMetadataCache()
+
+
+def get_device_metadata(serial: str) -> Optional[DeviceMetadata]:
+    """按序列号获取设备元数据（进程内缓存）"""
+    return device_metadata_cache.get(serial)
+
+
+def get_device_pk(serial: str) -> Optional[int]:
+    """按序列号获取设备主键（进程内缓存）"""
+    metadata = device_metadata_cache.get(serial)
+    return metadata.id if metadata else None
+
+
+def invalidate_device_metadata(serials: Optional[Iterable[str]] = None):
+    """设备信息变更后调用，serials 为 None 时清空缓存"""
+    device_metadata_cache.invalidate(serials)
@@ -10,6 +10,7 @@ from django.db.models import Q
 from apps.users.models import AuthUser
 from utils.adb_helper import list_devices, DeviceInfo
 from apps.devices.models import Device, DeviceLog
+from apps.devices.metadata_cache import invalidate_device_metadata
 from apps.notifications.services import send_message, SSEEvent
 from wfgame_ai_server.settings import REDIS
 
@@ -132,6 +133,10 @@ def scan():
         if logs_to_create:
             DeviceLog.objects.bulk_create(logs_to_create)
 
+    # 批量写入不触发模型信号，需主动失效设备元数据缓存
+    if all_affected_ids:
+        invalidate_device_metadata(all_affected_ids)
+
 
 def reserve(operator: AuthUser, key: Union[int, str]):
     """
@@ -0,0 +1,15 @@
+"""
+设备信号处理
+设备保存/删除时失效进程内的设备元数据缓存
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.devices.metadata_cache import invalidate_device_metadata
+from apps.devices.models import Device
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_metadata_on_change(sender, instance, **kwargs):
+    invalidate_device_metadata([instance.device_id])
@@ -285,6 +285,29 @@ class OCRTaskAPIView(APIView):
                     code=status.HTTP_404_NOT_FOUND,
                     msg="任务不存在"
                 )
+
+        elif action == "phase_timings":
+            # 获取任务各阶段耗时统计（墙钟/CPU时间、处理条数、峰值内存）
+            task_id = request.data.get("id")
+            task = OCRTask.objects.filter(id=task_id).only("id", "status", "phase_timings").first()
+            if not task:
+                return api_response(code=status.HTTP_404_NOT_FOUND, msg="任务不存在")
+            return api_response(data={
+                "id": task.id,
+                "status": task.status,
+                "phase_timings": task.phase_timings or {},
+            })
+
+        elif action == "resume":
+            # 从检查点续跑中断的任务（Worker 崩溃/重启后状态可能仍为 running），已提交批次不会重复识别
+            task_id = request.data.get("id")
+            task = OCRTask.objects.filter(id=task_id).first()
+            if not task:
+                return api_response(code=status.HTTP_404_NOT_FOUND, msg="任务不存在")
+            if task.status == "completed":
+                return api_response(code=status.HTTP_400_BAD_REQUEST, msg="任务已完成，无需续跑")
+            process_ocr_task.delay(task.id)
+            return api_response(data=OCRTaskSerializer(task).data, msg="任务已从检查点重新提交")
         # elif action == "get":
         #     task_id = request.data.get("id")
         #     try:
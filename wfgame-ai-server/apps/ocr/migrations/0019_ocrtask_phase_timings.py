@@ -0,0 +1,20 @@
+# Generated by Django 4.2.21 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ocr", "0018_remove_ocrproject_updated_at_ocrresult_is_translated_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ocrtask",
+            name="phase_timings",
+            field=models.JSONField(
+                blank=True, default=dict, null=True, verbose_name="阶段耗时统计"
+            ),
+        ),
+    ]
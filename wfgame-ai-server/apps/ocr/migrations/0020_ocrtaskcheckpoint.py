@@ -0,0 +1,48 @@
+# Generated by Django 4.2.21 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ocr", "0019_ocrtask_phase_timings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OCRTaskCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.CharField(
+                        db_index=True, max_length=50, verbose_name="OCR任务ID"
+                    ),
+                ),
+                ("chunk_index", models.IntegerField(verbose_name="批次序号")),
+                (
+                    "image_paths",
+                    models.TextField(verbose_name="本批次已处理图片相对路径，换行分隔"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "OCR任务检查点",
+                "verbose_name_plural": "OCR任务检查点",
+                "db_table": "ocr_task_checkpoint",
+                "unique_together": {("task_id", "chunk_index")},
+            },
+        ),
+    ]
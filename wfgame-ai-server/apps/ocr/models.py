@@ -113,6 +113,10 @@ class OCRTask(CommonFieldsMixin):
     match_rate = models.DecimalField(
         max_digits=5, decimal_places=2, default=0.00, verbose_name="匹配率"
     )
+    # 各阶段耗时统计，结构见 services.phase_timer.PhaseTimer.to_dict
+    phase_timings = models.JSONField(
+        null=True, blank=True, default=dict, verbose_name="阶段耗时统计"
+    )
 
     def __str__(self):
         return self.id
@@ -478,15 +482,21 @@ class OCRCache(models.Model):
         return set(OCRCache.objects.values_list("image_hash", flat=True))
 
     @staticmethod
-    def record_cache(task_id: str):
+    def record_cache(task_id: str, image_hashes: list = None):
         """
         记录OCR任务的缓存结果
         逻辑升级：
         1. 如果缓存不存在 -> 创建 (is_verified=False)
         2. 如果缓存存在且 is_verified=False -> 更新 (假设最新跑的任务结果更优)
         3. 如果缓存存在且 is_verified=True -> **跳过更新** (保护人工真值)
+        :param image_hashes: 仅记录指定哈希的结果（按批写库时使用），None 表示任务全部结果
         """
-        results = OCRResult.objects.all_teams().filter(task_id=task_id).only("image_hash", "id")
+        results = OCRResult.objects.all_teams().filter(task_id=task_id)
+        if image_hashes is not None:
+            if not image_hashes:
+                return
+            results = results.filter(image_hash__in=image_hashes)
+        results = results.only("image_hash", "id")
 
         # 当前已保存的缓存记录(字典形式,方便后续查询)
         existing_caches = {
@@ -595,10 +605,52 @@ class OCRCacheHit(models.Model):
             matched_result_ids.extend(entry.result_id for entry in cache_entries)
             hit_hashes.update(entry.image_hash for entry in cache_entries)
         if task_id and matched_result_ids:
-            OCRCacheHit.objects.create(
+            # 任务从检查点续跑时会再次命中，覆盖已有记录
+            OCRCacheHit.objects.update_or_create(
                 task_id=task_id,
-                result_ids=",".join(str(rid) for rid in matched_result_ids)
+                defaults={"result_ids": ",".join(str(rid) for rid in matched_result_ids)},
             )
         return hit_hashes
 
 
+class OCRTaskCheckpoint(models.Model):
+    """
+    OCR 任务检查点表
+    每提交一批识别结果记录一行，与该批结果在同一事务内写入；
+    任务中断（Worker 崩溃/重启）后重新执行时，跳过检查点中已处理的图片
+    """
+    task_id = models.CharField(max_length=50, db_index=True, verbose_name="OCR任务ID")
+    chunk_index = models.IntegerField(verbose_name="批次序号")
+    image_paths = models.TextField(verbose_name="本批次已处理图片相对路径，换行分隔")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "OCR任务检查点"
+        verbose_name_plural = "OCR任务检查点"
+        db_table = "ocr_task_checkpoint"
+        unique_together = ("task_id", "chunk_index")
+
+    @staticmethod
+    def processed_paths(task_id: str) -> set:
+        """获取任务已提交检查点中的全部图片相对路径"""
+        paths = set()
+        for image_paths in OCRTaskCheckpoint.objects.filter(task_id=task_id).values_list(
+            "image_paths", flat=True
+        ).iterator():
+            paths.update(p for p in image_paths.split("\n") if p)
+        return paths
+
+    @staticmethod
+    def next_chunk_index(task_id: str) -> int:
+        """获取下一个批次序号"""
+        last = OCRTaskCheckpoint.objects.filter(task_id=task_id).aggregate(
+            max_index=models.Max("chunk_index")
+        )["max_index"]
+        return 0 if last is None else last + 1
+
+    @staticmethod
+    def clear(task_id: str):
+        """任务完成后清理检查点"""
+        OCRTaskCheckpoint.objects.filter(task_id=task_id).delete()
+
+
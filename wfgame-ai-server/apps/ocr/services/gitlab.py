@@ -13,18 +13,21 @@ Features:
 
 import os
 import re
+import json
 import time
 import shutil
 import logging
+import threading
 import subprocess
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Callable
 from urllib.parse import quote, urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from dataclasses import dataclass, field
 from enum import Enum
 import requests
 import hashlib
+from requests.adapters import HTTPAdapter
 
 
 # 单文件调试时：设置 logger 输出到 控制台
@@ -63,6 +66,10 @@ class GitLabConfig:
     chunk_size: int = 8192
     skip_ssl_verify: bool = False
     per_page: int = 100
+    resume_partial: bool = True  # 断点续传：保留 .part 文件并使用 Range 请求续传
+    use_manifest: bool = True  # 使用本地清单跳过 blob SHA 未变化的文件
+    manifest_name: str = ".gitlab_download_manifest.json"
+    manifest_flush_interval: int = 100  # 每完成多少个文件落盘一次清单
 
 
 @dataclass
@@ -211,6 +218,10 @@ class GitLabService:
         self._setup_logging()
         # 初始化编译后的正则表达式缓存
         self._compiled_patterns = {"include": [], "exclude": []}
+        # 下载清单 {文件路径: blob SHA}，用于增量跳过未变化文件
+        self._manifest: Dict[str, str] = {}
+        self._manifest_lock = threading.Lock()
+        self._manifest_dirty = 0
 
     @staticmethod
     def parse_gitlab_url(repo_url: str) -> Tuple[str, str]:
@@ -288,6 +299,12 @@ class GitLabService:
         session.headers.update(headers)
         session.timeout = self.config.timeout
 
+        # 连接池：按并发线程数设置连接池大小，保证并发下载时复用 keep-alive 连接
+        pool_size = max(self.config.max_workers, 10)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
         # SSL验证配置
         if self.config.skip_ssl_verify:
             session.verify = False
@@ -338,6 +355,8 @@ class GitLabService:
             响应对象
         """
         last_exception = None
+        # requests.Session 不支持会话级超时，这里为每个请求显式设置
+        kwargs.setdefault("timeout", self.config.timeout)
 
         for attempt in range(self.config.retry_attempts):
             try:
@@ -346,6 +365,10 @@ class GitLabService:
                 return response
 
             except requests.exceptions.RequestException as e:
+                # Range 越界（416）重试无意义，交给调用方处理
+                response = getattr(e, "response", None)
+                if response is not None and response.status_code == 416:
+                    raise
                 last_exception = e
                 logger.warning(
                     f"请求失败 (尝试 {attempt + 1}/{self.config.retry_attempts}): {e}"
@@ -476,47 +499,50 @@ class GitLabService:
             else:
                 local_path = Path(output_dir) / Path(file_path).name
 
-            # 检查文件是否已存在
-            if local_path.exists() and not download_config.overwrite_existing:
-                self.stats.skipped_files += 1
-                return True, str(local_path), None
-
-            # 创建目录
-            local_path.parent.mkdir(parents=True, exist_ok=True)
-
-            # 首先尝试下载文件内容
             blob_sha = file_info.get("id")
             if not blob_sha:
                 return False, file_path, "文件信息中缺少blob SHA"
 
+            # 检查文件是否已存在：清单中 blob SHA 一致则视为未变化；
+            # 清单中记录的 SHA 不一致说明远端已更新，需要重新下载
+            if local_path.exists():
+                manifest_sha = self._manifest.get(file_path)
+                if manifest_sha == blob_sha:
+                    self.stats.skipped_files += 1
+                    return True, str(local_path), None
+                if manifest_sha is None and not download_config.overwrite_existing:
+                    self.stats.skipped_files += 1
+                    return True, str(local_path), None
+
+            # 创建目录
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+
             # 使用blob SHA方式下载
             api_url = f"{self.config.gitlab_host.rstrip('/')}/api/v4/projects/{quote(self.config.project_path, safe='')}/repository/blobs/{blob_sha}/raw"
-            headers = {}
-            if self.config.access_token:
-                headers["PRIVATE-TOKEN"] = self.config.access_token
+            part_path = local_path.with_name(local_path.name + ".part")
 
-            # 下载文件内容
-            response = self._request_with_retry(
-                "GET", api_url, headers=headers, stream=True
-            )
+            # 下载文件内容（存在 .part 时使用 Range 断点续传）
+            response, offset = self._open_ranged_stream(api_url, part_path)
 
-            # 读取前几行检查是否为 LFS 文件
+            # 读取前几行检查是否为 LFS 文件（续传时 .part 必为普通文件，无需检测）
             content_preview = b""
             content_chunks = []
 
-            for chunk in response.iter_content(chunk_size=self.config.chunk_size):
-                if chunk:
-                    content_chunks.append(chunk)
-                    if len(content_preview) < 1024:  # 只读取前1KB用于检测
-                        content_preview += chunk
+            if offset == 0:
+                for chunk in response.iter_content(chunk_size=self.config.chunk_size):
+                    if chunk:
+                        content_chunks.append(chunk)
+                        if len(content_preview) < 1024:  # 只读取前1KB用于检测
+                            content_preview += chunk
 
-                    # 如果已经读取了足够的内容用于检测，停止预览
-                    if len(content_preview) >= 1024:
-                        break
+                        # 如果已经读取了足够的内容用于检测，停止预览
+                        if len(content_preview) >= 1024:
+                            break
 
             # 检查是否为 Git LFS 文件
             content_preview_str = content_preview.decode("utf-8", errors="ignore")
-            if self._is_lfs_pointer(content_preview_str):
+            if offset == 0 and self._is_lfs_pointer(content_preview_str):
+                response.close()
                 logger.info(f"检测到 LFS 文件: {file_path}")
 
                 # 解析 LFS 信息
@@ -528,6 +554,7 @@ class GitLabService:
                         file_size = local_path.stat().st_size
                         self.stats.downloaded_files += 1
                         self.stats.downloaded_size += file_size
+                        self._record_manifest(file_path, blob_sha)
                         return True, str(local_path), None
                     else:
                         return False, file_path, f"LFS文件下载失败: {error}"
@@ -535,8 +562,8 @@ class GitLabService:
                     return False, file_path, "无法解析LFS指针文件"
 
             else:
-                # 普通文件，直接保存
-                with open(local_path, "wb") as f:
+                # 普通文件，先写入 .part，完成后原子替换
+                with open(part_path, "ab" if offset else "wb") as f:
                     for chunk in content_chunks:
                         f.write(chunk)
 
@@ -547,9 +574,17 @@ class GitLabService:
                         if chunk:
                             f.write(chunk)
 
+                # 续传拼接的文件需校验 git blob SHA，防止远端变化导致内容错乱
+                if offset and self._git_blob_sha(part_path) != blob_sha:
+                    part_path.unlink(missing_ok=True)
+                    self.stats.failed_files += 1
+                    return False, file_path, "续传文件校验失败，已删除临时文件"
+
+                os.replace(part_path, local_path)
                 file_size = local_path.stat().st_size
                 self.stats.downloaded_files += 1
-                self.stats.downloaded_size += file_size
+                self.stats.downloaded_size += file_size - offset
+                self._record_manifest(file_path, blob_sha)
                 return True, str(local_path), None
 
         except Exception as e:
@@ -558,6 +593,123 @@ class GitLabService:
             self.stats.failed_files += 1
             return False, file_path, error_msg
 
+    def _open_ranged_stream(
+        self, url: str, part_path: Path
+    ) -> Tuple[requests.Response, int]:
+        """
+        打开下载流，存在未完成的 .part 文件时使用 Range 请求续传
+
+        Args:
+            url: 下载地址
+            part_path: 临时文件路径
+
+        Returns:
+            (响应对象, 续传起始偏移；0 表示从头下载)
+        """
+        offset = 0
+        if self.config.resume_partial and part_path.exists():
+            offset = part_path.stat().st_size
+
+        if offset:
+            try:
+                response = self._request_with_retry(
+                    "GET", url, headers={"Range": f"bytes={offset}-"}, stream=True
+                )
+                if response.status_code == 206:
+                    logger.info(f"断点续传: {part_path.name} 从 {offset} 字节继续")
+                    return response, offset
+                # 服务端忽略了 Range，直接使用完整响应从头写入
+                return response, 0
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 416:
+                    raise
+                # 416: 临时文件与远端不一致，丢弃后从头下载
+                part_path.unlink(missing_ok=True)
+
+        return self._request_with_retry("GET", url, stream=True), 0
+
+    @staticmethod
+    def _git_blob_sha(file_path: Path) -> str:
+        """
+        计算文件的 git blob SHA1（与 GitLab 树接口返回的 id 一致）
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            blob SHA1 十六进制字符串
+        """
+        sha1 = hashlib.sha1(f"blob {file_path.stat().st_size}\0".encode())
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def _manifest_path(self, output_dir: str) -> Path:
+        """下载清单文件路径"""
+        return Path(output_dir) / self.config.manifest_name
+
+    def _load_manifest(self, output_dir: str):
+        """
+        加载本地下载清单 {文件路径: blob SHA}
+
+        Args:
+            output_dir: 输出目录
+        """
+        self._manifest = {}
+        self._manifest_dirty = 0
+        if not self.config.use_manifest:
+            return
+
+        manifest_path = self._manifest_path(output_dir)
+        if not manifest_path.exists():
+            return
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._manifest = data
+            logger.info(f"加载下载清单: {len(self._manifest)} 条记录")
+        except Exception as e:
+            logger.warning(f"读取下载清单失败，将重新下载: {e}")
+
+    def _record_manifest(self, file_path: str, blob_sha: str):
+        """记录已下载完成的文件"""
+        if not self.config.use_manifest:
+            return
+        with self._manifest_lock:
+            self._manifest[file_path] = blob_sha
+            self._manifest_dirty += 1
+
+    def _save_manifest(self, output_dir: str, force: bool = False):
+        """
+        将下载清单写入磁盘（先写临时文件再原子替换）
+
+        Args:
+            output_dir: 输出目录
+            force: 是否忽略落盘间隔强制写入
+        """
+        if not self.config.use_manifest:
+            return
+
+        with self._manifest_lock:
+            if not self._manifest_dirty:
+                return
+            if not force and self._manifest_dirty < self.config.manifest_flush_interval:
+                return
+            snapshot = dict(self._manifest)
+            self._manifest_dirty = 0
+
+        manifest_path = self._manifest_path(output_dir)
+        tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, manifest_path)
+        except Exception as e:
+            logger.warning(f"写入下载清单失败: {e}")
+
     def _is_lfs_pointer(self, content: str) -> bool:
         """
         检查内容是否为 Git LFS 指针文件
@@ -629,14 +781,20 @@ class GitLabService:
             lfs_url = f"https://git:{self.config.access_token}@{domain_name}/{self.config.project_path}.git/gitlab-lfs/objects/{oid}"
             logger.info(f"从 LFS 服务器下载: {lfs_url}")
 
-            # 下载 LFS 文件
-            response = self._request_with_retry("GET", lfs_url, stream=True)
+            # 下载 LFS 文件（大文件支持 Range 断点续传）
+            part_path = local_path.with_name(local_path.name + ".lfs.part")
+            response, offset = self._open_ranged_stream(lfs_url, part_path)
 
-            # 保存文件并验证
+            # 保存文件并验证（续传时先把已下载部分计入摘要）
             downloaded_size = 0
             sha256_hash = hashlib.sha256()
+            if offset:
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        sha256_hash.update(chunk)
+                downloaded_size = offset
 
-            with open(local_path, "wb") as f:
+            with open(part_path, "ab" if offset else "wb") as f:
                 for chunk in response.iter_content(chunk_size=self.config.chunk_size):
                     if chunk:
                         f.write(chunk)
@@ -645,6 +803,8 @@ class GitLabService:
 
             # 验证文件完整性
             if downloaded_size != expected_size:
+                if downloaded_size > expected_size:
+                    part_path.unlink(missing_ok=True)
                 return (
                     False,
                     f"文件大小不匹配: 期望 {expected_size}, 实际 {downloaded_size}",
@@ -652,8 +812,11 @@ class GitLabService:
 
             actual_oid = sha256_hash.hexdigest()
             if actual_oid != oid:
+                part_path.unlink(missing_ok=True)
                 return False, f"文件SHA256不匹配: 期望 {oid}, 实际 {actual_oid}"
 
+            os.replace(part_path, local_path)
+
             logger.info(f"LFS文件下载成功: {local_path} ({downloaded_size} bytes)")
             return True, None
 
@@ -752,72 +915,87 @@ class GitLabService:
             # 2. 并发下载
             logger.info("步骤 2/3: 开始并发下载...")
             os.makedirs(output_dir, exist_ok=True)
+            self._load_manifest(output_dir)
 
             successful_files = []
             failed_files = []
+            total_count = len(target_files)
 
             with ThreadPoolExecutor(max_workers=self.config.max_workers) as executor:
-                # 提交所有下载任务
-                future_to_file = {
-                    executor.submit(
+                # 有界提交：在途任务数不超过线程数的 2 倍，避免大仓库一次性堆积上万个 future
+                file_iter = iter(target_files)
+                max_in_flight = self.config.max_workers * 2
+                future_to_file = {}
+
+                def submit_next() -> bool:
+                    file_info = next(file_iter, None)
+                    if file_info is None:
+                        return False
+                    future = executor.submit(
                         self._download_single_file,
                         file_info,
                         output_dir,
                         branch,
                         download_config,
-                    ): file_info
-                    for file_info in target_files
-                }
+                    )
+                    future_to_file[future] = file_info
+                    return True
+
+                while len(future_to_file) < max_in_flight and submit_next():
+                    pass
 
                 # 处理完成的任务
                 completed_count = 0
-                for future in as_completed(future_to_file):
-                    file_info = future_to_file[future]
-                    file_path = file_info.get("path", "")
+                while future_to_file:
+                    done, _ = wait(future_to_file, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_info = future_to_file.pop(future)
+                        file_path = file_info.get("path", "")
+                        submit_next()
 
-                    try:
-                        success, local_path, error = future.result()
-                        completed_count += 1
-
-                        if success:
-                            successful_files.append(
-                                FileResult(
-                                    file_path=file_path,
-                                    local_path=local_path,
-                                    size=file_info.get("size", 0),
-                                    success=True,
+                        try:
+                            success, local_path, error = future.result()
+                            completed_count += 1
+
+                            if success:
+                                successful_files.append(
+                                    FileResult(
+                                        file_path=file_path,
+                                        local_path=local_path,
+                                        size=file_info.get("size", 0),
+                                        success=True,
+                                    )
                                 )
-                            )
-                        else:
-                            failed_files.append(
-                                FileResult(
-                                    file_path=file_path, error=error, success=False
+                            else:
+                                failed_files.append(
+                                    FileResult(
+                                        file_path=file_path, error=error, success=False
+                                    )
                                 )
-                            )
 
-                        # 调用进度回调
-                        if progress_callback:
-                            progress = (completed_count / len(target_files)) * 100
-                            progress_callback(
-                                completed_count, len(target_files), progress
-                            )
+                            # 调用进度回调
+                            if progress_callback:
+                                progress = (completed_count / total_count) * 100
+                                progress_callback(completed_count, total_count, progress)
 
-                        # 输出进度日志
-                        if completed_count % 10 == 0 or completed_count == len(
-                            target_files
-                        ):
-                            logger.info(
-                                f"下载进度: {completed_count}/{len(target_files)} "
-                                f"({(completed_count/len(target_files)*100):.1f}%)"
+                            # 输出进度日志
+                            if completed_count % 10 == 0 or completed_count == total_count:
+                                logger.info(
+                                    f"下载进度: {completed_count}/{total_count} "
+                                    f"({(completed_count/total_count*100):.1f}%)"
+                                )
+
+                        except Exception as e:
+                            logger.error(f"处理文件 {file_path} 时出错: {e}")
+                            failed_files.append(
+                                FileResult(file_path=file_path, error=str(e), success=False)
                             )
+                            self.stats.failed_files += 1
 
-                    except Exception as e:
-                        logger.error(f"处理文件 {file_path} 时出错: {e}")
-                        failed_files.append(
-                            FileResult(file_path=file_path, error=str(e), success=False)
-                        )
-                        self.stats.failed_files += 1
+                    # 定期落盘清单，进程中断后可从清单处继续
+                    self._save_manifest(output_dir)
 
+            self._save_manifest(output_dir, force=True)
             self.stats.end_time = time.time()
 
             logger.info(
@@ -838,6 +1016,7 @@ class GitLabService:
 
         except Exception as e:
             self.stats.end_time = time.time()
+            self._save_manifest(output_dir, force=True)
             logger.error(f"API 下载文件时出错: {e}")
             return DownloadResult(success=False, error=str(e), stats=self.stats)
 
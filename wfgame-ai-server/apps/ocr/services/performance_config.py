@@ -77,6 +77,19 @@ PARAM_VERSIONS = {
     }
 }
 
+# 文字预筛配置（CPU 廉价判定，无文字图片跳过两阶段检测）
+TEXT_PREFILTER_CONFIG = {
+    "enabled": False,  # 默认关闭，由任务配置 text_prefilter 或 config.ini 开启
+    "min_confidence": 0.9,  # 判定为“无文字”所需的最低置信度，越高越保守
+    "max_side": 256,  # 缩略图最长边（像素）
+    "min_contrast": 40,  # 形态学梯度最低对比度，低于此值视为平滑区域
+    "max_edge_density": 0.02,  # 边缘像素占比上限，超过即不再视为“空白”
+    "min_component_px": 4,  # 类文字连通域的最小高/宽（缩略图像素）
+    "max_component_ratio": 0.6,  # 类文字连通域高度占图片高度的最大比例
+    "stroke_fill_range": (0.08, 0.85),  # 类文字连通域内笔画像素填充率区间
+    "max_workers": 4,  # 预筛并行线程数（OpenCV 计算释放 GIL）
+}
+
 class PerformanceConfig:
     """性能配置管理类"""
     
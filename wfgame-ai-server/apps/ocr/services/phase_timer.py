@@ -0,0 +1,156 @@
+"""
+OCR任务阶段耗时统计
+记录每个阶段的墙钟时间、CPU时间、处理条数与峰值内存
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 峰值内存采样间隔（秒）
+RSS_SAMPLE_INTERVAL = 0.2
+
+
+def _current_rss_mb() -> Optional[float]:
+    """获取当前进程常驻内存（MB），无法获取时返回 None"""
+    try:
+        import psutil
+
+        return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    except Exception:
+        return None
+
+    try:
+        # 无 psutil 时回退到 /proc（仅 Linux）
+        with open("/proc/self/statm", "r") as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except Exception:
+        return None
+
+
+class _RssSampler:
+    """后台线程周期采样进程 RSS，记录阶段内峰值"""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_mb = _current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = _current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self.peak_mb is None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ocr-rss-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Optional[float]:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+        self._sample()
+        return self.peak_mb
+
+
+@dataclass
+class PhaseRecord:
+    """单个阶段的统计数据"""
+
+    name: str
+    wall_ms: float = 0.0
+    cpu_ms: float = 0.0
+    items: Optional[int] = None
+    peak_rss_mb: Optional[float] = None
+    error: Optional[str] = None
+
+
+class PhaseTimer:
+    """
+    阶段计时器
+
+    用法:
+        timer = PhaseTimer()
+        with timer.phase("hash", items=len(paths)) as span:
+            ...
+            span.items = hashed_count  # 可在阶段内修正处理条数
+        task.phase_timings = timer.to_dict()
+    """
+
+    def __init__(self, sample_memory: bool = True):
+        self.sample_memory = sample_memory
+        self.phases: List[PhaseRecord] = []
+        self._started_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, items: Optional[int] = None) -> Iterator[PhaseRecord]:
+        """
+        统计一个阶段，同名阶段多次进入时会累加
+
+        Args:
+            name: 阶段名称
+            items: 阶段处理条数
+        """
+        record = PhaseRecord(name=name, items=items)
+        sampler = _RssSampler() if self.sample_memory else None
+        if sampler:
+            sampler.start()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = str(e)[:200]
+            raise
+        finally:
+            record.wall_ms = round((time.perf_counter() - wall_start) * 1000, 2)
+            record.cpu_ms = round((time.process_time() - cpu_start) * 1000, 2)
+            if sampler:
+                peak = sampler.stop()
+                record.peak_rss_mb = round(peak, 1) if peak is not None else None
+            self._add(record)
+            logger.info(
+                f"阶段[{name}] 耗时 {record.wall_ms:.0f}ms, CPU {record.cpu_ms:.0f}ms, "
+                f"条数 {record.items}, 峰值内存 {record.peak_rss_mb}MB"
+            )
+
+    def _add(self, record: PhaseRecord):
+        with self._lock:
+            for existing in self.phases:
+                if existing.name != record.name:
+                    continue
+                existing.wall_ms = round(existing.wall_ms + record.wall_ms, 2)
+                existing.cpu_ms = round(existing.cpu_ms + record.cpu_ms, 2)
+                if record.items is not None:
+                    existing.items = (existing.items or 0) + record.items
+                if record.peak_rss_mb is not None:
+                    existing.peak_rss_mb = max(existing.peak_rss_mb or 0, record.peak_rss_mb)
+                existing.error = existing.error or record.error
+                return
+            self.phases.append(record)
+
+    def to_dict(self) -> Dict:
+        """导出为可写入 JSONField 的字典"""
+        with self._lock:
+            phases = [asdict(p) for p in self.phases]
+        return {
+            "total_wall_ms": round((time.perf_counter() - self._started_at) * 1000, 2),
+            "phases": phases,
+        }
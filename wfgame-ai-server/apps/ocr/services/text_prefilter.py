@@ -0,0 +1,146 @@
+"""
+文字预筛服务
+在两阶段OCR之前用 CPU 对缩略图做边缘/笔画密度判定，
+将高置信度“无文字”的图片（背景、图标、特效等）直接判为未命中，跳过完整检测
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .performance_config import TEXT_PREFILTER_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefilterVerdict:
+    """单张图片的预筛结论"""
+
+    image_path: str
+    text_free: bool
+    confidence: float  # “无文字”置信度，[0,1]
+    edge_density: Optional[float] = None
+    text_like_components: Optional[int] = None
+
+
+class TextPresencePrefilter:
+    """
+    基于形态学梯度的文字存在性预筛
+
+    判定流程（缩略图上完成，单张耗时为毫秒级）:
+        1. 灰度解码并缩放到 max_side 以内
+        2. 形态学梯度 + 阈值（Otsu 与 min_contrast 取大）得到笔画边缘
+        3. 边缘闭运算连接相邻字符，统计尺寸与填充率符合文字特征的连通域
+        4. 无类文字连通域且边缘稀疏时给出高“无文字”置信度
+    读取失败或图片过小时一律交给完整检测，保证不漏检
+    """
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        self.options = dict(TEXT_PREFILTER_CONFIG)
+        self.options.update(options or {})
+        try:
+            self.min_confidence = float(self.options["min_confidence"])
+        except (TypeError, ValueError) as err:
+            raise ValueError("预筛置信度必须为数字") from err
+        if self.min_confidence < 0 or self.min_confidence > 1:
+            raise ValueError("预筛置信度必须位于[0,1]")
+
+    def classify(self, image_path: str) -> PrefilterVerdict:
+        """判定单张图片是否无文字"""
+        import cv2
+        import numpy as np
+
+        try:
+            # np.fromfile + imdecode 兼容中文路径
+            data = np.fromfile(image_path, dtype=np.uint8)
+            gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+        except Exception as e:
+            logger.debug(f"预筛读取图片失败，交由完整检测: {image_path}, 错误: {e}")
+            gray = None
+        min_px = int(self.options["min_component_px"])
+        if gray is None or min(gray.shape[:2]) < min_px * 2:
+            return PrefilterVerdict(image_path, text_free=False, confidence=0.0)
+
+        height, width = gray.shape[:2]
+        max_side = int(self.options["max_side"])
+        scale = max_side / max(height, width)
+        if scale < 1:
+            gray = cv2.resize(
+                gray, (max(1, int(width * scale)), max(1, int(height * scale))),
+                interpolation=cv2.INTER_AREA,
+            )
+            height, width = gray.shape[:2]
+
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, kernel)
+        otsu_thresh, _ = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        _, edges = cv2.threshold(
+            grad, max(otsu_thresh, float(self.options["min_contrast"])), 255, cv2.THRESH_BINARY
+        )
+        edge_density = cv2.countNonZero(edges) / float(edges.size)
+        if edge_density == 0:
+            return PrefilterVerdict(image_path, True, 1.0, 0.0, 0)
+
+        # 水平方向闭运算，把同一行内的字符笔画连成文本块
+        joined = cv2.morphologyEx(
+            edges, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 3))
+        )
+        count, _, stats, _ = cv2.connectedComponentsWithStats(joined, connectivity=8)
+        fill_low, fill_high = self.options["stroke_fill_range"]
+        max_h = height * float(self.options["max_component_ratio"])
+        text_like = 0
+        for x, y, w, h, _ in stats[1:count]:
+            if h < min_px or w < min_px or h > max_h:
+                continue
+            fill = cv2.countNonZero(edges[y:y + h, x:x + w]) / float(w * h)
+            if fill_low <= fill <= fill_high:
+                text_like += 1
+
+        density_score = max(0.0, 1.0 - edge_density / float(self.options["max_edge_density"]))
+        if text_like == 0:
+            confidence = 0.5 + 0.5 * density_score
+        else:
+            confidence = 0.5 * density_score / text_like
+        confidence = round(confidence, 4)
+        return PrefilterVerdict(
+            image_path,
+            text_free=confidence >= self.min_confidence,
+            confidence=confidence,
+            edge_density=round(edge_density, 6),
+            text_like_components=text_like,
+        )
+
+    def split(self, image_paths: List[str]) -> Tuple[List[str], List[PrefilterVerdict]]:
+        """
+        对图片列表预筛
+
+        返回:
+            (需要完整检测的图片路径列表, 判定为无文字的结论列表)，保持输入顺序
+        """
+        if not image_paths:
+            return [], []
+        max_workers = max(1, int(self.options.get("max_workers", 1)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr-prefilter") as executor:
+            verdicts = list(executor.map(self.classify, image_paths))
+
+        candidates = [v.image_path for v in verdicts if not v.text_free]
+        skipped = [v for v in verdicts if v.text_free]
+        return candidates, skipped
+
+
+def build_text_prefilter(
+    options: Union[None, bool, Dict[str, Any]]
+) -> Optional[TextPresencePrefilter]:
+    """
+    根据配置构建预筛器，未启用时返回 None
+
+    Args:
+        options: True/False，或包含 enabled、min_confidence 等键的字典
+    """
+    if isinstance(options, bool):
+        options = {"enabled": options}
+    if not options or not options.get("enabled", False):
+        return None
+    return TextPresencePrefilter(options)
@@ -10,10 +10,12 @@ import shutil
 import tempfile
 import uuid
 from copy import deepcopy
-from typing import List, Dict, Any, Tuple, Optional, Callable
+from typing import List, Dict, Any, Tuple, Optional, Callable, Union
 
 from .performance_config import get_performance_config, PARAM_VERSIONS
 from .ocr_service import OCRInstancePool
+from .phase_timer import PhaseTimer
+from .text_prefilter import PrefilterVerdict, build_text_prefilter
 
 logger = logging.getLogger(__name__)
 
@@ -29,8 +31,13 @@ class TwoStageOCRService:
         performance_config_name: str = "balanced",
         enable_detailed_report: bool = False,
         rec_score_thresh: Optional[float] = None,
+        text_prefilter: Union[None, bool, Dict[str, Any]] = None,
     ):
-        """初始化两阶段OCR服务"""
+        """初始化两阶段OCR服务
+
+        参数:
+            text_prefilter: 文字预筛配置（True/False 或字典，见 TEXT_PREFILTER_CONFIG），未启用时不预筛
+        """
         self.perf_config = get_performance_config(performance_config_name)
         self.ocr_pool = OCRInstancePool()
         self.shared_pipeline = None
@@ -52,6 +59,7 @@ class TwoStageOCRService:
             for params in self.stage_params_map.values():
                 params["text_rec_score_thresh"] = score_value
         self.rec_score_thresh = rec_score_thresh
+        self.text_prefilter = build_text_prefilter(text_prefilter)
     
     def contains_chinese(self, text: str) -> bool:
         """检查文本是否包含中文字符"""
@@ -118,6 +126,19 @@ class TwoStageOCRService:
         }
         return record
     
+    def build_prefilter_record(self, verdict: PrefilterVerdict) -> Dict[str, Any]:
+        """构建预筛判定为无文字的空结果记录（与 build_record 结构一致）"""
+        return {
+            "input_path": verdict.image_path,
+            "stage": "prefilter",
+            "rec_texts": [],
+            "rec_scores": [],
+            "text_rec_score_thresh": None,
+            "max_rec_score": None,
+            "has_match": False,
+            "prefilter_confidence": verdict.confidence,
+        }
+    
     def create_shared_pipeline(self, lang: str = "ch"):
         """创建共享Pipeline实例"""
         if self.shared_pipeline is None:
@@ -292,31 +313,55 @@ class TwoStageOCRService:
     
     def process_two_stage_detection(self, input_images: List[str], 
                                    lang: str = "ch",
-                                   progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
+                                   progress_callback: Optional[Callable] = None,
+                                   phase_timer: Optional[PhaseTimer] = None) -> Dict[str, Any]:
         """执行两阶段OCR检测
         
         参数:
             input_images: 输入图片路径列表
             lang: 语言代码
             progress_callback: 进度回调函数
+            phase_timer: 阶段计时器（可选），记录 prefilter/stage1/stage2 耗时
         """
+        if phase_timer is None:
+            phase_timer = PhaseTimer(sample_memory=False)
+
+        # 阶段0: 文字预筛，无文字图片直接得到空结果，不进入完整检测
+        prefilter_records = []
+        stage1_images = input_images
+        if self.text_prefilter is not None and input_images:
+            with phase_timer.phase("prefilter", items=len(input_images)):
+                stage1_images, skipped_verdicts = self.text_prefilter.split(input_images)
+            prefilter_records = [self.build_prefilter_record(v) for v in skipped_verdicts]
+            logger.info(
+                f"文字预筛: 输入 {len(input_images)} 张, 判定无文字跳过 {len(prefilter_records)} 张, "
+                f"进入检测 {len(stage1_images)} 张"
+            )
+
         # 阶段1: baseline检测
-        stage1_hits, stage1_miss_records, stage1_error_paths = self.run_single_stage(
-            "baseline", input_images, lang,
-            progress_callback=progress_callback,
-            stage_name="阶段1(快速检测)"
-        )
+        if stage1_images:
+            with phase_timer.phase("stage1", items=len(stage1_images)):
+                stage1_hits, stage1_miss_records, stage1_error_paths = self.run_single_stage(
+                    "baseline", stage1_images, lang,
+                    progress_callback=progress_callback,
+                    stage_name="阶段1(快速检测)"
+                )
+        else:
+            stage1_hits = []
+            stage1_miss_records = []
+            stage1_error_paths = []
         
         # 提取阶段1未命中的图片路径用于阶段2
         stage1_miss_paths = [r["input_path"] for r in stage1_miss_records]
         
         # 阶段2: balanced_v1检测未命中的图片
         if stage1_miss_paths:
-            stage2_hits, stage2_miss_records, stage2_error_paths = self.run_single_stage(
-                "balanced_v1", stage1_miss_paths, lang,
-                progress_callback=progress_callback,
-                stage_name="阶段2(详细检测)"
-            )
+            with phase_timer.phase("stage2", items=len(stage1_miss_paths)):
+                stage2_hits, stage2_miss_records, stage2_error_paths = self.run_single_stage(
+                    "balanced_v1", stage1_miss_paths, lang,
+                    progress_callback=progress_callback,
+                    stage_name="阶段2(详细检测)"
+                )
         else:
             stage2_hits = []
             stage2_miss_records = []
@@ -324,8 +369,11 @@ class TwoStageOCRService:
         
         # 合并最终结果
         all_hits = stage1_hits + stage2_hits
-        all_miss_records = stage1_miss_records + stage2_miss_records
-        final_miss_paths = [r["input_path"] for r in stage2_miss_records]
+        all_miss_records = prefilter_records + stage1_miss_records + stage2_miss_records
+        final_miss_paths = [r["input_path"] for r in prefilter_records + stage2_miss_records]
+        prefilter_skipped = len(prefilter_records)
+        # 两个阶段中识别出错的图片，汇总到统计中便于排查
+        error_paths = stage1_error_paths + stage2_error_paths
         
         # 清理临时文件
         self.cleanup_temp_files()
@@ -340,6 +388,11 @@ class TwoStageOCRService:
             
             return {
                 "detection_strategy": "两阶段检测 (baseline + balanced_v1)",
+                "prefilter": {
+                    "enabled": self.text_prefilter is not None,
+                    "skipped_count": prefilter_skipped,
+                    "skipped_records": prefilter_records,
+                },
                 "stage1_baseline": {
                     "hits_count": len(stage1_hits),
                     "hits_records": stage1_hits,
@@ -355,6 +408,9 @@ class TwoStageOCRService:
                     "total_hits": total_hits,
                     "final_miss": final_miss,
                     "final_miss_paths": final_miss_paths,
+                    "prefilter_skipped": prefilter_skipped,
+                    "error_count": len(error_paths),
+                    "error_paths": error_paths,
                     "overall_hit_rate": overall_hit_rate,
                     "stage1_contribution": (len(stage1_hits) / total_hits * 100) if total_hits > 0 else 0,
                     "stage2_contribution": (len(stage2_hits) / total_hits * 100) if total_hits > 0 else 0,
@@ -372,5 +428,8 @@ class TwoStageOCRService:
                     "total_hits": len(all_hits),
                     "final_miss": len(final_miss_paths),
                     "final_miss_paths": final_miss_paths,
+                    "prefilter_skipped": prefilter_skipped,
+                    "error_count": len(error_paths),
+                    "error_paths": error_paths,
                 }
             }
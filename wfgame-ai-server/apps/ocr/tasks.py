@@ -19,7 +19,7 @@ from PIL import Image
 from django.template.loader import render_to_string
 from django.db.models import Q
 
-from .models import OCRTask, OCRResult, OCRCache, OCRCacheHit
+from .models import OCRTask, OCRResult, OCRCache, OCRCacheHit, OCRTaskCheckpoint
 from apps.ocr.services.ocr_service import OCRService
 from apps.ocr.services.two_stage_ocr import TwoStageOCRService
 from .services.gitlab import (
@@ -28,6 +28,7 @@ from .services.gitlab import (
     GitLabConfig,
 )
 from .services.path_utils import PathUtils
+from .services.phase_timer import PhaseTimer
 from apps.notifications.tasks import notify_ocr_task_progress
 from .services.compare_service import TransRepoConfig
 from .serializers import OCRTaskSerializer, OCRResultSerializer
@@ -165,6 +166,7 @@ def process_ocr_task(task_id):
         - 命中规则统一在 `_is_language_hit` / `_filter_texts_by_languages` 中处理。
     """
     logger.info(f"开始处理OCR任务: {task_id}")
+    phase_timer = PhaseTimer()
 
     try:
         # step1. 获取任务信息
@@ -277,10 +279,11 @@ def process_ocr_task(task_id):
                     "id": task_id,
                     "remark": "正在同步 Git 仓库...",
                 })
-                result: DownloadResult = git_service.download_files_with_git_clone(
-                    repo_base_dir=check_dir,
-                    branch=task_config.get("branch", "develop"),
-                )
+                with phase_timer.phase("git_sync"):
+                    result: DownloadResult = git_service.download_files_with_git_clone(
+                        repo_base_dir=check_dir,
+                        branch=task_config.get("branch", "develop"),
+                    )
                 if not result.success:
                     logger.error(f"Git仓库下载失败: {result.message}")
                     notify_ocr_task_progress({
@@ -321,21 +324,29 @@ def process_ocr_task(task_id):
         #     match_languages=target_languages  # 将命中判定语言动态传入，避免硬编码
         # )
 
+        # 检查点：上次执行中已提交的图片（先于缓存预过滤读取，避免本任务已提交的结果被当作缓存命中）
+        media_root = settings.MEDIA_ROOT
+        processed_paths = OCRTaskCheckpoint.processed_paths(task_id)
+        resumed_count = 0
+
         # ================== OCR识别前先利用 Cache 过滤，避免重复识别  =========================
         enable_cache = task_config.get('enable_cache', True)
         img_exts_init = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
         total_images = 0
         hit_hashes = set()
         image_paths = []
+        prefiltered = False
         msg = ""
         
         if not enable_cache:
-            for root_dir, _, files in os.walk(check_dir):
-                for file_name in files:
-                    file_ext = os.path.splitext(file_name)[1].lower()
-                    if file_ext not in img_exts_init:
-                        continue
-                    total_images += 1
+            with phase_timer.phase("walk") as span:
+                for root_dir, _, files in os.walk(check_dir):
+                    for file_name in files:
+                        file_ext = os.path.splitext(file_name)[1].lower()
+                        if file_ext not in img_exts_init:
+                            continue
+                        total_images += 1
+                span.items = total_images
             msg = f"未启用缓存, 待处理图片: {total_images}"
             logger.warning(msg)
         else:
@@ -347,22 +358,37 @@ def process_ocr_task(task_id):
                 "remark": "正在使用OCR缓存进行预过滤...",
                 })
 
-                for root_dir, _, files in os.walk(check_dir):
-                    for file_name in files:
-                        file_ext = os.path.splitext(file_name)[1].lower()
-                        if file_ext not in img_exts_init:
-                            continue
-                        img_abspath = os.path.join(root_dir, file_name)
+                with phase_timer.phase("walk") as span:
+                    walked_paths = []
+                    for root_dir, _, files in os.walk(check_dir):
+                        for file_name in files:
+                            file_ext = os.path.splitext(file_name)[1].lower()
+                            if file_ext not in img_exts_init:
+                                continue
+                            walked_paths.append(os.path.join(root_dir, file_name))
+                    span.items = len(walked_paths)
+                total_images = len(walked_paths)
+                if processed_paths:
+                    walked_paths = [
+                        img_path for img_path in walked_paths
+                        if _to_media_rel_path(img_path, media_root) not in processed_paths
+                    ]
+                    resumed_count = total_images - len(walked_paths)
+
+                with phase_timer.phase("hash", items=len(walked_paths)):
+                    for img_abspath in walked_paths:
                         img_hash = OCRService.calculate_image_hash(img_abspath)
                         abspath_to_hash[img_abspath] = img_hash
-                        total_images += 1
 
                 # 尝试命中缓存
                 all_hashes_list = list(abspath_to_hash.values())
-                hit_hashes = OCRCacheHit.try_hit(all_hashes_list, task_id=task_id)
+                with phase_timer.phase("cache_check", items=len(all_hashes_list)):
+                    hit_hashes = OCRCacheHit.try_hit(all_hashes_list, task_id=task_id)
                 image_paths = [img_path for img_path, h in abspath_to_hash.items() if h not in hit_hashes]
+                prefiltered = True
 
-                if len(image_paths) == 0:
+                # 从检查点续跑的任务走正常收尾流程（汇总、报告、清理检查点）
+                if len(image_paths) == 0 and not processed_paths:
                     logger.warning("⚡所有图片均命中OCR缓存, 无需重复识别")
                     task.calculate_match_rate_by_related_results()
                     notify_ocr_task_progress({
@@ -381,6 +407,7 @@ def process_ocr_task(task_id):
             except Exception as _init_prog_err:
                 logger.warning(f"使用OCR缓存进行预过滤出错: {_init_prog_err}")
                 image_paths = []
+                resumed_count = 0
         notify_ocr_task_progress({
             "id": task_id,
             "total_images": total_images,
@@ -409,15 +436,25 @@ def process_ocr_task(task_id):
 
         start_time = time.time()
         
+        # 文字预筛：任务配置 text_prefilter 优先，未配置时使用 config.ini 默认值
+        text_prefilter_options = task_config.get('text_prefilter')
+        if text_prefilter_options is None:
+            text_prefilter_options = {
+                "enabled": config.getboolean('ocr', 'ocr_text_prefilter_enabled', fallback=False),
+                "min_confidence": config.getfloat('ocr', 'ocr_text_prefilter_min_confidence', fallback=0.9),
+            }
+        logger.info(f"文字预筛配置: {text_prefilter_options}")
+
         # 初始化两阶段OCR服务（默认不启用详细报告）
         two_stage_service = TwoStageOCRService(
             performance_config_name,
             enable_detailed_report=False,
-            rec_score_thresh=rec_score_thresh
+            rec_score_thresh=rec_score_thresh,
+            text_prefilter=text_prefilter_options,
         )
         
         # 准备输入图片列表
-        if image_paths:
+        if prefiltered:
             # 使用缓存过滤后的图片列表，同时过滤图片格式
             img_exts = {'.jpg', '.jpeg', '.png'}
             input_images = [
@@ -439,220 +476,146 @@ def process_ocr_task(task_id):
         # 执行两阶段OCR检测
         ocr_lang = target_languages[0] if target_languages else "ch"
         logger.warning(f"🔍 执行OCR检测，使用语言: {ocr_lang}, 原始语言列表: {target_languages}")
-        
+
+        # ================== 检查点：跳过上次执行中已提交的图片 =========================
+        checkpoint_chunk_size = max(1, config.getint('ocr', 'ocr_checkpoint_chunk_size', fallback=500))
+        if processed_paths:
+            before_count = len(input_images)
+            input_images = [
+                img_path for img_path in input_images
+                if _to_media_rel_path(img_path, media_root) not in processed_paths
+            ]
+            resumed_count += before_count - len(input_images)
+            logger.warning(f"⏩ 从检查点恢复: 已完成 {resumed_count} 张, 剩余 {len(input_images)} 张")
+        # ==========================================================================
+
         # 通知开始OCR检测
         notify_ocr_task_progress({
             "id": task_id,
             "remark": f"开始OCR检测，共{len(input_images)}张图片，使用{ocr_lang}模型...",
         })
-        
-        # 定义进度回调函数
+
+        # 关键字过滤（如果启用）
+        keyword_filter_config = task_config.get('keyword_filter', {})
+        logger.info(f"关键字过滤配置: enabled={keyword_filter_config.get('enabled', False)}")
+        keyword_filter = None
+        if keyword_filter_config.get('enabled'):
+            from apps.ocr.services.keyword_filter import KeywordFilter
+            keyword_filter = KeywordFilter(keyword_filter_config)
+        else:
+            logger.info("关键字过滤未启用 (enabled=False)")
+
+        # 定义进度回调函数（进度包含检查点之前已完成的图片与之前批次）
+        chunk_start = 0
+        progress_total = resumed_count + len(input_images)
+
         def ocr_progress_callback(processed, total, stage):
             """OCR检测进度回调"""
-            progress_percent = int((processed / total * 100)) if total > 0 else 0
+            done = resumed_count + chunk_start + processed
+            progress_percent = int((done / progress_total * 100)) if progress_total > 0 else 0
             notify_ocr_task_progress({
                 "id": task_id,
-                "processed_images": processed,
-                "remark": f"{stage}: {processed}/{total} ({progress_percent}%)",
+                "processed_images": done,
+                "remark": f"{stage}: {done}/{progress_total} ({progress_percent}%)",
             })
-        
-        detection_result = two_stage_service.process_two_stage_detection(
-            input_images, 
-            lang=ocr_lang,
-            progress_callback=ocr_progress_callback
-        )
-        
-        end_time = time.time()
-        elapsed_time = end_time - start_time
 
-        # 检查检测结果
-        if not detection_result or not isinstance(detection_result, dict):
-            error_msg = "两阶段OCR检测失败"
-            logger.error(error_msg)
+        # 分批执行：每批识别完成后，结果与检查点在同一事务内提交，
+        # 批次内记录写库/写报告后即释放，峰值内存只与批大小相关
+        total_hits = 0
+        final_miss = 0
+        prefilter_skipped = 0
+        chunk_index = OCRTaskCheckpoint.next_chunk_index(task_id)
+        skip_hashes = hit_hashes if enable_cache else set()
+        abspath_to_hash = None  # 哈希映射只用于缓存预过滤，释放以降低常驻内存
+        report_files = _init_two_stage_reports(task.id, append=bool(processed_paths))
+
+        for chunk_start in range(0, len(input_images), checkpoint_chunk_size):
+            chunk_images = input_images[chunk_start:chunk_start + checkpoint_chunk_size]
+
+            detection_result = two_stage_service.process_two_stage_detection(
+                chunk_images,
+                lang=ocr_lang,
+                progress_callback=ocr_progress_callback,
+                phase_timer=phase_timer,
+            )
+
+            # 检查检测结果
+            if not detection_result or not isinstance(detection_result, dict):
+                error_msg = "两阶段OCR检测失败"
+                logger.error(error_msg)
+                notify_ocr_task_progress({
+                    "id": task_id,
+                    "status": 'failed',
+                    "end_time": timezone.now(),
+                    "remark": error_msg,
+                })
+                return {"status": "error", "message": error_msg}
+
+            final_stats = detection_result.get('final_statistics', {})
+            total_hits += final_stats.get('total_hits', 0)
+            final_miss += final_stats.get('final_miss', 0)
+            prefilter_skipped += final_stats.get('prefilter_skipped', 0)
+            chunk_hits = detection_result.get('all_hits_records', [])
+            chunk_miss_paths = final_stats.get('final_miss_paths', [])
+
+            # 两阶段检测结果以 JSON Lines 追加写入（用于调试）
+            with phase_timer.phase("json_report", items=len(chunk_hits)):
+                _append_two_stage_reports(
+                    report_files, chunk_hits, detection_result.get('all_miss_records', [])
+                )
+
+            # 生成兼容结果：将两阶段检测结果转换为数据库格式
+            with phase_timer.phase("resolution_probe", items=len(chunk_hits) + len(chunk_miss_paths)):
+                chunk_results = _build_ocr_results(chunk_hits, chunk_miss_paths, media_root)
+            del detection_result, chunk_hits, chunk_miss_paths
+
+            if keyword_filter is not None:
+                original_count = len(chunk_results)
+                with phase_timer.phase("keyword_filter", items=original_count):
+                    chunk_results = keyword_filter.filter_results(chunk_results)
+                logger.info(f"关键字过滤: 原始结果={original_count}, 过滤后={len(chunk_results)}")
+
+            # 批量记录 OCRResult，并提交本批检查点
+            with phase_timer.phase("db_insert", items=len(chunk_results)) as span:
+                new_results = _commit_ocr_chunk(
+                    task, chunk_index, chunk_images, chunk_results, media_root, skip_hashes
+                )
+                span.items = len(new_results)
+            logger.warning(
+                f"检查点 #{chunk_index} 已提交: 图片 {len(chunk_images)} 张, 写入结果 {len(new_results)} 条"
+            )
+
+            # 按批记录ocr缓存
+            with phase_timer.phase("record_cache", items=len(new_results)):
+                OCRCache.record_cache(task_id, image_hashes=[r.image_hash for r in new_results])
+
+            del chunk_results, new_results
+            chunk_index += 1
             notify_ocr_task_progress({
                 "id": task_id,
-                "status": 'failed',
-                "end_time": timezone.now(),
-                "remark": error_msg,
+                "processed_images": resumed_count + chunk_start + len(chunk_images),
+                "remark": f"已保存检查点 {resumed_count + chunk_start + len(chunk_images)}/{progress_total}",
             })
-            return {"status": "error", "message": error_msg}
 
-        # 获取检测结果统计
-        final_stats = detection_result.get('final_statistics', {})
-        total_hits = final_stats.get('total_hits', 0)
-        final_miss = final_stats.get('final_miss', 0)
-        overall_hit_rate = final_stats.get('overall_hit_rate', 0)
-        
+        end_time = time.time()
+        elapsed_time = end_time - start_time
         logger.warning(
-            f"两阶段OCR检测完成，总命中={total_hits} 最终未命中={final_miss} 命中率={overall_hit_rate:.1f}%，"
-            f"耗时 {elapsed_time:.2f} 秒"
+            f"两阶段OCR检测完成，总命中={total_hits} 最终未命中={final_miss}"
+            f"（其中预筛跳过={prefilter_skipped}），耗时 {elapsed_time:.2f} 秒"
         )
+        logger.warning(f"两阶段检测结果已写入: {report_files['hits']}")
         notify_ocr_task_progress({
             "id": task_id,
-            "remark": f"两阶段OCR检测完成，耗时 {elapsed_time:.2f} 秒, 结果统计中...",
+            "remark": f"两阶段OCR检测完成，预筛跳过{prefilter_skipped}张，耗时 {elapsed_time:.2f} 秒, 结果统计中...",
         })
 
-        # 构建与旧流程兼容的结果列表（用于写库与汇总）
-        # 从两阶段检测结果中获取所有命中记录和未命中路径
-        all_hits_records = detection_result.get('all_hits_records', [])
-        final_miss_paths = detection_result.get('final_statistics', {}).get('final_miss_paths', [])
-        media_root = settings.MEDIA_ROOT
-
-        # 生成兼容结果：将两阶段检测结果转换为数据库格式
-        notify_ocr_task_progress({
-            "id": task_id,
-            "remark": f"正在处理OCR结果，命中={total_hits}张，未命中={final_miss}张...",
-        })
-        
-        ocr_results = []
-        
-        # 1. 处理命中的记录
-        for hit_record in all_hits_records:
-            input_path = hit_record.get('input_path', '')
-            texts = hit_record.get('rec_texts', [])
-            confidences = hit_record.get('rec_scores', [])
-            stage = hit_record.get('stage', 'unknown')
-            
-            # 计算相对路径（确保使用绝对路径）
-            abs_input_path = os.path.abspath(input_path)
-            abs_media_root = os.path.abspath(media_root)
-            
-            # 调试：记录第一张图片的路径信息
-            if len(ocr_results) == 0:
-                logger.info(f"=== 路径调试信息 ===")
-                logger.info(f"原始路径: {input_path}")
-                logger.info(f"绝对路径: {abs_input_path}")
-                logger.info(f"Media根目录: {abs_media_root}")
-                logger.info(f"是否以Media开头: {abs_input_path.startswith(abs_media_root)}")
-            
-            # 检查路径是否在media目录下
-            if abs_input_path.startswith(abs_media_root):
-                rel_path = os.path.relpath(abs_input_path, abs_media_root).replace('\\', '/')
-            else:
-                logger.warning(f"图片路径不在media目录下: {abs_input_path}")
-                logger.warning(f"media_root: {abs_media_root}")
-                rel_path = os.path.relpath(abs_input_path, abs_media_root).replace('\\', '/')
-            
-            # 读取图片分辨率
-            pic_resolution = ''
-            try:
-                import numpy as _np
-                import cv2 as _cv2
-                data = _np.fromfile(input_path, dtype=_np.uint8)
-                img_nd = _cv2.imdecode(data, _cv2.IMREAD_COLOR)
-                if img_nd is not None:
-                    h, w = img_nd.shape[:2]
-                    pic_resolution = f"{int(w)}x{int(h)}"
-            except Exception:
-                pic_resolution = ''
-            
-            # 创建 OCR 结果记录
-            ocr_results.append({
-                'image_path': rel_path,
-                'texts': texts,
-                'confidences': confidences,
-                'has_match': hit_record.get('has_match', True),  # 从检测结果获取命中状态
-                'pic_resolution': pic_resolution,
-                'stage': stage,  # 记录检测阶段
-                'max_confidence': hit_record.get('max_rec_score', 0.0),
-            })
-        
-        # 2. 处理未命中的记录（没有识别到文本的图片）
-        for miss_path in final_miss_paths:
-            # 计算相对路径
-            abs_miss_path = os.path.abspath(miss_path)
-            abs_media_root = os.path.abspath(media_root)
-            
-            if abs_miss_path.startswith(abs_media_root):
-                rel_path = os.path.relpath(abs_miss_path, abs_media_root).replace('\\', '/')
-            else:
-                logger.warning(f"未命中图片路径不在media目录下: {abs_miss_path}")
-                rel_path = os.path.relpath(abs_miss_path, abs_media_root).replace('\\', '/')
-            
-            # 读取图片分辨率
-            pic_resolution = ''
-            try:
-                import numpy as _np
-                import cv2 as _cv2
-                data = _np.fromfile(miss_path, dtype=_np.uint8)
-                img_nd = _cv2.imdecode(data, _cv2.IMREAD_COLOR)
-                if img_nd is not None:
-                    h, w = img_nd.shape[:2]
-                    pic_resolution = f"{int(w)}x{int(h)}"
-            except Exception:
-                pic_resolution = ''
-            
-            # 创建未命中的OCR结果记录
-            ocr_results.append({
-                'image_path': rel_path,
-                'texts': [],  # 未命中，没有文本
-                'confidences': [],  # 未命中，没有置信度
-                'has_match': False,  # 未命中
-                'pic_resolution': pic_resolution,
-                'stage': 'miss',  # 标记为未命中
-                'max_confidence': 0.0,
-            })
-
-        # 关键字过滤（如果启用）
-        keyword_filter_config = task_config.get('keyword_filter', {})
-        logger.info(f"关键字过滤配置: enabled={keyword_filter_config.get('enabled', False)}")
-        
-        if keyword_filter_config.get('enabled'):
-            notify_ocr_task_progress({
-                "id": task_id,
-                "remark": f"开始关键字过滤，共{len(ocr_results)}条结果...",
-            })
-            from apps.ocr.services.keyword_filter import KeywordFilter
-            keyword_filter = KeywordFilter(keyword_filter_config)
-            original_count = len(ocr_results)
-            ocr_results = keyword_filter.filter_results(ocr_results)
-            logger.info(f"关键字过滤: 原始结果={original_count}, 过滤后={len(ocr_results)}")
-            
-            notify_ocr_task_progress({
-                "id": task_id,
-                "remark": f"关键字过滤完成: 原始={original_count}, 匹配={len(ocr_results)}",
-            })
-        else:
-            logger.info("关键字过滤未启用 (enabled=False)")
-            notify_ocr_task_progress({
-                "id": task_id,
-                "remark": f"跳过关键字过滤，共{len(ocr_results)}条结果",
-            })
-        
-        # 保存两阶段检测结果到文件（用于调试）
-        try:
-            import json as _json
-            report_dir = os.path.join(settings.MEDIA_ROOT, 'ocr', 'reports')
-            os.makedirs(report_dir, exist_ok=True)
-            
-            # 分离命中和未命中的记录
-            hits_only_result = {
-                "all_hits_records": detection_result.get('all_hits_records', []),
-                "final_statistics": detection_result.get('final_statistics', {}),
-            }
-            
-            # 保存命中结果
-            result_file = os.path.join(report_dir, f"{task.id}_two_stage_result.json")
-            with open(result_file, 'w', encoding='utf-8') as fp:
-                _json.dump(hits_only_result, fp, ensure_ascii=False, indent=2)
-            logger.warning(f"两阶段检测结果已写入: {result_file}")
-            
-            # 保存未命中结果（如果有）
-            miss_records = detection_result.get('all_miss_records', [])
-            if miss_records:
-                miss_file = os.path.join(report_dir, f"{task.id}_miss_details.json")
-                miss_result = {
-                    "total_miss": len(miss_records),
-                    "miss_records": miss_records,
-                }
-                with open(miss_file, 'w', encoding='utf-8') as fp:
-                    _json.dump(miss_result, fp, ensure_ascii=False, indent=2)
-                logger.warning(f"未命中详情已写入: {miss_file}")
-        except Exception as _result_err:
-            logger.warning(f"写入两阶段检测结果失败(忽略): {_result_err}")
+        # 统计与汇总均以数据库为准（包含断点前已提交的批次），按需流式读取
+        task_results = OCRResult.objects.all_teams().filter(task_id=task_id)
+        total_processed = task_results.count()
 
-        if not ocr_results:
+        if not total_processed:
             logger.warning("未检测到任何图片，任务结束")
+            OCRTaskCheckpoint.clear(task_id)
             notify_ocr_task_progress({
                 "id": task_id,
                 "status": 'completed',
@@ -665,57 +628,11 @@ def process_ocr_task(task_id):
             })
             return {"status": "success", "task_id": task_id}
 
-        # 批量记录 OCRResult & 统计最终命中数
-        notify_ocr_task_progress({
-            "id": task_id,
-            "remark": f"正在保存OCR结果到数据库，共{len(ocr_results)}条...",
-        })
-        
-        new_results = []
-        total_matches = 0
-        for item in ocr_results:
-            img_full_path = os.path.join(media_root, item['image_path'])
-            img_hash = OCRService.calculate_image_hash(img_full_path)
-            if enable_cache and img_hash in hit_hashes:
-                # 如果本次任务启用缓存并且此缓存已存在，则跳过写库
-                continue
-            obj = OCRResult(
-                task=task,
-                image_hash=img_hash,
-                image_path=item.get('image_path', '').replace('\\', '/'),
-                texts=item.get('texts', []),
-                languages=item.get('languages', {}),
-                has_match=item.get('has_match', False),
-                confidences=item.get('confidences', []),
-                max_confidence=item.get('max_confidence', 0.0),
-                processing_time=item.get('processing_time', 0),
-                pic_resolution=item.get('pic_resolution', ''),
-                team_id=task.team_id
-            )
-            new_results.append(obj)
-            texts_present = bool(item.get('texts'))
-            if texts_present and item.get('has_match', False):
-                total_matches += 1
-
-        OCRResult.objects.bulk_create(new_results)
-        logger.warning(f"批量插入 {len(new_results)} 条OCR结果到数据库")
-        
         notify_ocr_task_progress({
             "id": task_id,
             "verified_images": task.total_verified,
-            "remark": f"已保存{len(new_results)}条结果到数据库",
+            "remark": f"已保存{total_processed}条结果到数据库",
         })
-        
-        # 强制提交数据库事务
-        from django.db import transaction
-        transaction.commit()
-        
-        # 短暂延迟确保数据库操作完全完成
-        time.sleep(0.2)
-        
-        # 记录ocr缓存
-        OCRCache.record_cache(task_id)
-
 
         # 生成汇总报告
         notify_ocr_task_progress({
@@ -724,7 +641,12 @@ def process_ocr_task(task_id):
         })
         
         logger.warning("开始生成汇总报告")
-        _generate_summary_report(task, ocr_results, target_languages)
+        with phase_timer.phase("summary_report", items=total_processed):
+            _generate_summary_report(
+                task,
+                task_results.values('image_path', 'texts', 'confidences', 'has_match').iterator(chunk_size=2000),
+                target_languages,
+            )
         logger.warning("汇总报告生成完成")
         
         notify_ocr_task_progress({
@@ -737,8 +659,7 @@ def process_ocr_task(task_id):
             logger.warning(f"开始更新任务 {task_id} 的统计数据...")
             
             # 直接计算统计数据，不依赖复杂的查询
-            total_processed = len(ocr_results)
-            total_matched = sum(1 for item in ocr_results if item.get('has_match', False))
+            total_matched = task_results.filter(has_match=True).count()
             match_rate = round((total_matched / total_processed * 100), 2) if total_processed > 0 else 0.0
             
             # 直接更新任务统计字段
@@ -748,6 +669,7 @@ def process_ocr_task(task_id):
             task.save(update_fields=["processed_images", "matched_images", "match_rate"])
             
             logger.warning(f"任务 {task_id} 统计数据更新完成: 总数={total_processed}, 匹配数={total_matched}, 匹配率={match_rate}%")
+            OCRTaskCheckpoint.clear(task_id)
             
             notify_ocr_task_progress({
                 "id": task_id,
@@ -783,13 +705,184 @@ def process_ocr_task(task_id):
 
         return {"status": "error", "message": str(e)}
 
+    finally:
+        _save_phase_timings(task_id, phase_timer)
+
+
+def _to_media_rel_path(path, media_root):
+    """将图片路径转换为相对 MEDIA_ROOT 的路径（与 OCRResult.image_path 一致）"""
+    abs_path = os.path.abspath(path)
+    return os.path.relpath(abs_path, os.path.abspath(media_root)).replace('\\', '/')
+
+
+def _probe_resolution(image_path):
+    """读取图片分辨率，失败返回空字符串"""
+    try:
+        import numpy as _np
+        import cv2 as _cv2
+        data = _np.fromfile(image_path, dtype=_np.uint8)
+        img_nd = _cv2.imdecode(data, _cv2.IMREAD_COLOR)
+        if img_nd is not None:
+            h, w = img_nd.shape[:2]
+            return f"{int(w)}x{int(h)}"
+    except Exception:
+        pass
+    return ''
+
+
+def _build_ocr_results(hits_records, miss_paths, media_root):
+    """将两阶段检测结果转换为写库/汇总使用的结果字典列表。
+
+    Args:
+        hits_records (list[dict]): 命中记录（`TwoStageOCRService.build_record` 结构）。
+        miss_paths (list[str]): 最终未命中的图片路径。
+        media_root (str): MEDIA_ROOT 目录，用于计算相对路径。
+
+    Returns:
+        list[dict]: 包含 `image_path`、`texts`、`has_match`、`pic_resolution` 等字段。
+    """
+    abs_media_root = os.path.abspath(media_root)
+    ocr_results = []
+
+    # 1. 处理命中的记录
+    for hit_record in hits_records:
+        input_path = hit_record.get('input_path', '')
+        abs_input_path = os.path.abspath(input_path)
+        if not abs_input_path.startswith(abs_media_root):
+            logger.warning(f"图片路径不在media目录下: {abs_input_path}")
+
+        ocr_results.append({
+            'image_path': _to_media_rel_path(input_path, media_root),
+            'texts': hit_record.get('rec_texts', []),
+            'confidences': hit_record.get('rec_scores', []),
+            'has_match': hit_record.get('has_match', True),  # 从检测结果获取命中状态
+            'pic_resolution': _probe_resolution(input_path),
+            'stage': hit_record.get('stage', 'unknown'),  # 记录检测阶段
+            'max_confidence': hit_record.get('max_rec_score', 0.0),
+        })
+
+    # 2. 处理未命中的记录（没有识别到文本的图片）
+    for miss_path in miss_paths:
+        abs_miss_path = os.path.abspath(miss_path)
+        if not abs_miss_path.startswith(abs_media_root):
+            logger.warning(f"未命中图片路径不在media目录下: {abs_miss_path}")
+
+        ocr_results.append({
+            'image_path': _to_media_rel_path(miss_path, media_root),
+            'texts': [],  # 未命中，没有文本
+            'confidences': [],  # 未命中，没有置信度
+            'has_match': False,  # 未命中
+            'pic_resolution': _probe_resolution(miss_path),
+            'stage': 'miss',  # 标记为未命中
+            'max_confidence': 0.0,
+        })
+
+    return ocr_results
+
+
+def _init_two_stage_reports(task_id, append=False):
+    """初始化两阶段检测 JSON Lines 报告文件。
+
+    Args:
+        task_id (str): 任务ID。
+        append (bool): 是否保留已有内容（从检查点续跑时为 True）。
+
+    Returns:
+        dict: {'hits': 命中记录文件路径, 'miss': 未命中记录文件路径}
+    """
+    report_dir = os.path.join(settings.MEDIA_ROOT, 'ocr', 'reports')
+    os.makedirs(report_dir, exist_ok=True)
+    report_files = {
+        'hits': os.path.join(report_dir, f"{task_id}_two_stage_result.jsonl"),
+        'miss': os.path.join(report_dir, f"{task_id}_miss_details.jsonl"),
+    }
+    if not append:
+        for file_path in report_files.values():
+            try:
+                open(file_path, 'w', encoding='utf-8').close()
+            except Exception as _init_err:
+                logger.warning(f"初始化两阶段检测结果文件失败(忽略): {_init_err}")
+    return report_files
+
+
+def _append_two_stage_reports(report_files, hits_records, miss_records):
+    """将一批两阶段检测记录以 JSON Lines 追加写入报告文件（失败忽略）"""
+    for key, records in (('hits', hits_records), ('miss', miss_records)):
+        if not records:
+            continue
+        try:
+            with open(report_files[key], 'a', encoding='utf-8') as fp:
+                for record in records:
+                    fp.write(json.dumps(record, ensure_ascii=False))
+                    fp.write('\n')
+        except Exception as _result_err:
+            logger.warning(f"写入两阶段检测结果失败(忽略): {_result_err}")
+
+
+def _commit_ocr_chunk(task, chunk_index, chunk_images, ocr_results, media_root, skip_hashes):
+    """在同一事务内写入一批识别结果及对应检查点。
+
+    Args:
+        task (OCRTask): 当前任务实例。
+        chunk_index (int): 批次序号。
+        chunk_images (list[str]): 本批次输入图片（含未命中/被过滤的图片）。
+        ocr_results (list[dict]): 本批次待写库结果。
+        media_root (str): MEDIA_ROOT 目录。
+        skip_hashes (set[str]): 已命中缓存、无需写库的图片哈希。
+
+    Returns:
+        list[OCRResult]: 本批次新写入的结果对象。
+    """
+    from django.db import transaction
+
+    new_results = []
+    for item in ocr_results:
+        img_full_path = os.path.join(media_root, item['image_path'])
+        img_hash = OCRService.calculate_image_hash(img_full_path)
+        if img_hash in skip_hashes:
+            # 如果本次任务启用缓存并且此缓存已存在，则跳过写库
+            continue
+        new_results.append(OCRResult(
+            task=task,
+            image_hash=img_hash,
+            image_path=item.get('image_path', '').replace('\\', '/'),
+            texts=item.get('texts', []),
+            languages=item.get('languages', {}),
+            has_match=item.get('has_match', False),
+            confidences=item.get('confidences', []),
+            max_confidence=item.get('max_confidence', 0.0),
+            processing_time=item.get('processing_time', 0),
+            pic_resolution=item.get('pic_resolution', ''),
+            team_id=task.team_id
+        ))
+
+    with transaction.atomic():
+        OCRResult.objects.bulk_create(new_results)
+        OCRTaskCheckpoint.objects.create(
+            task_id=task.id,
+            chunk_index=chunk_index,
+            image_paths="\n".join(_to_media_rel_path(p, media_root) for p in chunk_images),
+        )
+    return new_results
+
+
+def _save_phase_timings(task_id, phase_timer):
+    """将阶段耗时统计写入任务记录（写入失败不影响任务结果）"""
+    try:
+        timings = phase_timer.to_dict()
+        OCRTask.objects.all_teams().filter(id=task_id).update(phase_timings=timings)
+        summary = ", ".join(f"{p['name']}={p['wall_ms']:.0f}ms" for p in timings["phases"])
+        logger.warning(f"任务 {task_id} 阶段耗时: {summary}")
+    except Exception as _timing_err:
+        logger.warning(f"保存阶段耗时失败(忽略): {_timing_err}")
+
 
 def _generate_summary_report(task, results, target_languages):
     """生成OCR汇总报告（按动态目标语言命中）。
 
     Args:
         task (OCRTask): 当前任务实例。
-        results (list[dict]): 识别结果列表，元素包含 `image_path`、`texts` 等字段。
+        results (Iterable[dict]): 识别结果（列表或流式迭代器），元素包含 `image_path`、`texts` 等字段。
         target_languages (list[str] | None): 目标语言代码列表；None/空默认 ['ch']。
 
     Returns:
@@ -804,16 +897,18 @@ def _generate_summary_report(task, results, target_languages):
     Notes:
         - 命中判定遵循“任意目标语言命中即视为命中”。
         - 路径统一经 `PathUtils.normalize_path` 规范化。
+        - 只遍历一次 `results`，仅保留命中图片，可直接传入数据库迭代器。
         - 将在 `MEDIA_ROOT/ocr/reports/` 目录生成两个文件:
           1) `{task.id}_ocr_summary.json` 本次任务的结构化汇总
           2) `ocr_summary.json` 指向最近一次生成的覆盖式汇总
     """
     # 统计信息
-    total_images = len(results)
+    total_images = 0
     matched_images = []
 
     # 筛选包含目标语言的图片（命中规则：包含任一目标语言文字即为命中）
     for result in results:
+        total_images += 1
         # 跳过处理失败的图片
         if 'error' in result:
             continue
@@ -846,6 +941,14 @@ def _generate_summary_report(task, results, target_languages):
             'time': result.get('time_cost', 0),
             'texts': texts,
             'matched_texts': ' '.join(matched_texts),
+            # 结果中的附加字段，用于回填 JSON 汇总
+            'extras': {
+                'mode_display': result.get('mode_display'),
+                'resolution': result.get('resolution'),
+                'pixels': result.get('pixels'),
+                'param_diff': result.get('param_diff'),
+                'confidences': result.get('confidences'),
+            },
         })
 
     # 计算统计信息
@@ -892,7 +995,7 @@ def _generate_summary_report(task, results, target_languages):
         import json
         json_items = []
         for img in matched_images:
-            json_items.append({
+            item = {
                 'path': img['path'],
                 'name': img['name'],
                 'matched_texts': img['matched_texts'],
@@ -902,37 +1005,12 @@ def _generate_summary_report(task, results, target_languages):
                 'param_diff': None,
                 'confidences': None,
                 'mode_display': None,
-            })
-        # 若原始 results 中包含 used_preset/mode_display, 则进行对齐合并
-        try:
-            # 建立 path -> extras 的映射
-            extras = {}
-            for r in results:
-                if 'error' in r:
-                    continue
-                p = PathUtils.normalize_path(r.get('image_path', ''))
-                extras[p] = {
-                    'mode_display': r.get('mode_display'),
-                    'resolution': r.get('resolution'),
-                    'pixels': r.get('pixels'),
-                    'param_diff': r.get('param_diff'),
-                    'confidences': r.get('confidences'),
-                }
-            # 回填
-            for item in json_items:
-                ext = extras.get(item['path']) or {}
-                if ext.get('mode_display') is not None:
-                    item['mode_display'] = ext.get('mode_display')
-                if ext.get('resolution') is not None:
-                    item['resolution'] = ext.get('resolution')
-                if ext.get('pixels') is not None:
-                    item['pixels'] = ext.get('pixels')
-                if ext.get('param_diff') is not None:
-                    item['param_diff'] = ext.get('param_diff')
-                if ext.get('confidences') is not None:
-                    item['confidences'] = ext.get('confidences')
-        except Exception:
-            pass
+            }
+            # 若原始 results 中包含 used_preset/mode_display 等字段, 则进行回填
+            for key, value in img['extras'].items():
+                if value is not None:
+                    item[key] = value
+            json_items.append(item)
 
         summary_json = {
             'task_id': task.id,
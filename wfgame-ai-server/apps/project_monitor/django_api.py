@@ -7,7 +7,7 @@ import sys
 import asyncio
 import logging
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # 添加项目根目录到路径，避免导入错误
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -124,6 +124,62 @@ def log_ai_execution_sync(
         logger.error(f"记录AI执行失败: {e}")
         return False
 
+def log_ai_executions_bulk_sync(records: List[Dict]) -> int:
+    """
+    批量记录AI执行数据（一次查询项目、一次插入、一次提交）
+
+    Args:
+        records: 与 log_ai_execution_sync 参数同名字段的字典列表
+
+    Returns:
+        int: 写入的记录数，项目不存在的记录被跳过
+
+    Raises:
+        数据库写入失败时抛出异常，由调用方决定是否重试
+    """
+    if not records:
+        return 0
+
+    db_manager = _get_database_manager()
+    monitor_service = _get_monitor_service()
+    if not db_manager or not monitor_service:
+        raise RuntimeError("数据库管理器或监控服务未可用")
+
+    db = db_manager.get_session()
+    try:
+        from .models import Project
+        names = {r.get('project_name') for r in records}
+        project_ids = dict(db.query(Project.name, Project.id).filter(Project.name.in_(names)).all())
+        missing = names - set(project_ids)
+        if missing:
+            logger.warning(f"项目不存在，跳过对应记录: {sorted(n for n in missing if n)}")
+
+        log_datas = []
+        for r in records:
+            project_id = project_ids.get(r.get('project_name'))
+            if project_id is None:
+                continue
+            log_data = {
+                'project_id': project_id,
+                'button_class': r.get('button_class'),
+                'scenario': r.get('scenario'),
+                'success': r.get('success'),
+                'detection_time_ms': r.get('detection_time_ms'),
+                'device_id': r.get('device_id'),
+                'screenshot_path': r.get('screenshot_path')
+            }
+            coordinates = r.get('coordinates')
+            if coordinates:
+                log_data['coordinates_x'] = coordinates[0]
+                log_data['coordinates_y'] = coordinates[1]
+            log_datas.append(log_data)
+
+        written = monitor_service.log_executions_bulk(db, log_datas)
+        logger.info(f"批量记录AI执行: {written}/{len(records)} 条")
+        return written
+    finally:
+        db.close()
+
 # 异步版本的API
 async def log_ai_execution(
     project_name: str,
@@ -129,6 +129,64 @@ class ProjectMonitorService:
             logger.error(f"记录执行日志失败: {e}")
             raise
 
+    def log_executions_bulk(self, db: Session, log_datas: List[Dict]) -> int:
+        """批量记录执行日志：一次插入全部记录，每个 (项目, 类别) 只更新一次统计，单次提交"""
+        if not log_datas:
+            return 0
+        try:
+            execution_logs = [ExecutionLog(**log_data) for log_data in log_datas]
+            db.add_all(execution_logs)
+            db.flush()
+
+            groups: Dict[Tuple[int, str], List[ExecutionLog]] = {}
+            for execution_log in execution_logs:
+                groups.setdefault((execution_log.project_id, execution_log.button_class), []).append(execution_log)
+            for (project_id, button_class), logs in groups.items():
+                self._update_class_statistics_bulk(db, project_id, button_class, logs)
+
+            db.commit()
+            return len(execution_logs)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"批量记录执行日志失败: {e}")
+            raise
+
+    def _update_class_statistics_bulk(self, db: Session, project_id: int, button_class: str,
+                                      logs: List[ExecutionLog]):
+        """按一批执行日志累加类统计数据"""
+        stat = db.query(ClassStatistics).filter(
+            ClassStatistics.project_id == project_id,
+            ClassStatistics.button_class == button_class
+        ).first()
+
+        if not stat:
+            stat = ClassStatistics(
+                project_id=project_id,
+                button_class=button_class,
+                total_executions=0,
+                total_successes=0,
+                total_failures=0,
+                success_rate=0.0
+            )
+            db.add(stat)
+
+        successes = sum(1 for log in logs if log.success)
+        stat.total_executions += len(logs)
+        stat.total_successes += successes
+        stat.total_failures += len(logs) - successes
+        stat.success_rate = stat.total_successes / stat.total_executions if stat.total_executions > 0 else 0.0
+        stat.last_executed_at = max((log.executed_at for log in logs if log.executed_at), default=stat.last_executed_at)
+        stat.last_updated = datetime.utcnow()
+
+        if any(log.detection_time_ms for log in logs):
+            avg_time = db.query(func.avg(ExecutionLog.detection_time_ms)).filter(
+                ExecutionLog.project_id == project_id,
+                ExecutionLog.button_class == button_class,
+                ExecutionLog.detection_time_ms.isnot(None)
+            ).scalar()
+            stat.avg_detection_time_ms = float(avg_time) if avg_time else None
+
     def _update_class_statistics(self, db: Session, execution_log: ExecutionLog):
         """更新类统计数据"""
         try:
@@ -7,6 +7,7 @@ Action处理器模块
 # 🔧 新增：禁用第三方库DEBUG日志
 import logging
 
+from utils.frame_streamer import publish_live_frame
 from utils.socketio_helper import SocketIOHttpApiClient
 from utils.socketIo_room_names import device_room
 
@@ -61,19 +62,52 @@ except ImportError:
         print("⚠️ 警告: 无法导入enhanced_device_preparation_manager，部分功能可能不可用")
         EnhancedDevicePreparationManager = None
 
+try:
+    from .frame_grabber import grab_frame
+except ImportError:
+    try:
+        from frame_grabber import grab_frame
+    except ImportError:
+        print("⚠️ 警告: 无法导入frame_grabber，截图将回退为单次adb调用")
+        grab_frame = None
+
+try:
+    from .frame_change_gate import get_frame_change_gate
+except ImportError:
+    try:
+        from frame_change_gate import get_frame_change_gate
+    except ImportError:
+        print("⚠️ 警告: 无法导入frame_change_gate，等待类步骤将每帧完整检测")
+        get_frame_change_gate = None
+
 # Import try_log_screen function for thumbnail generation
 try:
     from replay_script import try_log_screen
 except ImportError:
     try_log_screen = None
 
+def _stream_live_frame(room_id, image):
+    """
+    把截图交给实时画面推流器（按房间节流，无人观看时不编码），立即返回
+
+    Returns:
+        False 表示推流已关闭，调用方回退为 base64 JSON 推送
+    """
+    try:
+        return publish_live_frame(room_id, image)
+    except Exception as e:
+        print(f"⚠️ 实时画面推流失败: {e}")
+        return False
+
+
 # Import the screenshot helper function
-def get_device_screenshot(device):
+def get_device_screenshot(device, max_age=None):
     """
     获取设备截图的通用方法，兼容 adbutils.AdbDevice 和 Mock设备
 
     Args:
         device: adbutils.AdbDevice 对象或 Mock设备
+        max_age: 可接受的帧陈旧秒数，None（默认）表示一个采集周期内的最新帧，0 表示调用之后开始采集的帧（输入操作之后使用）
 
     Returns:
         PIL.Image 对象或 None
@@ -83,12 +117,10 @@ def get_device_screenshot(device):
     try:
         pk = getattr(device, 'primary_key_id', None) or getattr(device, 'id', None)
         if not pk and hasattr(device, 'serial'):
-            # 尝试通过序列号查询 Django Device 模型获取 pk
+            # 通过序列号从进程内设备元数据缓存获取 pk（每台设备仅首次查询数据库）
             try:
-                from apps.devices.models import Device as _DModel
-                dev_obj = _DModel.objects.filter(device_id=getattr(device, 'serial')).only('id').first()
-                if dev_obj:
-                    pk = dev_obj.id
+                from apps.devices.metadata_cache import get_device_pk
+                pk = get_device_pk(getattr(device, 'serial'))
             except Exception:
                 pk = None
         if pk:
@@ -100,7 +132,9 @@ def get_device_screenshot(device):
         if hasattr(device, 'screenshot') and callable(device.screenshot):
             screenshot = device.screenshot()
             if screenshot is not None:
-                # 统一转换为 base64 字符串
+                if _stream_live_frame(room_id, screenshot):
+                    return screenshot
+                # 推流关闭：统一转换为 base64 字符串
                 pic_b64 = None
                 try:
                     # PIL.Image
@@ -139,23 +173,33 @@ def get_device_screenshot(device):
             print("⚠️ 设备没有serial属性且没有screenshot方法，无法获取截图")
             return None
 
-        # 使用subprocess直接获取字节数据，避免字符编码问题
-        result = subprocess.run(
-            f"adb -s {device.serial} exec-out screencap -p",
-            shell=True,
-            capture_output=True,
-            timeout=10
-        )
+        # 优先读取常驻帧采集器的最新帧，采集器不可用时回退为单次 adb 调用
+        frame = None
+        png_bytes = None
+        if grab_frame is not None:
+            frame = grab_frame(device.serial, max_age=max_age)
+        if frame is None:
+            result = subprocess.run(
+                f"adb -s {device.serial} exec-out screencap -p",
+                shell=True,
+                capture_output=True,
+                timeout=10
+            )
+            if result.returncode == 0 and result.stdout:
+                png_bytes = result.stdout
 
-        if result.returncode == 0 and result.stdout:
+        if frame is not None or png_bytes:
             from PIL import Image
-            # result.stdout 已经是字节数据，统一转成 base64 字符串
-            pic_b64 = base64.b64encode(result.stdout).decode('utf-8')
-            try:
-                SocketIOHttpApiClient().emit(room=room_id, module='replay', event='frame', data=pic_b64)
-            except Exception as _emit_err2:
-                print(f"⚠️ emit frame 失败: {_emit_err2}")
-            return Image.open(io.BytesIO(result.stdout))
+            # 采集器帧直接转换为图像（原始帧不经过 PNG 编解码），推流端使用 Frame 的缩放缓存
+            image = frame.to_pil() if frame is not None else Image.open(io.BytesIO(png_bytes))
+            if not _stream_live_frame(room_id, frame if frame is not None else png_bytes):
+                # 推流关闭：仅此时才需要 PNG 字节，统一转成 base64 字符串
+                pic_b64 = base64.b64encode(frame.to_png() if frame is not None else png_bytes).decode('utf-8')
+                try:
+                    SocketIOHttpApiClient().emit(room=room_id, module='replay', event='frame', data=pic_b64)
+                except Exception as _emit_err2:
+                    print(f"⚠️ emit frame 失败: {_emit_err2}")
+            return image
         else:
             print("⚠️ 警告：screencap命令返回空数据或失败")
             return None
@@ -171,7 +215,9 @@ def get_device_screenshot(device):
             print("尝试使用airtest设备进行截图...")
             airtest_device = connect_device(f"Android:///{device.serial}")
             img = airtest_device.snapshot()
-            # 将 PIL.Image 转为 base64
+            if img is not None and _stream_live_frame(room_id, img):
+                return img
+            # 推流关闭：将 PIL.Image 转为 base64
             pic_b64 = None
             from PIL import Image as _PILImage
             if isinstance(img, _PILImage.Image):
@@ -2012,6 +2058,12 @@ class ActionProcessor:
         detection_result = None
         success = False  # 修复：初始化success变量，避免UnboundLocalError
 
+        # 画面与上次检测时一致则直接沿用上次结果，跳过推理
+        frame_gate = get_frame_change_gate() if get_frame_change_gate else None
+        gate_key = f"{getattr(self.device, 'serial', 'unknown')}:wait_for_appearance:{yolo_class}"
+        if frame_gate is not None:
+            frame_gate.invalidate(gate_key, reset_stats=True)
+
         try:
             loop_count = 0
             while time.time() - wait_start_time < max_wait:
@@ -2028,11 +2080,16 @@ class ActionProcessor:
                             time.sleep(polling_interval)
                             continue
 
-                        import cv2
-                        import numpy as np
-                        frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-
-                        success, detection_result = self.detect_buttons(frame, target_class=yolo_class)
+                        signature = frame_gate.signature(screenshot) if frame_gate is not None else None
+                        cache_hit, cached = frame_gate.lookup(gate_key, signature) if frame_gate is not None else (False, None)
+                        if cache_hit:
+                            success, detection_result = cached
+                            print("⏭️ 画面未变化，沿用上次AI检测结果")
+                        else:
+                            frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+                            success, detection_result = self.detect_buttons(frame, target_class=yolo_class)
+                            if frame_gate is not None:
+                                frame_gate.store(gate_key, signature, (success, detection_result))
                         print(f"🔍 AI检测结果: success={success}, detection_result={detection_result}")
 
                         if success and detection_result[0] is not None:
@@ -2078,8 +2135,6 @@ class ActionProcessor:
                     # 获取当前屏幕截图
                     screenshot = get_device_screenshot(self.device)
                     if screenshot is not None:
-                        import cv2
-                        import numpy as np
                         frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
 
                         success, detection_result = self.detect_buttons(frame, target_class=fallback_yolo_class)
@@ -2121,6 +2176,10 @@ class ActionProcessor:
             else:
                 wait_result = "timeout"
                 print(f"⏰ 等待超时! 总等待时间: {total_wait_time:.1f}秒")
+            if frame_gate is not None and detection_method == "ai":
+                gate_stats = frame_gate.stats(gate_key)
+                print(f"📊 帧变化门控: 检查 {gate_stats['checks']} 次，跳过推理 {gate_stats['skips']} 次 "
+                      f"(跳过率 {gate_stats['skip_rate']}%)")
 
         except Exception as e:
             print(f"❌ 等待过程中发生异常: {e}")
@@ -2232,6 +2291,8 @@ class ActionProcessor:
         last_ui_structure = None
         is_stable = False
         stability_result = "not_stable"
+        # AI方式比较缩略灰度签名，不再做全分辨率 absdiff
+        frame_gate = get_frame_change_gate() if get_frame_change_gate else None
 
         try:
             while time.time() - wait_start_time < max_wait:
@@ -2243,34 +2304,41 @@ class ActionProcessor:
                 if detection_method == "ai":
                     # 使用截图比较检测稳定性
                     try:
-                        import subprocess
-                        screenshot_result = subprocess.run(
-                            f"adb -s {self.device.serial} exec-out screencap -p",
-                            shell=True, capture_output=True
-                        )
-                        if screenshot_result.returncode == 0:
-                            import cv2
-                            import numpy as np
-                            # 将字节数据转换为图像
-                            nparr = np.frombuffer(screenshot_result.stdout, np.uint8)
-                            current_screenshot = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                        frame = grab_frame(self.device.serial) if grab_frame else None
+                        if frame is not None:
+                            current_screenshot = frame if frame_gate is not None else frame.to_bgr()
+                        else:
+                            screenshot_result = subprocess.run(
+                                f"adb -s {self.device.serial} exec-out screencap -p",
+                                shell=True, capture_output=True
+                            )
+                            if screenshot_result.returncode == 0:
+                                # 将字节数据转换为图像
+                                nparr = np.frombuffer(screenshot_result.stdout, np.uint8)
+                                current_screenshot = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
                     except Exception as e:
                         print(f"⚠️ 截图获取失败: {e}")
 
                 elif detection_method == "ui":
-                    # 使用UI结构比较检测稳定性
+                    # 使用UI结构比较检测稳定性（须每次重新 dump，不能读缓存）
                     if DeviceScriptReplayer:
                         input_handler = DeviceScriptReplayer(self.device.serial)
-                        current_ui_structure = input_handler.get_ui_hierarchy()
+                        current_ui_structure = input_handler.get_ui_hierarchy(force=True)
 
                 # 检查是否与上次状态相同
                 is_same = False
 
                 if detection_method == "ai" and current_screenshot is not None:
+                    if frame_gate is not None:
+                        current_screenshot = frame_gate.signature(current_screenshot)
                     if last_screenshot is not None:
-                        # 计算图像差异
-                        diff = cv2.absdiff(current_screenshot, last_screenshot)
-                        diff_ratio = np.sum(diff) / (diff.shape[0] * diff.shape[1] * diff.shape[2] * 255)
+                        if frame_gate is not None:
+                            # 签名平均灰度差近似整帧 absdiff 比例
+                            diff_ratio = frame_gate.compare(last_screenshot, current_screenshot).mean_ratio
+                        else:
+                            # 计算图像差异
+                            diff = cv2.absdiff(current_screenshot, last_screenshot)
+                            diff_ratio = np.sum(diff) / (diff.shape[0] * diff.shape[1] * diff.shape[2] * 255)
                         is_same = diff_ratio < tolerance
                         print(f"🖼️ 截图差异比例: {diff_ratio:.4f} (阈值: {tolerance})")
                     else:
@@ -2424,8 +2492,8 @@ class ActionProcessor:
                     if detection_method == "ai" and yolo_class:
                         # AI检测点击
                         if self.detect_buttons:
-                            # 获取当前屏幕截图
-                            screenshot = get_device_screenshot(self.device)
+                            # 获取当前屏幕截图（重试时须为上次操作之后采集的帧）
+                            screenshot = get_device_screenshot(self.device, max_age=0 if attempt else None)
                             if screenshot is None:
                                 print("❌ 无法获取屏幕截图")
                                 continue
@@ -2481,7 +2549,7 @@ class ActionProcessor:
                     # 支持AI定位的输入框后聚焦输入
                     if detection_method == "ai" and yolo_class:
                         if self.detect_buttons:
-                            screenshot = get_device_screenshot(self.device)
+                            screenshot = get_device_screenshot(self.device, max_age=0 if attempt else None)
                             if screenshot is None:
                                 print("❌ 无法获取屏幕截图")
                             else:
@@ -2721,16 +2789,21 @@ class ActionProcessor:
                     # 通过adb获取截图，避免UTF-8编码错误
                     try:
                         import subprocess
-                        # 使用exec-out获取原始字节数据，避免文本编码问题
-                        result = subprocess.run(
-                            f"adb -s {self.serial} exec-out screencap -p",
-                            shell=True,
-                        )
-                        if result.returncode == 0 and result.stdout:
+                        frame = grab_frame(self.serial) if grab_frame else None
+                        if frame is not None:
+                            png_bytes = frame.to_png()
+                        else:
+                            # 使用exec-out获取原始字节数据，避免文本编码问题
+                            result = subprocess.run(
+                                f"adb -s {self.serial} exec-out screencap -p",
+                                shell=True, capture_output=True, timeout=10
+                            )
+                            png_bytes = result.stdout if result.returncode == 0 else None
+                        if png_bytes:
                             import cv2
                             import numpy as np
                             # 直接从字节数据解码PNG
-                            nparr = np.frombuffer(result.stdout, np.uint8)
+                            nparr = np.frombuffer(png_bytes, np.uint8)
                             img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
                             if img is not None:
                                 # 转换为PIL Image格式
@@ -3324,8 +3397,11 @@ class ActionProcessor:
 
     # =================== Priority 模式专用处理方法 ===================
 
-    def _handle_ai_detection_click_priority_mode(self, step, cycle_count, log_dir):
-        """Priority模式专用的AI检测点击处理 - 只在成功时记录日志和截图"""
+    def _handle_ai_detection_click_priority_mode(self, step, cycle_count, log_dir, detection_result=None):
+        """Priority模式专用的AI检测点击处理 - 只在成功时记录日志和截图
+
+        detection_result: 本轮已有的检测结果 (x, y, class)，传入时不再重复截图与推理
+        """
         step_class = step.get("yolo_class")
         step_remark = step.get("remark", "")
 
@@ -3338,25 +3414,26 @@ class ActionProcessor:
             )
 
         try:
-            # 获取屏幕截图
-            from replay_script import get_device_screenshot
-            screenshot = get_device_screenshot(self.device)
-            if screenshot is None:
-                return ActionResult(
-                    success=False,
-                    message="无法获取设备屏幕截图",
-                    details={"operation": "ai_detection_click_priority", "error": "screenshot_failed"},
-                    executed=False
-                )
-
-            import cv2
-            import numpy as np
-            frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+            step_confidence = step.get("confidence", 0.6)
+            if detection_result is None:
+                # 获取屏幕截图
+                from replay_script import get_device_screenshot
+                screenshot = get_device_screenshot(self.device)
+                if screenshot is None:
+                    return ActionResult(
+                        success=False,
+                        message="无法获取设备屏幕截图",
+                        details={"operation": "ai_detection_click_priority", "error": "screenshot_failed"},
+                        executed=False
+                    )
+                frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
 
-            # 使用AI检测（如果可用）
-            if self.detect_buttons:
-                step_confidence = step.get("confidence", 0.6)
-                success, detection_result = self.detect_buttons(frame, target_class=step_class, conf_threshold=step_confidence)
+            # 使用AI检测（如果可用）；已有本轮检测结果时直接使用
+            if detection_result is not None or self.detect_buttons:
+                if detection_result is None:
+                    success, detection_result = self.detect_buttons(frame, target_class=step_class, conf_threshold=step_confidence)
+                else:
+                    success = True
 
                 if success and detection_result[0] is not None:
                     x, y, detected_class = detection_result
@@ -23,7 +23,6 @@ App Permission Manager - 应用启动后权限弹窗处理器
 import time
 import subprocess
 import logging
-import xml.etree.ElementTree as ET
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
@@ -47,6 +46,11 @@ except ImportError as e:
     logger.warning(f"⚠️ UniversalUIDetector 未找到: {e}，使用基础UI检测")
     UNIVERSAL_UI_DETECTOR_AVAILABLE = False
 
+try:
+    from ui_tree import bounds_center, get_ui_tree
+except ImportError:
+    from apps.scripts.ui_tree import bounds_center, get_ui_tree
+
 class PermissionAction(Enum):
     """权限弹窗可能的操作"""
     ALLOW = "allow"
@@ -922,33 +926,13 @@ class AppPermissionManager:
                 logger.warning("❌ 无法获取UI结构")
                 return False
 
-            # 解析XML查找文本元素（精确匹配+可点击检查）
-            root = ET.fromstring(ui_dump)
-
-            def find_text_element(node):
-                if node.get('text') == target_text and node.get('clickable') == 'true':
-                    bounds = node.get('bounds')
-                    logger.info(f"📍 找到文本元素bounds: {bounds}")
-                    return bounds
-                for child in node:
-                    result = find_text_element(child)
-                    if result:
-                        return result
-                return None
-
-            bounds = find_text_element(root)
+            # 文本索引查找元素（精确匹配+可点击检查）
+            node = get_ui_tree(ui_dump).find_by_text(target_text, clickable=True)
+            center = bounds_center(node.get('bounds', '')) if node else None
 
-            if bounds:
-                # 解析bounds并点击（参考quick测试的成功做法）
-                bounds = bounds.strip('[]')
-                parts = bounds.split('][')
-                left_top = parts[0].split(',')
-                right_bottom = parts[1].split(',')
-
-                x1, y1 = int(left_top[0]), int(left_top[1])
-                x2, y2 = int(right_bottom[0]), int(right_bottom[1])
-                center_x = (x1 + x2) // 2
-                center_y = (y1 + y2) // 2
+            if center:
+                logger.info(f"📍 找到文本元素bounds: {node.get('bounds')}")
+                center_x, center_y = center
 
                 logger.info(f"📍 通过文本计算的中心点: ({center_x}, {center_y})")
 
@@ -989,36 +973,16 @@ class AppPermissionManager:
                 logger.warning("❌ 无法获取UI结构")
                 return False
 
-            # 解析XML查找元素（遍历所有可能的resource_id）
-            root = ET.fromstring(ui_dump)
-
-            def find_element_by_resource_id(node, target_resource_id):
-                if node.get('resource-id') == target_resource_id:
-                    bounds = node.get('bounds')
-                    logger.info(f"📍 找到resource_id元素: {target_resource_id}, bounds: {bounds}")
-                    return bounds
-                for child in node:
-                    result = find_element_by_resource_id(child, target_resource_id)
-                    if result:
-                        return result
-                return None
-
-            # 尝试所有可能的resource_id
+            # resource-id 索引查找元素（尝试所有可能的resource_id）
+            ui_tree = get_ui_tree(ui_dump)
             for resource_id in possible_ids:
                 logger.info(f"🔍 尝试resource_id: {resource_id}")
-                bounds = find_element_by_resource_id(root, resource_id)
-
-                if bounds:
-                    # 解析bounds并点击（参考quick测试的成功做法）
-                    bounds = bounds.strip('[]')
-                    parts = bounds.split('][')
-                    left_top = parts[0].split(',')
-                    right_bottom = parts[1].split(',')
+                node = ui_tree.find_by_resource_id(resource_id)
+                center = bounds_center(node.get('bounds', '')) if node else None
 
-                    x1, y1 = int(left_top[0]), int(left_top[1])
-                    x2, y2 = int(right_bottom[0]), int(right_bottom[1])
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
+                if center:
+                    logger.info(f"📍 找到resource_id元素: {resource_id}, bounds: {node.get('bounds')}")
+                    center_x, center_y = center
 
                     logger.info(f"📍 通过resource_id计算的中心点: ({center_x}, {center_y})")
 
@@ -1068,17 +1032,10 @@ class AppPermissionManager:
             if not ui_dump:
                 return True  # 无法确认，假设仍存在
 
-            root = ET.fromstring(ui_dump)
-
-            # 查找相同的元素（通过文本或resource_id）
-            for element in root.iter():
-                element_text = element.get('text', '').strip()
-                element_resource_id = element.get('resource-id', '')
-
-                # 如果找到相同的文本或resource_id，说明元素仍存在
-                if element_text == target_text or (target_resource_id and element_resource_id == target_resource_id):
-                    logger.info(f"元素仍存在: text='{element_text}', resource_id='{element_resource_id}'")
-                    return True
+            # 查找相同的元素（通过文本或resource_id索引），找到说明元素仍存在
+            if get_ui_tree(ui_dump).contains(text=target_text, resource_id=target_resource_id):
+                logger.info(f"元素仍存在: text='{target_text}', resource_id='{target_resource_id}'")
+                return True
 
             # 没有找到，说明元素已消失（点击成功）
             logger.info(f"元素已消失: text='{target_text}', resource_id='{target_resource_id}'")
@@ -1139,14 +1096,9 @@ class AppPermissionManager:
 
                                 if ui_content and len(ui_content) > 100:
                                     # 解析并检查元素存在性
-                                    root = ET.fromstring(ui_content)
-                                    for element in root.iter():
-                                        element_text = element.get('text', '').strip()
-                                        element_resource_id = element.get('resource-id', '')
-
-                                        if element_text == target_text or (target_resource_id and element_resource_id == target_resource_id):
-                                            logger.debug(f"元素仍存在: text='{element_text}', resource_id='{element_resource_id}'")
-                                            return True
+                                    if get_ui_tree(ui_content).contains(text=target_text, resource_id=target_resource_id):
+                                        logger.debug(f"元素仍存在: text='{target_text}', resource_id='{target_resource_id}'")
+                                        return True
 
                                     logger.info(f"✅ 元素已消失: text='{target_text}', resource_id='{target_resource_id}'")
                                     return False
@@ -1184,14 +1136,9 @@ class AppPermissionManager:
                             ui_content = f.read()
 
                         if ui_content and len(ui_content) > 100:
-                            root = ET.fromstring(ui_content)
-                            for element in root.iter():
-                                element_text = element.get('text', '').strip()
-                                element_resource_id = element.get('resource-id', '')
-
-                                if element_text == target_text or (target_resource_id and element_resource_id == target_resource_id):
-                                    logger.debug(f"元素仍存在: text='{element_text}', resource_id='{element_resource_id}'")
-                                    return True
+                            if get_ui_tree(ui_content).contains(text=target_text, resource_id=target_resource_id):
+                                logger.debug(f"元素仍存在: text='{target_text}', resource_id='{target_resource_id}'")
+                                return True
 
                             logger.info(f"✅ 元素已消失: text='{target_text}', resource_id='{target_resource_id}'")
                             return False
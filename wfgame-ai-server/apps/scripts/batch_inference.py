@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+跨设备批量YOLO推理服务
+多台设备并发回放时，由一个推理工作线程在短时间窗口内收集各设备提交的帧，
+合并为一次批量前向推理，再按请求拆分结果返回，避免每台设备各自加载模型、
+各自以 batch=1 推理。
+
+两种部署方式（config.ini [settings] yolo_batch_mode）:
+    inprocess - 进程内工作线程，适用于线程并发的混合执行器
+    sidecar   - 独立进程监听本地地址（POSIX 为 Unix socket，Windows 为命名管道），
+                多进程回放的设备进程通过 RemoteInferenceClient 提交帧
+    off       - 关闭（默认），各调用方直接推理
+
+启动 sidecar: python batch_inference.py --serve
+"""
+
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+from yolo_inference import FrameDetections, get_frame_detector
+
+BATCH_MODES = ("off", "inprocess", "sidecar")
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_WINDOW_MS = 10.0
+# sidecar 认证口令（仅本机通信，防止误连）
+SIDECAR_AUTHKEY = b"wfgame-yolo-batch"
+# 客户端传输 Frame 前的降采样边长（与推理 imgsz 一致）
+REMOTE_MAX_SIDE = 640
+
+
+def default_sidecar_address() -> str:
+    if sys.platform == "win32":
+        return r"\\.\pipe\wfgame_yolo_batch"
+    return os.path.join(tempfile.gettempdir(), "wfgame_yolo_batch.sock")
+
+
+def load_batch_settings() -> Dict[str, object]:
+    """读取 config.ini [settings] 中的批量推理配置（Django 不可用时使用默认值）"""
+    values = {
+        "mode": "off",
+        "max_batch_size": DEFAULT_MAX_BATCH_SIZE,
+        "window_ms": DEFAULT_WINDOW_MS,
+        "address": default_sidecar_address(),
+    }
+    try:
+        from django.conf import settings
+
+        config = settings.CFG._config
+        values["mode"] = config.get("settings", "yolo_batch_mode", fallback="off").strip().lower()
+        values["max_batch_size"] = config.getint(
+            "settings", "yolo_batch_max_size", fallback=DEFAULT_MAX_BATCH_SIZE)
+        values["window_ms"] = config.getfloat(
+            "settings", "yolo_batch_window_ms", fallback=DEFAULT_WINDOW_MS)
+        values["address"] = config.get("settings", "yolo_batch_address", fallback="").strip() \
+            or default_sidecar_address()
+    except Exception:
+        pass
+    env_mode = os.environ.get("WFGAME_YOLO_BATCH_MODE", "").strip().lower()
+    if env_mode in BATCH_MODES:
+        values["mode"] = env_mode
+    if values["mode"] not in BATCH_MODES:
+        values["mode"] = "off"
+    return values
+
+
+@dataclass
+class _InferenceRequest:
+    frame: object
+    conf: float
+    frame_scale: float
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    future: Future = field(default_factory=Future)
+
+
+class _Metric:
+    """累计指标：次数、均值、最大值"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+        }
+
+
+class BatchInferenceService:
+    """
+    进程内批量推理工作线程
+    第一帧到达后最多再等待 window_ms 收集更多帧，凑满 max_batch_size 立即执行。
+    """
+
+    def __init__(self, detector, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 window_ms: float = DEFAULT_WINDOW_MS):
+        self.detector = detector
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self._queue: "queue.Queue[_InferenceRequest]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics_lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.queue_wait_ms = _Metric()
+        self.batch_fill = _Metric()
+        self.inference_ms = _Metric()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="yolo-batch-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 3.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def submit(self, frame, conf: float, frame_scale: float = 1.0) -> Future:
+        """提交一帧，返回 Future（结果为 Detection 列表）"""
+        self.start()
+        request = _InferenceRequest(frame, conf, frame_scale)
+        self._queue.put(request)
+        return request.future
+
+    def detect_all(self, frame, conf: float, frame_scale: float = 1.0,
+                   timeout: float = 30.0) -> FrameDetections:
+        """与 YoloFrameDetector.detect_all 相同的接口，经批量通道推理"""
+        start = time.perf_counter()
+        detections = self.submit(frame, conf, frame_scale).result(timeout=timeout)
+        return FrameDetections(detections, conf, round((time.perf_counter() - start) * 1000, 2))
+
+    def _collect(self) -> List[_InferenceRequest]:
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = self.detector.detect_batch(
+                    [r.frame for r in batch], [r.conf for r in batch], [r.frame_scale for r in batch]
+                )
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._metrics_lock:
+                self.batches += 1
+                self.frames += len(batch)
+                self.batch_fill.add(len(batch) / self.max_batch_size)
+                self.inference_ms.add(elapsed_ms)
+                for request in batch:
+                    self.queue_wait_ms.add((started - request.enqueued_at) * 1000)
+            for request, detections in zip(batch, results):
+                request.future.set_result(detections)
+
+    def stats(self) -> Dict[str, object]:
+        with self._metrics_lock:
+            return {
+                "batches": self.batches,
+                "frames": self.frames,
+                "max_batch_size": self.max_batch_size,
+                "window_ms": round(self.window * 1000, 2),
+                "queue_wait_ms": self.queue_wait_ms.to_dict(),
+                "batch_fill": self.batch_fill.to_dict(),
+                "inference_ms": self.inference_ms.to_dict(),
+                "pending": self._queue.qsize(),
+            }
+
+
+class InferenceServer:
+    """sidecar 服务端：每个客户端连接一个线程，请求统一进入 BatchInferenceService"""
+
+    def __init__(self, service: BatchInferenceService, address: Optional[str] = None):
+        self.service = service
+        self.address = address or default_sidecar_address()
+        self._listener: Optional[Listener] = None
+
+    def serve_forever(self):
+        if sys.platform != "win32" and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = Listener(self.address, authkey=SIDECAR_AUTHKEY)
+        print(f"🚀 批量推理服务已启动: {self.address}")
+        try:
+            while True:
+                conn = self._listener.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self._listener.close()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if message.get("op") == "stats":
+                        conn.send({"ok": True, "stats": self.service.stats()})
+                        continue
+                    detections = self.service.submit(
+                        message["frame"], message["conf"], message.get("frame_scale", 1.0)
+                    ).result()
+                    conn.send({"ok": True, "detections": detections})
+                except Exception as e:
+                    conn.send({"ok": False, "error": str(e)})
+
+
+class RemoteInferenceClient:
+    """sidecar 客户端，提供与 YoloFrameDetector.detect_all 相同的接口"""
+
+    def __init__(self, address: Optional[str] = None, connect_timeout: float = 2.0):
+        self.address = address or default_sidecar_address()
+        self.connect_timeout = connect_timeout
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=SIDECAR_AUTHKEY)
+        return self._conn
+
+    def _call(self, message: Dict) -> Dict:
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.send(message)
+                reply = conn.recv()
+            except (EOFError, OSError):
+                self.close()
+                raise
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error", "批量推理服务返回错误"))
+        return reply
+
+    def ping(self) -> bool:
+        try:
+            self._call({"op": "stats"})
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> Dict:
+        return self._call({"op": "stats"})["stats"]
+
+    def detect_all(self, frame, conf: float, frame_scale: float = 1.0) -> FrameDetections:
+        start = time.perf_counter()
+        if hasattr(frame, 'to_bgr'):
+            # Frame 对象在本进程降采样后再传输，减少跨进程拷贝
+            frame_scale = frame.scale_for(REMOTE_MAX_SIDE)
+            frame = frame.to_bgr(max_side=REMOTE_MAX_SIDE)
+        reply = self._call({"op": "detect", "frame": frame, "conf": conf, "frame_scale": frame_scale})
+        return FrameDetections(reply["detections"], conf, round((time.perf_counter() - start) * 1000, 2))
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_inference_backend(yolo):
+    """
+    按配置返回推理后端（均提供 detect_all 接口）:
+    sidecar 可连通时返回 RemoteInferenceClient，inprocess 返回进程内批量服务，
+    否则返回直接推理的 YoloFrameDetector
+    """
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is not None:
+            backend, owner = _BACKEND
+            if owner is yolo or isinstance(backend, RemoteInferenceClient):
+                return backend
+            if isinstance(backend, BatchInferenceService):
+                backend.stop()
+        batch_settings = load_batch_settings()
+        mode = batch_settings["mode"]
+        backend = None
+        if mode == "sidecar":
+            client = RemoteInferenceClient(batch_settings["address"])
+            if client.ping():
+                backend = client
+            else:
+                print(f"⚠️ 批量推理服务不可达({batch_settings['address']})，回退为进程内批量推理")
+                mode = "inprocess"
+        if backend is None and yolo is None:
+            return None
+        if backend is None and mode == "inprocess":
+            backend = BatchInferenceService(
+                get_frame_detector(yolo),
+                max_batch_size=batch_settings["max_batch_size"],
+                window_ms=batch_settings["window_ms"],
+            )
+        if backend is None:
+            backend = get_frame_detector(yolo)
+        _BACKEND = (backend, yolo)
+        return backend
+
+
+def discard_remote_backend(backend) -> bool:
+    """
+    sidecar 连接失效（进程退出等）时丢弃缓存的 RemoteInferenceClient，
+    下次 get_inference_backend 重新探测 sidecar，不可达则回退为进程内推理
+
+    Returns:
+        backend 不是 sidecar 客户端时返回 False（调用方按原异常处理）
+    """
+    global _BACKEND
+    if not isinstance(backend, RemoteInferenceClient):
+        return False
+    with _BACKEND_LOCK:
+        if _BACKEND is not None and _BACKEND[0] is backend:
+            _BACKEND = None
+    backend.close()
+    return True
+
+
+def sidecar_available() -> bool:
+    """sidecar 模式且服务可连通（此时设备进程无需自行加载模型）"""
+    batch_settings = load_batch_settings()
+    if batch_settings["mode"] != "sidecar":
+        return False
+    client = RemoteInferenceClient(batch_settings["address"])
+    try:
+        return client.ping()
+    finally:
+        client.close()
+
+
+def ensure_sidecar(timeout: float = 60.0) -> Optional[subprocess.Popen]:
+    """
+    sidecar 模式下确保服务已运行：不可达时以子进程启动并等待就绪
+    返回新启动的进程（调用方负责结束），已在运行或非 sidecar 模式返回 None
+    """
+    batch_settings = load_batch_settings()
+    if batch_settings["mode"] != "sidecar":
+        return None
+    client = RemoteInferenceClient(batch_settings["address"])
+    if client.ping():
+        client.close()
+        return None
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    deadline = time.time() + timeout
+    while time.time() < deadline and proc.poll() is None:
+        if client.ping():
+            client.close()
+            print(f"✅ 批量推理服务已就绪, PID: {proc.pid}")
+            return proc
+        time.sleep(0.5)
+    print("⚠️ 批量推理服务启动超时，设备将各自推理")
+    return proc
+
+
+def _serve():
+    import replay_script
+
+    replay_script.load_yolo_model_for_detection()
+    batch_settings = load_batch_settings()
+    service = BatchInferenceService(
+        get_frame_detector(replay_script.model),
+        max_batch_size=batch_settings["max_batch_size"],
+        window_ms=batch_settings["window_ms"],
+    )
+    service.start()
+
+    def _report():
+        while True:
+            time.sleep(60)
+            print(f"📊 批量推理指标: {service.stats()}")
+
+    threading.Thread(target=_report, daemon=True).start()
+    InferenceServer(service, batch_settings["address"]).serve_forever()
+
+
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        _serve()
+    else:
+        print("用法: python batch_inference.py --serve")
@@ -3,27 +3,52 @@
 """
 跨进程账号管理器
 解决多进程环境下账号重复分配的问题
+
+状态保存在本地 SQLite（WAL 模式）中，每个账号一行：
+- 分配/释放只改动目标行（条件 UPDATE 抢占），写事务只持有极短时间，
+  读操作不阻塞写，不再有全局文件锁和整份 JSON 的解析/重写；
+- 每次操作按主键或索引定位，成本与账号总数无关；
+- 分配带租约（lease_until），持有进程崩溃后租约到期或进程已不存在时账号自动回收。
 """
 
 import os
-import fcntl
-import json
+import sys
 import time
+import sqlite3
 import threading
 from typing import Optional, Tuple, Dict, List
-from datetime import datetime
+
+# 租约时长（秒），同一设备再次分配/查询时续期
+DEFAULT_LEASE_SECONDS = 6 * 3600
+# SQLite 写锁等待上限（毫秒）
+BUSY_TIMEOUT_MS = 10000
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    """本机进程是否仍存在（无法判断时视为存在）"""
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+    return True
 
 
 class CrossProcessAccountManager:
-    """跨进程账号管理器 - 使用文件锁实现进程间同步"""
+    """跨进程账号管理器 - 使用 SQLite WAL 行级抢占实现进程间同步"""
 
-    def __init__(self, accounts_file: str = None, state_file: str = None):
+    def __init__(self, accounts_file: str = None, state_file: str = None,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
         """
         初始化跨进程账号管理器
 
         Args:
             accounts_file: 账号文件路径
-            state_file: 状态文件路径（用于进程间共享）
+            state_file: 状态库路径（用于进程间共享，扩展名统一为 .db）
+            lease_seconds: 分配租约时长，持有进程崩溃后最迟在租约到期时回收
         """
         if accounts_file is None:
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -31,15 +56,16 @@ class CrossProcessAccountManager:
 
         if state_file is None:
             current_dir = os.path.dirname(os.path.abspath(__file__))
-            state_file = os.path.join(current_dir, "datasets", "accounts_info", "allocation_state.json")
+            state_file = os.path.join(current_dir, "datasets", "accounts_info", "allocation_state.db")
 
         self.accounts_file = accounts_file
-        self.state_file = state_file
-        self.lock_file = state_file + ".lock"
+        self.state_file = os.path.splitext(state_file)[0] + ".db"
+        self.lease_seconds = lease_seconds
         self.accounts = []
+        self._local = threading.local()
 
         self._load_accounts()
-        self._ensure_state_file()
+        self._ensure_state_db()
 
     def _load_accounts(self):
         """从文件加载账号信息"""
@@ -74,69 +100,78 @@ class CrossProcessAccountManager:
             print(f"❌ 加载账号文件失败: {e}")
             self.accounts = []
 
-    def _ensure_state_file(self):
-        """确保状态文件存在"""
-        if not os.path.exists(self.state_file):
-            initial_state = {
-                "device_allocations": {},
-                "last_allocated_index": -1,
-                "created_time": datetime.now().isoformat(),
-                "process_count": 0
-            }
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(initial_state, f, indent=2, ensure_ascii=False)
-
-    def _acquire_lock(self, timeout: float = 0.5) -> Optional[object]:
-        """获取文件锁，使用非阻塞策略"""
-        try:
-            # 创建锁文件
-            lock_fd = os.open(self.lock_file, os.O_CREAT | os.O_WRONLY | os.O_TRUNC)
-
-            # 尝试立即获取锁，不阻塞
-            try:
-                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-                # 成功获取锁
-                return lock_fd
-            except (OSError, IOError):
-                # 如果无法立即获取锁，关闭文件描述符并返回None
-                try:
-                    os.close(lock_fd)
-                except:
-                    pass
-                return None
-
-        except Exception as e:
-            print(f"❌ 创建锁文件失败: {e}")
-            return None
-
-    def _release_lock(self, lock_fd):
-        """释放文件锁"""
+    def _connect(self) -> sqlite3.Connection:
+        """每个进程/线程一个连接（fork 后重新建立）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.state_file, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, func):
+        """在短写事务中执行 func(conn)，BEGIN IMMEDIATE 保证读-改-写原子"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            fcntl.flock(lock_fd, fcntl.LOCK_UN)
-            os.close(lock_fd)
+            result = func(conn)
+            conn.execute("COMMIT")
+            return result
         except Exception:
-            pass
+            conn.execute("ROLLBACK")
+            raise
+
+    def _ensure_state_db(self):
+        """建表并把账号文件同步到状态库（新增账号入库，文件中已删除且未占用的账号移除）"""
+        def sync(conn):
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS accounts (
+                    account_index INTEGER PRIMARY KEY,
+                    username TEXT NOT NULL UNIQUE,
+                    password TEXT NOT NULL,
+                    device_serial TEXT UNIQUE,
+                    owner_pid INTEGER,
+                    lease_until REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accounts_free ON accounts(account_index) "
+                         "WHERE device_serial IS NULL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accounts_lease ON accounts(lease_until) "
+                         "WHERE device_serial IS NOT NULL")
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS file_accounts (account_index INTEGER, "
+                         "username TEXT, password TEXT)")
+            conn.execute("DELETE FROM file_accounts")
+            conn.executemany("INSERT INTO file_accounts VALUES (?, ?, ?)",
+                             [(i, u, p) for i, (u, p) in enumerate(self.accounts)])
+            conn.execute("DELETE FROM accounts WHERE device_serial IS NULL "
+                         "AND username NOT IN (SELECT username FROM file_accounts)")
+            # 账号顺序以文件为准（account_index 用于确定性分配），先整体挪开避免主键冲突
+            conn.execute("UPDATE accounts SET account_index = -account_index - 1")
+            conn.execute("""
+                UPDATE accounts SET
+                    account_index = (SELECT f.account_index FROM file_accounts f WHERE f.username = accounts.username),
+                    password = (SELECT f.password FROM file_accounts f WHERE f.username = accounts.username)
+                WHERE username IN (SELECT username FROM file_accounts)
+            """)
+            conn.execute("INSERT OR IGNORE INTO accounts (account_index, username, password) "
+                         "SELECT account_index, username, password FROM file_accounts")
 
-    def _read_state(self) -> Dict:
-        """读取状态文件"""
-        try:
-            with open(self.state_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return {
-                "device_allocations": {},
-                "last_allocated_index": -1,
-                "created_time": datetime.now().isoformat(),
-                "process_count": 0
-            }
-
-    def _write_state(self, state: Dict):
-        """写入状态文件"""
         try:
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(state, f, indent=2, ensure_ascii=False)
+            self._write(sync)
         except Exception as e:
-            print(f"⚠️ 写入状态文件失败: {e}")
+            print(f"❌ 初始化账号状态库失败: {e}")
+
+    def _claim(self, conn, account_index: int, device_serial: str, now: float) -> int:
+        """条件抢占一行：只有空闲或租约已过期的账号才会被更新"""
+        return conn.execute("""
+            UPDATE accounts SET device_serial = ?, owner_pid = ?, lease_until = ?
+            WHERE account_index = ? AND (device_serial IS NULL OR lease_until < ?)
+        """, (device_serial, os.getpid(), now + self.lease_seconds, account_index, now)).rowcount
 
     def allocate_account(self, device_serial: str) -> Optional[Tuple[str, str]]:
         """
@@ -148,58 +183,64 @@ class CrossProcessAccountManager:
         Returns:
             (username, password) 或 None
         """
-        lock_fd = self._acquire_lock()
-        if lock_fd is None:
-            print(f"❌ 无法获取锁，设备 {device_serial} 账号分配失败")
+        # 确保有可用账号
+        if len(self.accounts) == 0:
+            print(f"❌ 账号列表为空，无法为设备 {device_serial} 分配账号")
             return None
 
-        try:
-            # 读取当前状态
-            state = self._read_state()
-            device_allocations = state.get("device_allocations", {})
-
-            # 如果设备已经分配过账号，静默返回
-            if device_serial in device_allocations:
-                username, password = device_allocations[device_serial]
-                return username, password
-
-            # 确保有可用账号
-            if len(self.accounts) == 0:
-                print(f"❌ 账号列表为空，无法为设备 {device_serial} 分配账号")
-                return None
+        def allocate(conn):
+            now = time.time()
+            # 如果设备已经分配过账号，续租后静默返回
+            row = conn.execute("SELECT account_index, username, password FROM accounts WHERE device_serial = ?",
+                               (device_serial,)).fetchone()
+            if row:
+                conn.execute("UPDATE accounts SET owner_pid = ?, lease_until = ? WHERE account_index = ?",
+                             (os.getpid(), now + self.lease_seconds, row[0]))
+                return (row[1], row[2]), False
 
             # 基于设备序列号确定性分配账号
-            # 使用设备序列号的哈希值对账号数量取模，确保相同设备总是分配到同一个账号
+            # 使用设备序列号的哈希值对账号数量取模，确保相同设备优先分配到同一个账号
             device_hash = sum(ord(c) for c in device_serial)
-            account_index = device_hash % len(self.accounts)
-
-            # 获取对应账号
-            username, password = self.accounts[account_index]
-
-            # 检查该账号是否已被其他设备占用
-            for dev, acc in device_allocations.items():
-                if acc == (username, password):
-                    # 如果账号已被占用，尝试使用下一个可用账号
-                    available_accounts = [acc for acc in self.accounts if acc not in device_allocations.values()]
-                    if not available_accounts:
-                        print(f"❌ 无账号可分配给设备 {device_serial}，当前已分配: {len(device_allocations)}")
-                        return None
-                    username, password = available_accounts[0]
-                    break
-
-            # 更新状态
-            device_allocations[device_serial] = (username, password)
-            state["device_allocations"] = device_allocations
-            state["last_update"] = datetime.now().isoformat()
+            candidates = [device_hash % len(self.accounts)]
+            # 该账号已被占用时，取下一个空闲账号或租约已过期的账号
+            free = conn.execute("SELECT account_index FROM accounts WHERE device_serial IS NULL "
+                                "ORDER BY account_index LIMIT 1").fetchone()
+            if free:
+                candidates.append(free[0])
+            expired = conn.execute("SELECT account_index FROM accounts WHERE device_serial IS NOT NULL "
+                                   "AND lease_until < ? ORDER BY lease_until LIMIT 1", (now,)).fetchone()
+            if expired:
+                candidates.append(expired[0])
+            for account_index in candidates:
+                if self._claim(conn, account_index, device_serial, now):
+                    row = conn.execute("SELECT username, password FROM accounts WHERE account_index = ?",
+                                       (account_index,)).fetchone()
+                    return (row[0], row[1]), True
+
+            # 账号耗尽时回收持有进程已退出（崩溃）的本机分配
+            for account_index, pid in conn.execute(
+                    "SELECT account_index, owner_pid FROM accounts WHERE device_serial IS NOT NULL").fetchall():
+                if not _pid_alive(pid):
+                    conn.execute("UPDATE accounts SET device_serial = NULL, owner_pid = NULL, lease_until = NULL "
+                                 "WHERE account_index = ?", (account_index,))
+                    if self._claim(conn, account_index, device_serial, now):
+                        row = conn.execute("SELECT username, password FROM accounts WHERE account_index = ?",
+                                           (account_index,)).fetchone()
+                        return (row[0], row[1]), True
+            return None, False
 
-            # 写入状态
-            self._write_state(state)
-
-            print(f"✅ 跨进程分配账号: 设备 {device_serial} -> {username}")
-            return username, password
+        try:
+            account, created = self._write(allocate)
+        except Exception as e:
+            print(f"❌ 设备 {device_serial} 账号分配失败: {e}")
+            return None
 
-        finally:
-            self._release_lock(lock_fd)
+        if account is None:
+            print(f"❌ 无账号可分配给设备 {device_serial}")
+            return None
+        if created:
+            print(f"✅ 跨进程分配账号: 设备 {device_serial} -> {account[0]}")
+        return account
 
     def release_account(self, device_serial: str):
         """
@@ -208,30 +249,34 @@ class CrossProcessAccountManager:
         Args:
             device_serial: 设备序列号
         """
-        lock_fd = self._acquire_lock()
-        if lock_fd is None:
-            print(f"❌ 无法获取锁，设备 {device_serial} 账号释放失败")
-            return
+        def release(conn):
+            row = conn.execute("SELECT username FROM accounts WHERE device_serial = ?",
+                               (device_serial,)).fetchone()
+            if row:
+                conn.execute("UPDATE accounts SET device_serial = NULL, owner_pid = NULL, lease_until = NULL "
+                             "WHERE device_serial = ?", (device_serial,))
+            return row[0] if row else None
 
         try:
-            state = self._read_state()
-            device_allocations = state.get("device_allocations", {})
-
-            if device_serial in device_allocations:
-                username, password = device_allocations[device_serial]
-                del device_allocations[device_serial]
-
-                state["device_allocations"] = device_allocations
-                state["last_update"] = datetime.now().isoformat()
-
-                self._write_state(state)
+            username = self._write(release)
+        except Exception as e:
+            print(f"❌ 设备 {device_serial} 账号释放失败: {e}")
+            return
 
-                print(f"✅ 跨进程释放账号: 设备 {device_serial} -> {username}")
-            else:
-                print(f"⚠️ 设备 {device_serial} 没有分配的账号")
+        if username:
+            print(f"✅ 跨进程释放账号: 设备 {device_serial} -> {username}")
+        else:
+            print(f"⚠️ 设备 {device_serial} 没有分配的账号")
 
-        finally:
-            self._release_lock(lock_fd)
+    def renew_lease(self, device_serial: str) -> bool:
+        """为长时间运行的设备续租，返回是否仍持有账号"""
+        try:
+            conn = self._connect()
+            return conn.execute("UPDATE accounts SET owner_pid = ?, lease_until = ? WHERE device_serial = ?",
+                                (os.getpid(), time.time() + self.lease_seconds, device_serial)).rowcount > 0
+        except Exception as e:
+            print(f"⚠️ 设备 {device_serial} 续租失败: {e}")
+            return False
 
     def get_account(self, device_serial: str) -> Optional[Tuple[str, str]]:
         """
@@ -243,16 +288,13 @@ class CrossProcessAccountManager:
         Returns:
             (username, password) 或 None
         """
-        lock_fd = self._acquire_lock()
-        if lock_fd is None:
-            return None
-
         try:
-            state = self._read_state()
-            device_allocations = state.get("device_allocations", {})
-            return device_allocations.get(device_serial)
-        finally:
-            self._release_lock(lock_fd)
+            row = self._connect().execute(
+                "SELECT username, password FROM accounts WHERE device_serial = ? AND lease_until >= ?",
+                (device_serial, time.time())).fetchone()
+            return (row[0], row[1]) if row else None
+        except Exception:
+            return None
 
     def get_allocation_status(self) -> Dict[str, str]:
         """
@@ -261,53 +303,38 @@ class CrossProcessAccountManager:
         Returns:
             {device_serial: username, ...}
         """
-        lock_fd = self._acquire_lock()
-        if lock_fd is None:
-            return {}
-
         try:
-            state = self._read_state()
-            device_allocations = state.get("device_allocations", {})
-            return {device: allocation[0] for device, allocation in device_allocations.items()}
-        finally:
-            self._release_lock(lock_fd)
+            rows = self._connect().execute(
+                "SELECT device_serial, username FROM accounts WHERE device_serial IS NOT NULL "
+                "AND lease_until >= ?", (time.time(),)).fetchall()
+            return {device: username for device, username in rows}
+        except Exception:
+            return {}
 
     def get_available_accounts_count(self) -> int:
         """
-        获取可用账号数量
+        获取可用账号数量（空闲 + 租约已过期）
 
         Returns:
             可用账号数量
         """
-        lock_fd = self._acquire_lock()
-        if lock_fd is None:
-            return 0
-
         try:
-            state = self._read_state()
-            device_allocations = state.get("device_allocations", {})
-            return len(self.accounts) - len(device_allocations)
-        finally:
-            self._release_lock(lock_fd)
+            row = self._connect().execute(
+                "SELECT COUNT(*) FROM accounts WHERE device_serial IS NULL OR lease_until < ?",
+                (time.time(),)).fetchone()
+            return row[0] if row else 0
+        except Exception:
+            return 0
 
     def clear_all_allocations(self):
         """清空所有分配（用于测试和重置）"""
-        lock_fd = self._acquire_lock()
-        if lock_fd is None:
-            print("❌ 无法获取锁，清空分配失败")
-            return
-
         try:
-            state = self._read_state()
-            state["device_allocations"] = {}
-            state["last_allocated_index"] = -1
-            state["last_update"] = datetime.now().isoformat()
-
-            self._write_state(state)
+            self._write(lambda conn: conn.execute(
+                "UPDATE accounts SET device_serial = NULL, owner_pid = NULL, lease_until = NULL "
+                "WHERE device_serial IS NOT NULL"))
             print("✅ 已清空所有账号分配")
-
-        finally:
-            self._release_lock(lock_fd)
+        except Exception as e:
+            print(f"❌ 清空分配失败: {e}")
 
 
 # 全局跨进程账号管理器实例
@@ -322,7 +349,65 @@ def get_cross_process_account_manager() -> CrossProcessAccountManager:
     return _cross_process_account_manager
 
 
+def _benchmark_worker(args):
+    accounts_file, state_file, worker_id, rounds = args
+    # 屏蔽逐次分配日志，避免输出本身影响测量
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    manager = CrossProcessAccountManager(accounts_file, state_file)
+    latencies = []
+    for round_no in range(rounds):
+        serial = f"bench_{worker_id}_{round_no}"
+        started = time.perf_counter()
+        account = manager.allocate_account(serial)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if account:
+            manager.release_account(serial)
+    return latencies, account is not None
+
+
+def benchmark_allocation(processes: int = 50, rounds: int = 20, accounts: int = 100) -> Dict[str, float]:
+    """
+    多进程压力测试：processes 个进程同时反复分配/释放，统计单次分配延迟（毫秒）
+    使用临时账号文件与状态库，不影响正式数据
+    """
+    import tempfile
+    import statistics
+    from multiprocessing import Pool
+
+    work_dir = tempfile.mkdtemp(prefix="account_bench_")
+    accounts_file = os.path.join(work_dir, "accounts.txt")
+    state_file = os.path.join(work_dir, "allocation_state.db")
+    with open(accounts_file, "w", encoding="utf-8") as f:
+        f.writelines(f"bench_user_{i},pwd_{i}\n" for i in range(accounts))
+    CrossProcessAccountManager(accounts_file, state_file)
+
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        results = pool.map(_benchmark_worker,
+                           [(accounts_file, state_file, i, rounds) for i in range(processes)])
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for worker_latencies, _ in results for ms in worker_latencies)
+    report = {
+        "processes": processes,
+        "allocations": len(latencies),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max_ms": latencies[-1],
+        "throughput_per_s": len(latencies) / elapsed,
+    }
+    print("📊 分配延迟: " + ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                                    for k, v in report.items()))
+    return report
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        # python cross_process_account_manager.py --bench [进程数] [每进程轮数]
+        benchmark_allocation(*(int(a) for a in sys.argv[2:4]))
+        sys.exit(0)
+
     # 测试代码
     print("=== 跨进程账号管理器测试 ===")
 
@@ -7,9 +7,16 @@ import time
 import threading
 import hashlib
 import json
+from collections import deque
 from typing import Dict, Tuple, List, Optional, Any
 import logging
 
+# 与 replay_script / ui_hierarchy_provider 一致优先按裸模块名导入，保证进程内只有一个门控实例
+try:
+    from frame_change_gate import FrameChangeGate, get_frame_change_gate
+except ImportError:
+    from apps.scripts.frame_change_gate import FrameChangeGate, get_frame_change_gate
+
 # 导入项目监控
 try:
     import sys
@@ -23,6 +30,7 @@ try:
 
     # 导入非Django项目监控API（避免Django环境依赖）
     from apps.project_monitor.django_api import log_ai_execution_sync as log_ai_execution
+    from apps.project_monitor.django_api import log_ai_executions_bulk_sync as log_ai_executions_bulk
     PROJECT_MONITOR_ENABLED = True
     print("✅ 项目监控集成已启用（非Django模式）")
 except ImportError as e:
@@ -33,67 +41,71 @@ except ImportError as e:
         """占位符函数：项目监控不可用时的替代函数"""
         return False
 
+    def log_ai_executions_bulk(records) -> int:
+        """占位符函数：项目监控不可用时的替代函数"""
+        return 0
+
+# 单条检测记录最多尝试写入的 flush 次数，超过后丢弃
+MAX_RECORD_ATTEMPTS = 3
+
 
 class DetectionResultCache:
-    """检测结果缓存管理器 - 延迟数据库写入"""
+    """
+    检测结果缓存管理器 - 延迟数据库写入
+    固定容量环形缓冲：追加与取出均为 O(1)，写满时覆盖最旧记录并计入丢弃数；
+    flush 一次取走全部记录，整批交给项目监控的批量写入接口。
+    """
 
     def __init__(self, max_cache_size: int = 10000, hard_limit_size: int = 15000):
-        self.detection_results: List[Dict] = []
-        self.lock = threading.RLock()
         self.max_cache_size = max_cache_size
-        self.hard_limit_size = hard_limit_size  # 硬限制，防止内存溢出
+        self.hard_limit_size = hard_limit_size  # 环形缓冲容量，防止内存溢出
+        self.detection_results = deque(maxlen=hard_limit_size)
+        self.lock = threading.RLock()
         self.is_flushing = threading.Event()
-        self.emergency_flush_threshold = int(hard_limit_size * 0.9)  # 紧急flush阈值
+        self.emergency_flush_threshold = max_cache_size  # 达到后在后台触发flush
+        self.dropped_count = 0
+        self.failed_count = 0  # 逐条重写仍失败、超过重试次数后丢弃的记录数
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
 
     def add_detection(self, project_name: str, button_class: str, success: bool,
                      scenario: str, detection_time_ms: int, coordinates: Optional[Tuple],
                      screenshot_path: str, device_id: str):
-        """缓存检测结果，延迟写入数据库"""        # 等待之前的刷新操作完成
-        if self.is_flushing.is_set():
-            print("⏳ 等待数据库写入完成...")
-            self.is_flushing.wait(timeout=30)
-
+        """缓存检测结果，延迟写入数据库（flush 进行中也不阻塞）"""
+        record = {
+            'project_name': project_name,
+            'button_class': button_class,
+            'success': success,
+            'scenario': scenario,
+            'detection_time_ms': detection_time_ms,
+            'coordinates': coordinates,
+            'screenshot_path': screenshot_path or "",
+            'device_id': device_id or "",
+            'timestamp': time.time(),
+            'thread_id': threading.current_thread().ident
+        }
         with self.lock:
+            if len(self.detection_results) >= self.hard_limit_size:
+                # 环形缓冲已满，追加时自动覆盖最旧的一条
+                self.dropped_count += 1
+                if self.dropped_count % 1000 == 1:
+                    print(f"🚨 检测缓存已满 ({self.hard_limit_size})，覆盖最旧记录 (累计丢弃: {self.dropped_count})")
+            self.detection_results.append(record)
             current_size = len(self.detection_results)
+            need_flush = current_size >= self.emergency_flush_threshold and not self.is_flushing.is_set()
 
-            # 硬限制检查 - 防止内存溢出
-            if current_size >= self.hard_limit_size:
-                print(f"🚨 缓存达到硬限制 ({current_size})，强制清理一半数据")
-                clear_count = current_size // 2
-                self.detection_results = self.detection_results[clear_count:]
-                current_size = len(self.detection_results)
-
-            # 紧急flush检查
-            elif current_size >= self.emergency_flush_threshold:
-                print(f"⚠️ 缓存接近限制 ({current_size})，触发紧急flush")
-                # 在后台线程中触发flush，避免阻塞
-                threading.Thread(target=self._emergency_flush, daemon=True).start()
-
-            # 正常缓存大小检查
-            elif current_size >= self.max_cache_size:
-                print(f"⚠️ 检测缓存已满 ({current_size})，清理最旧的一半数据")
-                clear_count = current_size // 2
-                self.detection_results = self.detection_results[clear_count:]
-
-            self.detection_results.append({
-                'project_name': project_name,
-                'button_class': button_class,
-                'success': success,
-                'scenario': scenario,
-                'detection_time_ms': detection_time_ms,
-                'coordinates': coordinates,
-                'screenshot_path': screenshot_path or "",
-                'device_id': device_id or "",
-                'timestamp': time.time(),
-                'thread_id': threading.current_thread().ident
-            })
+        if need_flush:
+            print(f"⚠️ 缓存接近限制 ({current_size})，触发紧急flush")
+            # 在后台线程中触发flush，避免阻塞
+            threading.Thread(target=self._emergency_flush, daemon=True).start()
 
         print(f"📊 已缓存检测记录: {project_name}.{button_class} - "
               f"{'成功' if success else '失败'} - {detection_time_ms}ms "
-              f"(缓存总数: {len(self.detection_results)})")
+              f"(缓存总数: {current_size})")
 
     def get_cache_stats(self) -> Dict:
-        """获取缓存统计信息"""
+        """获取缓存统计信息（含丢弃数与flush耗时）"""
         with self.lock:
             total = len(self.detection_results)
             success_count = sum(1 for r in self.detection_results if r['success'])
@@ -102,11 +114,66 @@ class DetectionResultCache:
                 'total_cached': total,
                 'success_count': success_count,
                 'failure_count': total - success_count,
-                'success_rate': (success_count / total * 100) if total > 0 else 0
+                'success_rate': (success_count / total * 100) if total > 0 else 0,
+                'capacity': self.hard_limit_size,
+                'dropped_count': self.dropped_count,
+                'failed_count': self.failed_count,
+                'flush_count': self.flush_count,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+                'avg_flush_ms': round(self.total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0
             }
 
+    def _drain(self) -> List[Dict]:
+        """取走缓冲中的全部记录"""
+        with self.lock:
+            batch = list(self.detection_results)
+            self.detection_results.clear()
+            return batch
+
+    def _requeue(self, batch: List[Dict]):
+        """写入失败的记录放回缓冲头部，容量不足时丢弃其中最旧的部分"""
+        with self.lock:
+            room = self.hard_limit_size - len(self.detection_results)
+            keep = batch[-room:] if room > 0 else []
+            self.dropped_count += len(batch) - len(keep)
+            self.detection_results.extendleft(reversed(keep))
+
+    def _write_one_by_one(self, batch: List[Dict]) -> int:
+        """
+        批量写入失败后逐条写入，隔离出无法写入的记录：
+        失败记录累计尝试次数，未超过 MAX_RECORD_ATTEMPTS 时放回缓冲，超过则丢弃并计入 failed_count，
+        避免单条异常记录让后续每次 flush 都整批失败
+        """
+        written = 0
+        retry = []
+        for record in batch:
+            try:
+                ok = log_ai_execution(**self._db_fields(record))
+            except Exception:
+                ok = False
+            if ok:
+                written += 1
+                continue
+            record['attempts'] = record.get('attempts', 0) + 1
+            if record['attempts'] < MAX_RECORD_ATTEMPTS:
+                retry.append(record)
+            else:
+                with self.lock:
+                    self.failed_count += 1
+        if retry:
+            self._requeue(retry)
+        discarded = len(batch) - written - len(retry)
+        if discarded:
+            print(f"🚨 {discarded} 条检测记录重试 {MAX_RECORD_ATTEMPTS} 次仍写入失败，已丢弃 (累计: {self.failed_count})")
+        return written
+
+    @staticmethod
+    def _db_fields(record: Dict) -> Dict:
+        """去掉缓存内部字段，得到与 log_ai_execution 参数同名的字典"""
+        return {k: v for k, v in record.items() if k not in ('timestamp', 'thread_id', 'attempts')}
+
     def flush_to_database(self):
-        """批量写入数据库 - 修复数据丢失风险"""
+        """整批写入数据库；整批失败时逐条写入，仍失败的记录有限次放回缓冲"""
         with self.lock:
             if not self.detection_results:
                 print("📊 没有待写入的检测记录")
@@ -118,53 +185,35 @@ class DetectionResultCache:
                 return 0
 
             self.is_flushing.set()
-            try:
-                # 创建数据副本，但保留原始数据直到成功写入
-                results_to_flush = self.detection_results.copy()
-                print(f"📊 开始批量写入 {len(results_to_flush)} 条检测记录到数据库")
-
-            except Exception as e:
-                self.is_flushing.clear()
-                print(f"❌ 准备flush数据时出错: {e}")
-                return 0
-
-        # 在锁外进行数据库操作，避免长时间占用锁
-        success_count = 0
-        error_count = 0
-        successful_results = []
+            results_to_flush = self._drain()
 
+        print(f"📊 开始批量写入 {len(results_to_flush)} 条检测记录到数据库")
+        # 在锁外进行数据库操作，flush期间新的检测记录照常写入缓冲
+        started = time.perf_counter()
+        written = 0
         try:
             if PROJECT_MONITOR_ENABLED:
-                for result in results_to_flush:
-                    try:
-                        # 移除不需要的字段
-                        db_result = {k: v for k, v in result.items()
-                                   if k not in ['timestamp', 'thread_id']}
-                        log_ai_execution(**db_result)
-                        success_count += 1
-                        successful_results.append(result)
-                    except Exception as e:
-                        error_count += 1
-                        print(f"⚠️ 单条记录写入失败: {e}")
+                try:
+                    written = log_ai_executions_bulk([self._db_fields(r) for r in results_to_flush])
+                except Exception as e:
+                    print(f"❌ 批量写入数据库失败，改为逐条写入: {e}")
+                    written = self._write_one_by_one(results_to_flush)
             else:
                 print("⚠️ 项目监控未启用，跳过数据库写入")
-                successful_results = results_to_flush  # 未启用时视为全部成功
-
+                written = len(results_to_flush)  # 未启用时视为全部成功
         except Exception as e:
-            print(f"❌ 批量写入数据库失败: {e}")
+            print(f"❌ 写入数据库失败: {e}")
+            self._requeue(results_to_flush)
         finally:
-            # 只有在数据成功写入后才从缓存中移除
-            if successful_results:
-                with self.lock:
-                    # 安全地移除已成功写入的记录
-                    for result in successful_results:
-                        if result in self.detection_results:
-                            self.detection_results.remove(result)
-
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.flush_count += 1
+                self.last_flush_ms = elapsed_ms
+                self.total_flush_ms += elapsed_ms
             self.is_flushing.clear()
 
-        print(f"✅ 批量写入完成: 成功 {success_count} 条, 失败 {error_count} 条")
-        return success_count
+        print(f"✅ 批量写入完成: 写入 {written}/{len(results_to_flush)} 条, 耗时 {elapsed_ms:.1f}ms")
+        return written
 
     def _emergency_flush(self):
         """紧急刷新 - 在后台线程中执行，防止内存溢出"""
@@ -183,65 +232,27 @@ class UnifiedDetectionManager:
     """统一检测管理器 - 避免重复调用"""
 
     def __init__(self, cache_duration: float = 2.0, max_cache_size: int = 1000):
-        self.recent_detections: Dict[str, Tuple[Any, float]] = {}
+        self.recent_detections: Dict[str, Tuple[Any, float, Any]] = {}
         self.cache_duration = cache_duration
+        self.frame_gate = FrameChangeGate(max_reuse_seconds=cache_duration)
         self.max_cache_size = max_cache_size
         self.lock = threading.RLock()
         self.call_count = 0
         self.total_calls = 0
         self.cache_hits = 0
 
-    def _get_frame_hash(self, frame) -> str:
-        """优化的帧哈希算法 - 提高高分辨率图像处理性能"""
-        if frame is None:
-            return "none"
-
+    def _get_frame_signature(self, frame):
+        """帧签名（缩略灰度图），按容忍度比较而非精确哈希，避免稀疏采样导致的误命中"""
         try:
-            h, w = frame.shape[:2]
-            if h == 0 or w == 0:
-                return "empty"
-
-            # 优化策略：对于大图像，先缩小再计算特征
-            if h > 200 or w > 200:
-                # 缩小图像以提高性能
-                scale_factor = min(200 / h, 200 / w)
-                import cv2
-                new_h, new_w = int(h * scale_factor), int(w * scale_factor)
-                frame = cv2.resize(frame, (new_w, new_h))
-                h, w = new_h, new_w
-
-            # 使用更高效的采样策略
-            step_h, step_w = max(1, h // 8), max(1, w // 8)
-            features = []
-
-            # 只取8个关键点，降低计算复杂度
-            sample_points = min(8, (h // step_h) * (w // step_w))
-            count = 0
-
-            for i in range(0, h, step_h):
-                for j in range(0, w, step_w):
-                    if count >= sample_points:
-                        break
-                    if i < h and j < w:
-                        # 使用整数计算避免浮点运算
-                        pixel_val = int(frame[i, j].mean()) if len(frame.shape) > 2 else int(frame[i, j])
-                        features.append(str(pixel_val))
-                        count += 1
-                if count >= sample_points:
-                    break
-
-            # 生成哈希
-            feature_str = "_".join(features)
-            return hashlib.md5(feature_str.encode()).hexdigest()[:8]
-
+            return self.frame_gate.signature(frame)
         except Exception as e:
-            print(f"⚠️ 帧哈希计算失败: {e}")
-            return f"error_{int(time.time())}"
+            print(f"⚠️ 帧签名计算失败: {e}")
+            return None
 
-    def _get_cache_key(self, target_class: str, device_id: str, frame_hash: str) -> str:
-        """生成安全的缓存键 - 修复键冲突风险"""
+    def _get_cache_key(self, target_class: str, device_id: str) -> str:
+        """生成安全的缓存键 - 修复键冲突风险（每个类别/设备保留最近一次结果）"""
         # 使用更安全的分隔符和哈希方式避免键冲突
-        key_parts = [target_class or "unknown", device_id or "default", frame_hash or "empty"]
+        key_parts = [target_class or "unknown", device_id or "default"]
         # 使用管道符分隔符，降低冲突概率
         combined_key = "|".join(key_parts)
         # 对组合键进行哈希，确保键长度一致且避免特殊字符
@@ -250,7 +261,7 @@ class UnifiedDetectionManager:
     def _cleanup_expired_cache(self, current_time: float):
         """清理过期缓存"""
         expired_keys = [
-            key for key, (_, timestamp) in self.recent_detections.items()
+            key for key, (_, timestamp, _) in self.recent_detections.items()
             if current_time - timestamp >= self.cache_duration
         ]
 
@@ -273,8 +284,8 @@ class UnifiedDetectionManager:
     def should_skip_detection(self, frame, target_class: str, device_id: str) -> Tuple[bool, Any]:
         """检查是否应该跳过检测（返回缓存结果）"""
         current_time = time.time()
-        frame_hash = self._get_frame_hash(frame)
-        cache_key = self._get_cache_key(target_class, device_id or "unknown", frame_hash)
+        signature = self._get_frame_signature(frame)
+        cache_key = self._get_cache_key(target_class, device_id or "unknown")
 
         with self.lock:
             self.total_calls += 1
@@ -282,10 +293,11 @@ class UnifiedDetectionManager:
             # 清理过期缓存
             self._cleanup_expired_cache(current_time)
 
-            # 检查缓存
+            # 检查缓存：签名在容忍度内才视为同一画面
             if cache_key in self.recent_detections:
-                cached_result, cached_time = self.recent_detections[cache_key]
-                if current_time - cached_time < self.cache_duration:
+                cached_result, cached_time, cached_signature = self.recent_detections[cache_key]
+                if (current_time - cached_time < self.cache_duration
+                        and self.frame_gate.is_same(cached_signature, signature)):
                     self.cache_hits += 1
                     print(f"🔄 使用缓存结果: {target_class} @ {device_id} "
                           f"(缓存命中率: {self.cache_hits/self.total_calls*100:.1f}%)")
@@ -296,11 +308,13 @@ class UnifiedDetectionManager:
     def cache_detection_result(self, frame, target_class: str, device_id: str, result: Any):
         """缓存检测结果"""
         current_time = time.time()
-        frame_hash = self._get_frame_hash(frame)
-        cache_key = self._get_cache_key(target_class, device_id or "unknown", frame_hash)
+        signature = self._get_frame_signature(frame)
+        if signature is None:
+            return
+        cache_key = self._get_cache_key(target_class, device_id or "unknown")
 
         with self.lock:
-            self.recent_detections[cache_key] = (result, current_time)
+            self.recent_detections[cache_key] = (result, current_time, signature)
 
     def get_stats(self) -> Dict:
         """获取统计信息"""
@@ -366,6 +380,7 @@ def get_detection_stats() -> Dict:
     return {
         'cache_stats': detection_cache.get_cache_stats(),
         'manager_stats': detection_manager.get_stats(),
+        'frame_gate_stats': get_frame_change_gate().stats(),
         'resource_status': 'normal'  # 可以扩展更多状态信息
     }
 
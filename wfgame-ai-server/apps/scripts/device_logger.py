@@ -6,17 +6,178 @@
 2. 日志中严格只输出纯文本，将截图、二进制流先做Base64或存文件
 3. 显式指定encoding='utf-8'，避免编码问题
 4. 提供线程/进程安全的日志处理机制
+5. 日志写入由后台线程异步完成：每个日志文件只打开一次，按大小/时间批量刷盘，
+   回放线程只负责入队，磁盘卡顿不会阻塞回放；进程退出时保证写完
 """
 
 import os
 import sys
 import json
 import time
+import queue
+import atexit
 import base64
 import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Union, Any
+from typing import Dict, Iterable, Optional, Union, Any
+
+# 日志队列容量（条），写满后入队最多等待 LOG_PUT_TIMEOUT 秒，仍满则丢弃并计数
+LOG_QUEUE_SIZE = 10000
+LOG_PUT_TIMEOUT = 1.0
+# 刷盘策略：单个文件累计未刷盘字节数达到阈值，或距上次刷盘超过间隔
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 0.5
+
+
+class _BufferedLogWriter:
+    """
+    进程内共享的异步日志写入器
+    - 有界队列 + 单个后台写线程，调用方入队后立即返回；
+    - 每个日志文件保持一个打开的句柄，不再每行 open/close；
+    - 按大小/时间刷盘，ERROR 日志所在文件写入后立即刷盘；
+    - flush() 等待此前入队的日志全部落盘，进程退出时自动执行。
+    """
+
+    def __init__(self, max_queue: int = LOG_QUEUE_SIZE, flush_bytes: int = LOG_FLUSH_BYTES,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, put_timeout: float = LOG_PUT_TIMEOUT):
+        self.max_queue = max_queue
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """初始化队列与句柄（fork 出的子进程没有写线程，需重新初始化）"""
+        self._pid = os.getpid()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._handles: Dict[Path, Any] = {}
+        self._unflushed: Dict[Path, int] = {}
+        self._last_flush = time.monotonic()
+        # 设备 -> {"queued": 队列中待写条数, "written": 已写条数, "dropped": 丢弃条数}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="device-log-writer", daemon=True)
+            self._thread.start()
+
+    def _device_stats(self, device: str) -> Dict[str, int]:
+        stats = self._stats.get(device)
+        if stats is None:
+            stats = self._stats[device] = {"queued": 0, "written": 0, "dropped": 0}
+        return stats
+
+    def write(self, device: str, file_path: Path, content: str, urgent: bool = False):
+        """入队一条日志，队列持续写满时丢弃并计数"""
+        with self._lock:
+            self._ensure_thread()
+            self._device_stats(device)["queued"] += 1
+        try:
+            self._queue.put(("write", device, Path(file_path), content, urgent), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                stats = self._device_stats(device)
+                stats["queued"] -= 1
+                stats["dropped"] += 1
+            sys.stderr.write(f"[LOG_ERROR] 日志队列已满，丢弃 {device} 日志: {content[:100]!r}\n")
+
+    def flush(self, close_paths: Optional[Iterable[Path]] = None, timeout: Optional[float] = 10.0) -> bool:
+        """等待此前入队的日志全部落盘；close_paths 中的文件随后关闭句柄"""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return True
+            self._ensure_thread()
+        done = threading.Event()
+        paths = [Path(p) for p in close_paths or ()]
+        try:
+            self._queue.put(("flush", done, paths), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各设备的队列深度与写入/丢弃计数"""
+        with self._lock:
+            return {device: dict(values) for device, values in self._stats.items()}
+
+    def _handle(self, file_path: Path):
+        handle = self._handles.get(file_path)
+        if handle is None:
+            handle = self._handles[file_path] = open(file_path, 'a', encoding='utf-8', errors='replace')
+        return handle
+
+    def _flush_files(self, paths: Optional[Iterable[Path]] = None):
+        for file_path in list(paths if paths is not None else self._unflushed):
+            handle = self._handles.get(file_path)
+            try:
+                if handle is not None:
+                    handle.flush()
+            except Exception as e:
+                sys.stderr.write(f"[LOG_ERROR] 刷新 {file_path} 失败: {e}\n")
+            self._unflushed.pop(file_path, None)
+        if paths is None:
+            self._last_flush = time.monotonic()
+
+    def _close_files(self, paths: Iterable[Path]):
+        for file_path in paths:
+            handle = self._handles.pop(file_path, None)
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+
+    def _write(self, device: str, file_path: Path, content: str, urgent: bool):
+        try:
+            self._handle(file_path).write(content)
+            self._unflushed[file_path] = self._unflushed.get(file_path, 0) + len(content)
+            if urgent or self._unflushed[file_path] >= self.flush_bytes:
+                self._flush_files([file_path])
+        except Exception as e:
+            # 如果日志文件写入失败，fallback到stderr，并丢弃句柄以便下次重新打开
+            self._close_files([file_path])
+            self._unflushed.pop(file_path, None)
+            try:
+                sys.stderr.write(f"[LOG_ERROR] 写入 {file_path} 失败: {e}, 内容: {repr(content)[:100]}\n")
+                sys.stderr.flush()
+            except Exception:
+                pass
+        with self._lock:
+            stats = self._device_stats(device)
+            stats["queued"] -= 1
+            stats["written"] += 1
+
+    def _run(self):
+        while True:
+            timeout = max(0.0, self._last_flush + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout if self._unflushed else None)
+            except queue.Empty:
+                self._flush_files()
+                continue
+            if item[0] == "write":
+                self._write(*item[1:])
+            else:
+                _, done, close_paths = item
+                self._flush_files()
+                self._close_files(close_paths)
+                done.set()
+            if self._unflushed and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_files()
+
+
+_log_writer = _BufferedLogWriter()
+
+
+@atexit.register
+def _drain_device_logs():
+    """进程退出时写完队列中的全部日志"""
+    _log_writer.flush(timeout=30.0)
 
 
 class DeviceLogger:
@@ -74,26 +235,24 @@ class DeviceLogger:
             f"=== 设备 {self.device_serial} 日志初始化 ===\n{json.dumps(init_info, ensure_ascii=False, indent=2)}\n"
         )
 
-    def _write_to_file(self, file_path: Path, content: str):
+    def _write_to_file(self, file_path: Path, content: str, urgent: bool = False):
         """
-        安全写入文件，确保UTF-8编码
+        异步写入文件（UTF-8），由后台写线程落盘
 
         Args:
             file_path: 文件路径
             content: 要写入的内容
+            urgent: 写入后立即刷盘（用于错误日志）
         """
-        try:
-            with open(file_path, 'a', encoding='utf-8', errors='replace') as f:
-                f.write(content)
-                f.flush()  # 确保立即写入磁盘
-        except Exception as e:
-            # 如果日志文件写入失败，fallback到stderr
-            try:
-                safe_content = repr(content)  # 确保内容可以安全输出
-                sys.stderr.write(f"[LOG_ERROR] 写入 {file_path} 失败: {e}, 内容: {safe_content[:100]}\n")
-                sys.stderr.flush()
-            except:
-                pass  # 最后的防线，避免任何异常导致程序崩溃
+        _log_writer.write(self.device_serial, file_path, content, urgent)
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """等待本进程已入队的日志全部落盘"""
+        return _log_writer.flush(timeout=timeout)
+
+    def queue_depth(self) -> int:
+        """本设备在写入队列中尚未落盘的日志条数"""
+        return _log_writer.stats().get(self.device_serial, {}).get("queued", 0)
 
     def _safe_format_data(self, data: Any) -> str:
         """
@@ -192,10 +351,10 @@ class DeviceLogger:
 
                 # 写入对应的日志文件
                 if level == "ERROR":
-                    self._write_to_file(self.error_log_file, log_entry)
+                    self._write_to_file(self.error_log_file, log_entry, urgent=True)
 
                 # 所有日志都写入console.log
-                self._write_to_file(self.console_log_file, log_entry)
+                self._write_to_file(self.console_log_file, log_entry, urgent=level == "ERROR")
 
             except Exception as e:
                 # 日志记录失败时的fallback
@@ -247,7 +406,7 @@ class DeviceLogger:
             return ""
 
     def close(self):
-        """关闭日志器，写入结束信息"""
+        """关闭日志器，写入结束信息并等待落盘后关闭文件句柄"""
         end_info = {
             "device_serial": self.device_serial,
             "process_id": self.process_id,
@@ -263,6 +422,7 @@ class DeviceLogger:
             self.console_log_file,
             f"\n=== 设备 {self.device_serial} 日志结束 ===\n{json.dumps(end_info, ensure_ascii=False, indent=2)}\n"
         )
+        _log_writer.flush(close_paths=[self.console_log_file, self.error_log_file])
 
 
 class DeviceLoggerManager:
@@ -349,6 +509,11 @@ def close_all_device_loggers():
     _device_logger_manager.close_all()
 
 
+def device_logger_stats() -> Dict[str, Dict[str, int]]:
+    """各设备日志的队列深度（queued）、已写入（written）与丢弃（dropped）条数"""
+    return _log_writer.stats()
+
+
 # 工具函数：安全的subprocess调用，确保UTF-8编码
 def safe_subprocess_run(cmd, **kwargs):
     """
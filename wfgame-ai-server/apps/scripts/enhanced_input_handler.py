@@ -38,6 +38,19 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from multiprocessing import Process
 
+try:
+    from ui_tree import elements_of_classes, get_ui_tree
+except ImportError:
+    from apps.scripts.ui_tree import elements_of_classes, get_ui_tree
+
+try:
+    from ui_hierarchy_provider import get_ui_hierarchy_provider
+except ImportError:
+    try:
+        from apps.scripts.ui_hierarchy_provider import get_ui_hierarchy_provider
+    except ImportError:
+        get_ui_hierarchy_provider = None
+
 
 class ElementPatterns:
     """UI元素模式定义"""
@@ -229,6 +242,10 @@ class DeviceScriptReplayer:
             success = result.returncode == 0
             output = result.stdout if success else result.stderr
 
+            # 输入操作会改变界面，丢弃缓存的UI层次结构
+            if command[:2] == ["shell", "input"] and get_ui_hierarchy_provider:
+                get_ui_hierarchy_provider(self.device_serial).invalidate()
+
             if not success:
                 print(f"ADB命令执行失败: {' '.join(full_command)}")
                 print(f"错误输出: {output}")
@@ -242,9 +259,23 @@ class DeviceScriptReplayer:
             print(f"执行ADB命令时出错: {e}")
             return False, str(e)
 
-    def get_ui_hierarchy(self) -> Optional[str]:
+    def get_ui_hierarchy(self, force: bool = False) -> Optional[str]:
+        """
+        获取UI层次结构XML - 画面未变化且无输入操作时复用缓存，
+        否则经 exec-out 流式 dump；设备不支持时回退到文件 dump + pull
+
+        Args:
+            force: 忽略缓存，强制重新获取
+        """
+        if get_ui_hierarchy_provider is None:
+            return self._dump_ui_hierarchy_via_file()
+        return get_ui_hierarchy_provider(self.device_serial).get(
+            fallback=self._dump_ui_hierarchy_via_file, force=force
+        )
+
+    def _dump_ui_hierarchy_via_file(self) -> Optional[str]:
         """
-        获取UI层次结构XML - 使用增强的设备兼容性
+        获取UI层次结构XML - 使用增强的设备兼容性（dump 到设备文件后拉取）
         """
         print("📱 获取UI层次结构...")
 
@@ -373,95 +404,13 @@ class DeviceScriptReplayer:
             return False
 
     def _parse_ui_xml(self, xml_content: str) -> List[Dict[str, Any]]:
-        """解析UI XML，返回元素列表 - 增强版本，兼容通用UI检测器"""
-        elements = []
+        """解析UI XML，返回元素列表 - 同一份XML只解析一次，列表附带类别索引（ui_tree.UiTree）"""
         try:
-            root = ET.fromstring(xml_content)
-
-            # 使用通用UI检测器的解析逻辑
-            if self.ui_detector:
-                # 创建临时文件用于通用检测器解析
-                import tempfile
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False, encoding='utf-8') as temp_file:
-                    temp_file.write(xml_content)
-                    temp_path = temp_file.name
-
-                try:
-                    # 使用通用检测器的解析方法
-                    ui_structure = self.ui_detector.parse_ui_hierarchy(temp_path)
-
-                    # 转换为回放系统期望的格式
-                    if ui_structure and ui_structure.get('elements'):
-                        for elem in ui_structure['elements']:
-                            element_info = {
-                                'text': elem.get('text', ''),
-                                'hint': '',  # 通用检测器不提取hint
-                                'resource_id': elem.get('resource_id', ''),
-                                'class': elem.get('class', ''),
-                                'content_desc': elem.get('content_desc', ''),
-                                'bounds': elem.get('bounds', ''),
-                                'clickable': elem.get('clickable', False),
-                                'focusable': True,  # 假设可交互元素都是可聚焦的
-                                'focused': elem.get('focused', False),
-                                'enabled': elem.get('enabled', True),
-                                'password': False,  # 通用检测器暂不检测密码字段
-                                'checkable': False,  # 通用检测器暂不检测checkable
-                                'checked': False,
-                                'scrollable': elem.get('scrollable', False),
-                                'package': elem.get('package', ''),
-                            }
-                            elements.append(element_info)
-
-                        print(f"✅ 使用通用检测器解析到 {len(elements)} 个元素")
-                        return elements
-
-                except Exception as e:
-                    print(f"⚠️ 通用检测器解析失败: {e}，使用传统解析方法")
-                finally:
-                    # 清理临时文件
-                    try:
-                        os.unlink(temp_path)
-                    except Exception:
-                        pass
-
-            # 回退到传统解析方法
-            print("🔄 使用传统XML解析方法...")
-            for element in root.iter():
-                # 跳过非节点元素
-                if not hasattr(element, 'get'):
-                    continue
-
-                # 只处理有意义的UI元素
-                class_name = element.get('class', '')
-                text = element.get('text', '').strip()
-                clickable = element.get('clickable', 'false').lower() == 'true'
-
-                # 优化：只保留有用的元素
-                if not (text or clickable or 'EditText' in class_name or 'Button' in class_name):
-                    continue
-
-                element_info = {
-                    'text': text,
-                    'hint': element.get('hint', ''),
-                    'resource_id': element.get('resource-id', ''),
-                    'class': class_name,
-                    'content_desc': element.get('content-desc', ''),
-                    'bounds': element.get('bounds', ''),
-                    'clickable': clickable,
-                    'focusable': element.get('focusable', 'false').lower() == 'true',
-                    'focused': element.get('focused', 'false').lower() == 'true',
-                    'enabled': element.get('enabled', 'false').lower() == 'true',
-                    'password': element.get('password', 'false').lower() == 'true',
-                    'checkable': element.get('checkable', 'false').lower() == 'true',
-                    'checked': element.get('checked', 'false').lower() == 'true',
-                    'scrollable': element.get('scrollable', 'false').lower() == 'true',
-                    'package': element.get('package', ''),
-                }
-                elements.append(element_info)
-
+            elements = get_ui_tree(xml_content).element_list()
         except ET.ParseError as e:
             print(f"❌ XML解析失败: {e}")
-            print(f"✅ 传统方法解析到 {len(elements)} 个元素")
+            return []
+        print(f"✅ 解析到 {len(elements)} 个元素")
         return elements
 
     def find_username_field(self, elements: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
@@ -473,59 +422,58 @@ class DeviceScriptReplayer:
         # 增强策略1：优先级匹配 - 结合多个属性进行评分
         candidates = []
 
-        for element in elements:
-            if element.get('class') in patterns['class_types']:
-                score = 0
-                text = element.get('text', '').lower()
-                hint = element.get('hint', '').lower()
-                resource_id = element.get('resource-id', '').lower()
-                content_desc = element.get('content-desc', '').lower()
-
-                # 文本提示匹配评分
-                for kw in patterns['text_hints']:
-                    kw_lower = kw.lower()
-                    if kw_lower in text or kw_lower in hint:
-                        score += 10
-                        print(f"📊 文本匹配加分: {kw} -> +10分")
-
-                # 资源ID匹配评分
-                for kw in patterns['resource_id_keywords']:
-                    kw_lower = kw.lower()
-                    if kw_lower in resource_id:
-                        score += 15  # 资源ID匹配权重更高
-                        print(f"📊 资源ID匹配加分: {kw} -> +15分")
+        for element in elements_of_classes(elements, patterns['class_types']):
+            score = 0
+            text = element.get('text', '').lower()
+            hint = element.get('hint', '').lower()
+            resource_id = element.get('resource-id', '').lower()
+            content_desc = element.get('content-desc', '').lower()
+
+            # 文本提示匹配评分
+            for kw in patterns['text_hints']:
+                kw_lower = kw.lower()
+                if kw_lower in text or kw_lower in hint:
+                    score += 10
+                    print(f"📊 文本匹配加分: {kw} -> +10分")
+
+            # 资源ID匹配评分
+            for kw in patterns['resource_id_keywords']:
+                kw_lower = kw.lower()
+                if kw_lower in resource_id:
+                    score += 15  # 资源ID匹配权重更高
+                    print(f"📊 资源ID匹配加分: {kw} -> +15分")
+
+            # content_desc匹配评分
+            for kw in patterns['content_desc_keywords']:
+                kw_lower = kw.lower()
+                if kw_lower in content_desc:
+                    score += 8
+                    print(f"📊 内容描述匹配加分: {kw} -> +8分")
+
+            # 布局位置评分（通常用户名输入框在屏幕上半部分）
+            bounds = element.get('bounds', '')
+            if bounds and '[' in bounds:
+                try:
+                    # 解析bounds格式：[x1,y1][x2,y2]
+                    import re
+                    coords = re.findall(r'\[(\d+),(\d+)\]', bounds)
+                    if len(coords) >= 2:
+                        y1 = int(coords[0][1])
+                        # 如果在屏幕上半部分，加分
+                        if y1 < 1080:  # 假设1920x1080分辨率
+                            score += 3
+                            print(f"📊 位置优势加分: y={y1} -> +3分")
+                except Exception:
+                    pass
 
-                # content_desc匹配评分
-                for kw in patterns['content_desc_keywords']:
-                    kw_lower = kw.lower()
-                    if kw_lower in content_desc:
-                        score += 8
-                        print(f"📊 内容描述匹配加分: {kw} -> +8分")
-
-                # 布局位置评分（通常用户名输入框在屏幕上半部分）
-                bounds = element.get('bounds', '')
-                if bounds and '[' in bounds:
-                    try:
-                        # 解析bounds格式：[x1,y1][x2,y2]
-                        import re
-                        coords = re.findall(r'\[(\d+),(\d+)\]', bounds)
-                        if len(coords) >= 2:
-                            y1 = int(coords[0][1])
-                            # 如果在屏幕上半部分，加分
-                            if y1 < 1080:  # 假设1920x1080分辨率
-                                score += 3
-                                print(f"📊 位置优势加分: y={y1} -> +3分")
-                    except Exception:
-                        pass
-
-                # 是否为密码框减分
-                if element.get('password', False):
-                    score -= 20
-                    print(f"📊 密码框减分: -> -20分")
+            # 是否为密码框减分
+            if element.get('password', False):
+                score -= 20
+                print(f"📊 密码框减分: -> -20分")
 
-                if score > 0:
-                    candidates.append((element, score))
-                    print(f"✅ 候选元素评分: {score}分 - {element.get('resource-id', '无ID')}")
+            if score > 0:
+                candidates.append((element, score))
+                print(f"✅ 候选元素评分: {score}分 - {element.get('resource-id', '无ID')}")
 
         # 按评分排序并返回最高分的
         if candidates:
@@ -566,66 +514,65 @@ class DeviceScriptReplayer:
         # 增强策略1：优先级匹配 - 结合多个属性进行评分
         candidates = []
 
-        for element in elements:
-            if element.get('class') in patterns['class_types']:
-                score = 0
-                text = element.get('text', '').lower()
-                hint = element.get('hint', '').lower()
-                resource_id = element.get('resource-id', '').lower()
-                content_desc = element.get('content-desc', '').lower()
-
-                # password字段标识（最高权重）
-                if element.get('password', False):
-                    score += 25  # password字段标识权重最高
-                    print(f"📊 password字段标识加分: +25分")
-
-                # 文本提示匹配评分
-                for kw in patterns['text_hints']:
-                    kw_lower = kw.lower()
-                    if kw_lower in text or kw_lower in hint:
-                        score += 10
-                        print(f"📊 文本匹配加分: {kw} -> +10分")
-
-                # 资源ID匹配评分
-                for kw in patterns['resource_id_keywords']:
-                    kw_lower = kw.lower()
-                    if kw_lower in resource_id:
-                        score += 15  # 资源ID匹配权重更高
-                        print(f"📊 资源ID匹配加分: {kw} -> +15分")
+        for element in elements_of_classes(elements, patterns['class_types']):
+            score = 0
+            text = element.get('text', '').lower()
+            hint = element.get('hint', '').lower()
+            resource_id = element.get('resource-id', '').lower()
+            content_desc = element.get('content-desc', '').lower()
+
+            # password字段标识（最高权重）
+            if element.get('password', False):
+                score += 25  # password字段标识权重最高
+                print(f"📊 password字段标识加分: +25分")
+
+            # 文本提示匹配评分
+            for kw in patterns['text_hints']:
+                kw_lower = kw.lower()
+                if kw_lower in text or kw_lower in hint:
+                    score += 10
+                    print(f"📊 文本匹配加分: {kw} -> +10分")
+
+            # 资源ID匹配评分
+            for kw in patterns['resource_id_keywords']:
+                kw_lower = kw.lower()
+                if kw_lower in resource_id:
+                    score += 15  # 资源ID匹配权重更高
+                    print(f"📊 资源ID匹配加分: {kw} -> +15分")
+
+            # content_desc匹配评分
+            for kw in patterns['content_desc_keywords']:
+                kw_lower = kw.lower()
+                if kw_lower in content_desc:
+                    score += 8
+                    print(f"📊 内容描述匹配加分: {kw} -> +8分")
+
+            # 布局位置评分（通常密码输入框在用户名输入框下方）
+            bounds = element.get('bounds', '')
+            if bounds and '[' in bounds:
+                try:
+                    # 解析bounds格式：[x1,y1][x2,y2]
+                    import re
+                    coords = re.findall(r'\[(\d+),(\d+)\]', bounds)
+                    if len(coords) >= 2:
+                        y1 = int(coords[0][1])
+                        # 如果在屏幕中部，加分
+                        if 500 < y1 < 1500:  # 假设1920x1080分辨率
+                            score += 3
+                            print(f"📊 位置优势加分: y={y1} -> +3分")
+                except Exception:
+                    pass
 
-                # content_desc匹配评分
-                for kw in patterns['content_desc_keywords']:
-                    kw_lower = kw.lower()
-                    if kw_lower in content_desc:
-                        score += 8
-                        print(f"📊 内容描述匹配加分: {kw} -> +8分")
-
-                # 布局位置评分（通常密码输入框在用户名输入框下方）
-                bounds = element.get('bounds', '')
-                if bounds and '[' in bounds:
-                    try:
-                        # 解析bounds格式：[x1,y1][x2,y2]
-                        import re
-                        coords = re.findall(r'\[(\d+),(\d+)\]', bounds)
-                        if len(coords) >= 2:
-                            y1 = int(coords[0][1])
-                            # 如果在屏幕中部，加分
-                            if 500 < y1 < 1500:  # 假设1920x1080分辨率
-                                score += 3
-                                print(f"📊 位置优势加分: y={y1} -> +3分")
-                    except Exception:
-                        pass
-
-                # 用户名框加分会在这里减分
-                username_indicators = ['username', 'account', 'user', '账号', '用户名']
-                for indicator in username_indicators:
-                    if indicator in text or indicator in hint or indicator in resource_id:
-                        score -= 15  # 如果包含用户名相关字段，减分
-                        print(f"📊 用户名框减分: {indicator} -> -15分")
+            # 用户名框加分会在这里减分
+            username_indicators = ['username', 'account', 'user', '账号', '用户名']
+            for indicator in username_indicators:
+                if indicator in text or indicator in hint or indicator in resource_id:
+                    score -= 15  # 如果包含用户名相关字段，减分
+                    print(f"📊 用户名框减分: {indicator} -> -15分")
 
-                if score > 0:
-                    candidates.append((element, score))
-                    print(f"✅ 候选元素评分: {score}分 - {element.get('resource-id', '无ID')}")
+            if score > 0:
+                candidates.append((element, score))
+                print(f"✅ 候选元素评分: {score}分 - {element.get('resource-id', '无ID')}")
 
         # 按评分排序并返回最高分的
         if candidates:
@@ -669,13 +616,12 @@ class DeviceScriptReplayer:
             class_types = target_selector.get('class_types', [])
             if class_types:
                 print(f"🎯 优先查找指定类型: {class_types}")
-                for element in elements:
+                for element in elements_of_classes(elements, class_types):
                     element_class = element.get('class', '')
-                    if element_class in class_types:
-                        # 检查是否可勾选
-                        if element.get('checkable', False) or element_class == 'android.widget.CheckBox':
-                            print(f"✅ 找到指定类型checkbox: {element_class} - {element.get('resource-id', '无ID')}")
-                            return element
+                    # 检查是否可勾选
+                    if element.get('checkable', False) or element_class == 'android.widget.CheckBox':
+                        print(f"✅ 找到指定类型checkbox: {element_class} - {element.get('resource-id', '无ID')}")
+                        return element
 
         # 策略2: 使用CHECKBOX_PATTERNS严格匹配
         patterns = self.patterns.CHECKBOX_PATTERNS
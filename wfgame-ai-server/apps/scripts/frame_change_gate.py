@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+帧变化门控
+为每帧计算一个缩小到 N×N 的灰度签名（区域均值降采样），与上次检测所用帧的签名
+比较：未超出容忍度时直接返回缓存的检测结果，跳过截图差分/YOLO 推理，
+界面静止时每轮只需一次毫秒级的缩放与比较。
+
+配置（config.ini [settings]）:
+    frame_gate_enabled            是否复用缓存检测结果（签名比较始终可用）
+    frame_gate_signature_size     签名边长，默认 64
+    frame_gate_cell_tolerance     单个签名像素允许的灰度差，默认 8
+    frame_gate_max_reuse_seconds  同一缓存结果最长复用时间，0 表示不限
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+DEFAULT_SIGNATURE_SIZE = 64
+DEFAULT_CELL_TOLERANCE = 8
+DEFAULT_MAX_REUSE_SECONDS = 10.0
+# Frame 先按推理 imgsz 降采样，与检测共用 Frame 内的缩放缓存
+FRAME_SOURCE_SIDE = 640
+
+
+@dataclass
+class SignatureDiff:
+    """两个签名的差异"""
+
+    mean_ratio: float  # 平均灰度差 / 255，近似整帧 absdiff 比例
+    max_diff: int  # 最大单像素灰度差
+    changed_ratio: float  # 灰度有变化的签名像素占比
+
+
+def load_gate_settings() -> Dict[str, object]:
+    """读取 config.ini [settings] 中的帧变化门控配置（Django 不可用时使用默认值）"""
+    values = {
+        "enabled": True,
+        "signature_size": DEFAULT_SIGNATURE_SIZE,
+        "cell_tolerance": DEFAULT_CELL_TOLERANCE,
+        "max_reuse_seconds": DEFAULT_MAX_REUSE_SECONDS,
+    }
+    try:
+        from django.conf import settings
+
+        config = settings.CFG._config
+        values["enabled"] = config.getboolean("settings", "frame_gate_enabled", fallback=True)
+        values["signature_size"] = config.getint(
+            "settings", "frame_gate_signature_size", fallback=DEFAULT_SIGNATURE_SIZE)
+        values["cell_tolerance"] = config.getint(
+            "settings", "frame_gate_cell_tolerance", fallback=DEFAULT_CELL_TOLERANCE)
+        values["max_reuse_seconds"] = config.getfloat(
+            "settings", "frame_gate_max_reuse_seconds", fallback=DEFAULT_MAX_REUSE_SECONDS)
+    except Exception:
+        pass
+    return values
+
+
+class FrameChangeGate:
+    """
+    按键（设备、设备+用途等）缓存最近一次检测的签名与结果
+
+    用法:
+        signature = gate.signature(screenshot)
+        hit, cached = gate.lookup(key, signature)
+        if not hit:
+            cached = detect(...)
+            gate.store(key, signature, cached)
+    """
+
+    def __init__(self, signature_size: int = DEFAULT_SIGNATURE_SIZE,
+                 cell_tolerance: int = DEFAULT_CELL_TOLERANCE,
+                 max_reuse_seconds: float = DEFAULT_MAX_REUSE_SECONDS,
+                 enabled: bool = True):
+        if signature_size < 4:
+            raise ValueError("签名边长不能小于4")
+        self.signature_size = signature_size
+        self.cell_tolerance = cell_tolerance
+        self.max_reuse_seconds = max_reuse_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[np.ndarray, Any, float]] = {}
+        self._counters: Dict[str, list] = {}  # key -> [检查次数, 跳过次数]
+
+    def signature(self, frame) -> Optional[np.ndarray]:
+        """
+        计算帧签名（uint8 灰度 N×N）
+
+        Args:
+            frame: frame_grabber.Frame、PIL.Image（RGB）或 ndarray（BGR/灰度）
+        """
+        if frame is None:
+            return None
+        size = (self.signature_size, self.signature_size)
+        if hasattr(frame, 'to_bgr'):
+            frame = frame.to_bgr(max_side=FRAME_SOURCE_SIDE)
+        elif hasattr(frame, 'convert') and hasattr(frame, 'resize'):
+            # PIL 在原图上直接做区域均值缩放，避免整帧转 ndarray
+            from PIL import Image
+
+            if frame.mode not in ("RGB", "L"):
+                frame = frame.convert("RGB")
+            return np.asarray(frame.resize(size, Image.BOX).convert("L"))
+        frame = np.asarray(frame)
+        if frame.size == 0:
+            return None
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 2:
+            return small
+        code = cv2.COLOR_BGRA2GRAY if small.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(small, code)
+
+    @staticmethod
+    def compare(previous: np.ndarray, current: np.ndarray) -> SignatureDiff:
+        """比较两个签名"""
+        diff = cv2.absdiff(previous, current)
+        return SignatureDiff(
+            mean_ratio=float(diff.mean()) / 255.0,
+            max_diff=int(diff.max()),
+            changed_ratio=np.count_nonzero(diff) / float(diff.size),
+        )
+
+    def is_same(self, previous: Optional[np.ndarray], current: Optional[np.ndarray]) -> bool:
+        """两个签名在容忍度内视为同一画面"""
+        if previous is None or current is None or previous.shape != current.shape:
+            return False
+        return self.compare(previous, current).max_diff <= self.cell_tolerance
+
+    def lookup(self, key: str, signature: Optional[np.ndarray]) -> Tuple[bool, Any]:
+        """
+        查询缓存的检测结果
+
+        Returns:
+            (命中, 缓存结果)；签名与上次检测所用帧一致且未超过最长复用时间时命中
+        """
+        with self._lock:
+            counter = self._counters.setdefault(key, [0, 0])
+            counter[0] += 1
+            entry = self._entries.get(key)
+            if not self.enabled or entry is None:
+                return False, None
+            cached_signature, result, stored_at = entry
+            if self.max_reuse_seconds and time.time() - stored_at > self.max_reuse_seconds:
+                return False, None
+            if not self.is_same(cached_signature, signature):
+                return False, None
+            counter[1] += 1
+            return True, result
+
+    def store(self, key: str, signature: Optional[np.ndarray], result: Any):
+        """记录本次检测所用帧的签名与结果"""
+        if signature is None:
+            return
+        with self._lock:
+            self._entries[key] = (signature, result, time.time())
+
+    def invalidate(self, key: Optional[str] = None, reset_stats: bool = False):
+        """丢弃缓存结果（key 为空时全部丢弃），reset_stats 时一并清零计数"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                if reset_stats:
+                    self._counters.clear()
+            else:
+                self._entries.pop(key, None)
+                if reset_stats:
+                    self._counters.pop(key, None)
+
+    def stats(self, key: Optional[str] = None) -> Dict[str, object]:
+        """检查/跳过次数与跳过率，key 为空时汇总全部"""
+        with self._lock:
+            if key is not None:
+                checks, skips = self._counters.get(key, (0, 0))
+            else:
+                checks = sum(c[0] for c in self._counters.values())
+                skips = sum(c[1] for c in self._counters.values())
+            return {
+                "checks": checks,
+                "skips": skips,
+                "skip_rate": round(skips / checks * 100, 1) if checks else 0.0,
+                "cached_keys": len(self._entries),
+            }
+
+
+_GATE = None
+_GATE_LOCK = threading.Lock()
+
+
+def get_frame_change_gate() -> FrameChangeGate:
+    """进程内共享的帧变化门控（首次调用时读取配置）"""
+    global _GATE
+    with _GATE_LOCK:
+        if _GATE is None:
+            _GATE = FrameChangeGate(**load_gate_settings())
+        return _GATE
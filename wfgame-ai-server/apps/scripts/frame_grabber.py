@@ -0,0 +1,684 @@
+# -*- coding: utf-8 -*-
+"""
+设备帧采集器
+每台设备维持一个常驻采集通道（单个 adb exec-out sh 会话），后台线程持续刷新
+“最新帧”缓冲区（带采集时间戳与序号），回放代码直接读取缓冲区，
+不再为每帧启动 adb 子进程。
+
+采集模式（可按设备选择，见 resolve_capture_mode）:
+    png  - `screencap -p`，设备端 PNG 编码、主机端 PNG 解码
+    raw  - `screencap` 原始 RGBA 帧缓冲，主机端按头部信息零拷贝 reshape 为 ndarray，
+           省去两端编解码，可选在检测前于主机端缩放
+
+通道可替换：测试时传入 SyntheticFrameChannel 即可在无设备环境下生成合成帧。
+基准对比: python frame_grabber.py <serial> [帧数]
+"""
+
+import atexit
+import io
+import os
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Union
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# 读者空闲超过该秒数后暂停采集，避免无人读取时持续占用设备
+DEFAULT_IDLE_TIMEOUT = 30.0
+# 通道异常后的重连退避（秒）
+RECONNECT_BACKOFF = (0.2, 0.5, 1.0, 2.0)
+# 采集周期滑动平均系数
+CAPTURE_PERIOD_ALPHA = 0.3
+
+CAPTURE_MODES = ("png", "raw")
+# screencap 原始输出的像素格式 -> 每像素字节数（android PixelFormat）
+RAW_PIXEL_BYTES = {1: 4, 2: 4, 3: 3, 4: 2, 5: 4}
+# Android 9 (API 28) 起原始头部追加 4 字节色彩空间字段
+RAW_HEADER_COLORSPACE_SDK = 28
+
+
+@dataclass
+class RawFramePayload:
+    """screencap 原始帧：像素缓冲 + 头部解析出的尺寸与格式"""
+
+    width: int
+    height: int
+    pixel_format: int
+    buffer: bytearray
+
+
+class FrameChannelError(Exception):
+    """采集通道读取失败"""
+
+
+class AdbShellFrameChannel:
+    """
+    常驻 adb 采集通道
+    打开一个 `adb -s <serial> exec-out sh` 会话，每帧仅向其 stdin 写入一条
+    screencap 命令，并按 PNG chunk 结构从 stdout 精确读取一帧。
+    若设备/adb 不支持 exec-out 转发 stdin（会话中从未成功读到帧），
+    连续失败后降级为每帧一次 `exec-out screencap -p`（不经 shell）。
+    """
+
+    MAX_SESSION_FAILURES = 2
+
+    def __init__(self, serial: str, adb_path: str = "adb", read_timeout: float = 10.0):
+        self.serial = serial
+        self.adb_path = adb_path
+        self.read_timeout = read_timeout
+        self._proc: Optional[subprocess.Popen] = None
+        self.persistent = True
+        self._session_ok = False
+        self._session_failures = 0
+
+    def open(self):
+        self.close()
+        if not self.persistent:
+            return
+        self._proc = subprocess.Popen(
+            [self.adb_path, "-s", self.serial, "exec-out", "sh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.stdin:
+                proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            proc.terminate()
+            proc.wait(timeout=2)
+        except Exception:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    def _read_exact(self, size: int) -> bytes:
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = self._proc.stdout.read(remaining)
+            if not chunk:
+                raise FrameChannelError("采集通道已关闭")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def _read_png(self) -> bytes:
+        signature = self._read_exact(len(PNG_SIGNATURE))
+        if signature != PNG_SIGNATURE:
+            raise FrameChannelError(f"非PNG数据: {signature[:8]!r}")
+        parts = [signature]
+        while True:
+            header = self._read_exact(8)
+            length, chunk_type = struct.unpack(">I4s", header)
+            parts.append(header)
+            parts.append(self._read_exact(length + 4))  # 数据 + CRC
+            if chunk_type == b"IEND":
+                return b"".join(parts)
+
+    def _read_once(self) -> bytes:
+        try:
+            result = subprocess.run(
+                [self.adb_path, "-s", self.serial, "exec-out", "screencap", "-p"],
+                capture_output=True,
+                timeout=self.read_timeout,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise FrameChannelError("截图超时") from e
+        if result.returncode != 0 or not result.stdout.startswith(PNG_SIGNATURE):
+            raise FrameChannelError("screencap命令返回空数据或失败")
+        return result.stdout
+
+    def read_frame(self) -> bytes:
+        return self._session_read(b"screencap -p\n", self._read_png)
+
+    def _session_read(self, command: bytes, parse: Callable[[], object]):
+        """在常驻会话中执行一条采集命令并解析输出；不支持常驻会话时走单次调用"""
+        if not self.persistent:
+            return self._read_once()
+        if self._proc is None or self._proc.poll() is not None:
+            self.open()
+        # 读超时由看门狗关闭进程实现（管道阻塞读无法直接设置超时）
+        watchdog = threading.Timer(self.read_timeout, self.close)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            self._proc.stdin.write(command)
+            self._proc.stdin.flush()
+            data = parse()
+        except (FrameChannelError, AttributeError, ValueError, OSError) as e:
+            if not self._session_ok:
+                self._session_failures += 1
+                if self._session_failures >= self.MAX_SESSION_FAILURES:
+                    print(f"⚠️ 设备 {self.serial} 不支持常驻采集会话，降级为单次 screencap")
+                    self.persistent = False
+            raise FrameChannelError(f"读取帧失败: {e}") from e
+        finally:
+            watchdog.cancel()
+        self._session_ok = True
+        return data
+
+
+class AdbRawFrameChannel(AdbShellFrameChannel):
+    """
+    原始帧缓冲采集通道
+    同样复用一个 exec-out sh 会话，发送 `screencap`（不带 -p），
+    解析头部 (width, height, format[, colorspace]) 后按像素字节数整块 readinto。
+    """
+
+    def __init__(self, serial: str, adb_path: str = "adb", read_timeout: float = 10.0):
+        super().__init__(serial, adb_path=adb_path, read_timeout=read_timeout)
+        self.header_size: Optional[int] = None
+
+    def _probe_header_size(self) -> int:
+        try:
+            result = subprocess.run(
+                [self.adb_path, "-s", self.serial, "shell", "getprop", "ro.build.version.sdk"],
+                capture_output=True, text=True, timeout=self.read_timeout,
+            )
+            sdk = int((result.stdout or "0").strip() or 0)
+        except Exception:
+            sdk = 0
+        return 16 if sdk >= RAW_HEADER_COLORSPACE_SDK else 12
+
+    def open(self):
+        if self.header_size is None:
+            self.header_size = self._probe_header_size()
+        super().open()
+
+    def _parse_raw(self, reader: Callable[[int], bytes], readinto: Callable[[memoryview], None]) -> RawFramePayload:
+        header = reader(self.header_size)
+        width, height, pixel_format = struct.unpack("<III", header[:12])
+        bpp = RAW_PIXEL_BYTES.get(pixel_format)
+        if not bpp or width <= 0 or height <= 0:
+            raise FrameChannelError(f"无法识别的原始帧头: {width}x{height} format={pixel_format}")
+        buffer = bytearray(width * height * bpp)
+        readinto(memoryview(buffer))
+        return RawFramePayload(width, height, pixel_format, buffer)
+
+    def _readinto_exact(self, view: memoryview):
+        filled = 0
+        total = len(view)
+        while filled < total:
+            n = self._proc.stdout.readinto(view[filled:])
+            if not n:
+                raise FrameChannelError("采集通道已关闭")
+            filled += n
+
+    def _read_once(self) -> RawFramePayload:
+        try:
+            result = subprocess.run(
+                [self.adb_path, "-s", self.serial, "exec-out", "screencap"],
+                capture_output=True,
+                timeout=self.read_timeout,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise FrameChannelError("截图超时") from e
+        data = result.stdout
+        if result.returncode != 0 or len(data) < self.header_size:
+            raise FrameChannelError("screencap命令返回空数据或失败")
+        stream = io.BytesIO(data)
+
+        def _readinto(view):
+            if stream.readinto(view) != len(view):
+                raise FrameChannelError("原始帧数据不完整")
+
+        return self._parse_raw(stream.read, _readinto)
+
+    def read_frame(self) -> RawFramePayload:
+        if self.header_size is None:
+            self.header_size = self._probe_header_size()
+        return self._session_read(b"screencap\n", lambda: self._parse_raw(self._read_exact, self._readinto_exact))
+
+
+class SyntheticFrameChannel:
+    """
+    合成帧通道（测试/无设备环境使用）
+    按 interval 节奏生成纯色渐变 PNG，帧内容随序号变化。
+    """
+
+    def __init__(self, width: int = 108, height: int = 240, interval: float = 0.02):
+        self.width = width
+        self.height = height
+        self.interval = interval
+        self._counter = 0
+
+    def open(self):
+        self._counter = 0
+
+    def close(self):
+        pass
+
+    def read_frame(self) -> bytes:
+        import cv2
+        import numpy as np
+
+        time.sleep(self.interval)
+        self._counter += 1
+        image = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        image[:, :, 0] = np.linspace(0, 255, self.height, dtype=np.uint8)[:, None]
+        image[:, :, 1] = self._counter % 256
+        ok, encoded = cv2.imencode(".png", image)
+        if not ok:
+            raise FrameChannelError("合成帧编码失败")
+        return encoded.tobytes()
+
+
+@dataclass
+class Frame:
+    """
+    一帧截图：PNG 字节或原始帧缓冲 + 采集序号/时间，解码结果按需缓存
+    原始帧的 width/height 即设备像素尺寸；PNG 帧在首次解码后才可知
+    """
+
+    seq: int
+    data: Union[bytes, RawFramePayload]
+    started_at: float  # 开始采集的 time.time()
+    captured_at: float  # 采集完成的 time.time()
+    _decoded: Dict[Optional[int], object] = field(default_factory=dict, repr=False)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.captured_at
+
+    @property
+    def is_raw(self) -> bool:
+        return isinstance(self.data, RawFramePayload)
+
+    def _full_array(self):
+        """原始帧零拷贝视图 (H, W, C)；PNG 帧解码为 BGR"""
+        import cv2
+        import numpy as np
+
+        if not self.is_raw:
+            return cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+        raw = self.data
+        channels = RAW_PIXEL_BYTES[raw.pixel_format]
+        return np.frombuffer(raw.buffer, dtype=np.uint8).reshape(raw.height, raw.width, channels)
+
+    def _raw_to_bgr(self, array):
+        import cv2
+
+        pixel_format = self.data.pixel_format
+        if pixel_format == 4:
+            return cv2.cvtColor(array, cv2.COLOR_BGR5652BGR)
+        if pixel_format == 3:
+            return cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+        if pixel_format == 5:
+            return cv2.cvtColor(array, cv2.COLOR_BGRA2BGR)
+        return cv2.cvtColor(array, cv2.COLOR_RGBA2BGR)
+
+    def to_bgr(self, max_side: Optional[int] = None):
+        """
+        转换为 OpenCV BGR ndarray，同一帧同一尺寸只计算一次
+
+        Args:
+            max_side: 最长边上限，超过时在主机端按 INTER_AREA 缩放（检测前降采样）；
+                      坐标需乘以 1 / scale_for(max_side) 映射回设备坐标
+        """
+        if max_side in self._decoded:
+            return self._decoded[max_side]
+        import cv2
+
+        if self.is_raw:
+            source = self._full_array()
+        else:
+            source = self._decoded.get(None)
+            if source is None:
+                source = self._decoded[None] = self._full_array()
+        height, width = source.shape[:2]
+        scale = self.scale_for(max_side, width, height)
+        # RGB_565 每像素两个打包字节，按字节插值会破坏颜色，须先转换再缩放；
+        # 其余原始格式先在 RGB(A) 视图上缩放再做颜色转换，减少转换像素数
+        packed = self.is_raw and self.data.pixel_format == 4
+        if packed:
+            source = self._raw_to_bgr(source)
+        if scale < 1:
+            source = cv2.resize(
+                source, (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA,
+            )
+        result = self._raw_to_bgr(source) if self.is_raw and not packed else source
+        self._decoded[max_side] = result
+        return result
+
+    def scale_for(self, max_side: Optional[int], width: Optional[int] = None,
+                  height: Optional[int] = None) -> float:
+        """缩放到 max_side 时的比例（<=1）"""
+        if not max_side:
+            return 1.0
+        if width is None or height is None:
+            if self.is_raw:
+                width, height = self.data.width, self.data.height
+            else:
+                height, width = self.to_bgr().shape[:2]
+        return min(1.0, max_side / float(max(width, height)))
+
+    def to_png(self) -> bytes:
+        """PNG 字节（原始帧会在主机端编码，用于上报/存档）"""
+        if not self.is_raw:
+            return self.data
+        import cv2
+
+        ok, encoded = cv2.imencode(".png", self.to_bgr())
+        if not ok:
+            raise FrameChannelError("帧PNG编码失败")
+        return encoded.tobytes()
+
+    def to_pil(self):
+        """转换为 PIL.Image（RGB）"""
+        from PIL import Image
+
+        if not self.is_raw:
+            return Image.open(io.BytesIO(self.data))
+        raw = self.data
+        if raw.pixel_format in (1, 2):
+            return Image.frombuffer("RGBA", (raw.width, raw.height), bytes(raw.buffer),
+                                    "raw", "RGBA", 0, 1).convert("RGB")
+        import cv2
+
+        return Image.fromarray(cv2.cvtColor(self.to_bgr(), cv2.COLOR_BGR2RGB))
+
+
+class DeviceFrameGrabber:
+    """
+    单设备帧采集器
+    后台线程循环读取通道，更新最新帧；读者通过 get_frame 获取满足新鲜度要求的帧。
+    """
+
+    def __init__(self, serial: str,
+                 channel_factory: Optional[Callable[[str], object]] = None,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 capture_mode: str = "png"):
+        if capture_mode not in CAPTURE_MODES:
+            raise ValueError(f"不支持的采集模式: {capture_mode}")
+        self.serial = serial
+        self.capture_mode = capture_mode
+        self.channel_factory = channel_factory or (
+            AdbRawFrameChannel if capture_mode == "raw" else AdbShellFrameChannel
+        )
+        self.idle_timeout = idle_timeout
+        self.latest: Optional[Frame] = None
+        self.frames_captured = 0
+        # 单帧采集耗时的滑动平均，即采集周期（采集线程连续读取，无额外间隔）
+        self.capture_period: Optional[float] = None
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._last_demand = time.time()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=f"frame-grabber-{self.serial}", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 3.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        channel = self.channel_factory(self.serial)
+        failures = 0
+        try:
+            channel.open()
+            while not self._stop.is_set():
+                # 无人读取时挂起，等待下一次 get_frame 唤醒
+                with self._cond:
+                    while (not self._stop.is_set()
+                           and time.time() - self._last_demand > self.idle_timeout):
+                        self._cond.wait(timeout=1.0)
+                if self._stop.is_set():
+                    break
+
+                started_at = time.time()
+                try:
+                    data = channel.read_frame()
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    delay = RECONNECT_BACKOFF[min(failures, len(RECONNECT_BACKOFF) - 1)]
+                    failures += 1
+                    if failures == 1 or failures % 10 == 0:
+                        print(f"⚠️ 设备 {self.serial} 帧采集失败({failures}次): {e}")
+                    channel.close()
+                    if self._stop.wait(delay):
+                        break
+                    try:
+                        channel.open()
+                    except Exception as open_err:
+                        self.last_error = str(open_err)
+                    continue
+
+                failures = 0
+                captured_at = time.time()
+                with self._cond:
+                    duration = captured_at - started_at
+                    self.capture_period = duration if self.capture_period is None else (
+                        self.capture_period * (1 - CAPTURE_PERIOD_ALPHA) + duration * CAPTURE_PERIOD_ALPHA)
+                    self._seq += 1
+                    self.latest = Frame(self._seq, data, started_at, captured_at)
+                    self.frames_captured += 1
+                    self._cond.notify_all()
+        finally:
+            channel.close()
+
+    def get_frame(self, max_age: Optional[float] = None, timeout: float = 10.0,
+                  after_seq: Optional[int] = None) -> Optional[Frame]:
+        """
+        获取最新帧
+
+        Args:
+            max_age: 可接受的帧陈旧程度（秒）。None（普通读取）表示一个采集周期内完成采集的帧，
+                     直接复用最新帧缓冲；0 表示必须是调用之后才开始采集的帧（输入操作之后的截图，
+                     保证反映最新画面）；float('inf') 表示任意已有帧即可
+            timeout: 等待满足条件的帧的最长时间
+            after_seq: 仅返回序号大于该值的帧（用于逐帧消费）
+
+        Returns:
+            Frame 或超时返回 None
+        """
+        requested_at = time.time()
+        deadline = requested_at + timeout
+
+        def acceptable(frame: Optional[Frame]) -> bool:
+            if frame is None:
+                return False
+            if after_seq is not None and frame.seq <= after_seq:
+                return False
+            if max_age is None:
+                # 一个采集周期内完成的帧即为采集线程当前最新帧；周期未知时接受任意已有帧
+                period = self.capture_period
+                return period is None or frame.captured_at >= requested_at - period
+            return frame.started_at >= requested_at - max_age
+
+        with self._cond:
+            self._last_demand = requested_at
+            self._cond.notify_all()
+        self.start()
+
+        with self._cond:
+            while not acceptable(self.latest):
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.running:
+                    return None
+                self._last_demand = time.time()
+                self._cond.wait(timeout=min(remaining, 1.0))
+            return self.latest
+
+    def stats(self) -> Dict[str, object]:
+        latest = self.latest
+        return {
+            "serial": self.serial,
+            "capture_mode": self.capture_mode,
+            "running": self.running,
+            "frames_captured": self.frames_captured,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "latest_seq": latest.seq if latest else None,
+            "latest_age": round(latest.age, 3) if latest else None,
+            "capture_period": round(self.capture_period, 3) if self.capture_period is not None else None,
+        }
+
+
+_GRABBERS: Dict[str, DeviceFrameGrabber] = {}
+_GRABBERS_LOCK = threading.Lock()
+
+
+def _load_capture_settings() -> Dict[str, str]:
+    """读取 config.ini [settings] 中的采集配置（Django 不可用时返回空）"""
+    try:
+        from django.conf import settings
+
+        config = settings.CFG._config
+        return {
+            "mode": config.get("settings", "screen_capture_mode", fallback="png"),
+            "overrides": config.get("settings", "screen_capture_mode_overrides", fallback=""),
+        }
+    except Exception:
+        return {}
+
+
+def resolve_capture_mode(serial: str) -> str:
+    """
+    解析设备采集模式，优先级：
+    环境变量 WFGAME_SCREEN_CAPTURE_MODE > screen_capture_mode_overrides(serial:mode,...) > screen_capture_mode
+    """
+    env_mode = os.environ.get("WFGAME_SCREEN_CAPTURE_MODE", "").strip().lower()
+    if env_mode in CAPTURE_MODES:
+        return env_mode
+    capture_settings = _load_capture_settings()
+    for item in capture_settings.get("overrides", "").split(","):
+        device, _, mode = item.strip().partition(":")
+        if device == serial and mode.strip().lower() in CAPTURE_MODES:
+            return mode.strip().lower()
+    mode = capture_settings.get("mode", "png").strip().lower()
+    return mode if mode in CAPTURE_MODES else "png"
+
+
+def get_frame_grabber(serial: str,
+                      channel_factory: Optional[Callable[[str], object]] = None,
+                      capture_mode: Optional[str] = None) -> DeviceFrameGrabber:
+    """
+    获取（必要时创建）设备的帧采集器，进程内每台设备只保留一个
+    指定的 capture_mode 与现有采集器不同时会重建采集器
+    """
+    with _GRABBERS_LOCK:
+        grabber = _GRABBERS.get(serial)
+        if grabber is not None and capture_mode and grabber.capture_mode != capture_mode:
+            grabber.stop()
+            grabber = None
+        if grabber is None:
+            grabber = DeviceFrameGrabber(
+                serial, channel_factory=channel_factory,
+                capture_mode=capture_mode or resolve_capture_mode(serial),
+            )
+            _GRABBERS[serial] = grabber
+        return grabber
+
+
+def grab_frame(serial: str, max_age: Optional[float] = None, timeout: float = 10.0) -> Optional[Frame]:
+    """便捷方法：从设备采集器读取一帧，失败返回 None"""
+    try:
+        return get_frame_grabber(serial).get_frame(max_age=max_age, timeout=timeout)
+    except Exception as e:
+        print(f"⚠️ 设备 {serial} 读取帧缓冲失败: {e}")
+        return None
+
+
+def stop_frame_grabber(serial: str):
+    """停止并移除设备的帧采集器（设备回放结束时调用）"""
+    with _GRABBERS_LOCK:
+        grabber = _GRABBERS.pop(serial, None)
+    if grabber:
+        grabber.stop()
+
+
+def stop_all_frame_grabbers():
+    with _GRABBERS_LOCK:
+        grabbers = list(_GRABBERS.values())
+        _GRABBERS.clear()
+    for grabber in grabbers:
+        grabber.stop()
+
+
+atexit.register(stop_all_frame_grabbers)
+
+
+def benchmark_capture(serial: str, frames: int = 20, detect_max_side: Optional[int] = 640,
+                      adb_path: str = "adb") -> Dict[str, Dict[str, float]]:
+    """
+    对比 png / raw 两种采集模式的单帧耗时（采集 + 转换为检测输入）
+
+    Returns:
+        {mode: {"capture_ms", "decode_ms", "total_ms", "frames"}}
+    """
+    results = {}
+    for mode in CAPTURE_MODES:
+        channel_cls = AdbRawFrameChannel if mode == "raw" else AdbShellFrameChannel
+        channel = channel_cls(serial, adb_path=adb_path)
+        capture_total = decode_total = 0.0
+        done = 0
+        try:
+            channel.open()
+            channel.read_frame()  # 预热（建立会话、探测头部）
+            for seq in range(frames):
+                t0 = time.perf_counter()
+                payload = channel.read_frame()
+                t1 = time.perf_counter()
+                Frame(seq, payload, t0, t1).to_bgr(detect_max_side)
+                t2 = time.perf_counter()
+                capture_total += t1 - t0
+                decode_total += t2 - t1
+                done += 1
+        except Exception as e:
+            print(f"⚠️ {mode} 模式基准失败: {e}")
+        finally:
+            channel.close()
+        if done:
+            results[mode] = {
+                "frames": done,
+                "capture_ms": round(capture_total / done * 1000, 2),
+                "decode_ms": round(decode_total / done * 1000, 2),
+                "total_ms": round((capture_total + decode_total) / done * 1000, 2),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python frame_grabber.py <serial> [帧数]")
+        sys.exit(1)
+    bench = benchmark_capture(sys.argv[1], frames=int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    for mode_name, item in bench.items():
+        print(f"{mode_name:>4}: 采集 {item['capture_ms']}ms + 转换 {item['decode_ms']}ms "
+              f"= {item['total_ms']}ms/帧 ({item['frames']}帧)")
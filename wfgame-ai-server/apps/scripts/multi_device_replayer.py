@@ -140,9 +140,10 @@ def device_worker(device_serial, scripts, shared_results, task_id=None):
         try:
             # 尝试导入AI检测函数
             from replay_script import detect_buttons, load_yolo_model_for_detection
+            from batch_inference import sidecar_available
 
-            # 初始化YOLO模型
-            if load_yolo_model_for_detection():
+            # 初始化YOLO模型（sidecar 批量推理服务可用时由服务统一推理，本进程不加载模型）
+            if sidecar_available() or load_yolo_model_for_detection():
                 detect_buttons_func = detect_buttons
                 timestamp = datetime.now().strftime("%H:%M:%S")
                 print(f"[进程 {os.getpid()}][{timestamp}] 设备 {device_serial} AI检测功能已加载")
@@ -338,6 +339,23 @@ def replay_scripts_on_devices(device_serials, scripts, max_workers=4, strategy="
 
     print(f"🚀 启动多设备并发回放，设备数量: {len(device_serials)}")
 
+    # sidecar 批量推理模式下先拉起推理服务，所有设备进程共享一个模型
+    sidecar_proc = None
+    try:
+        from batch_inference import ensure_sidecar
+        sidecar_proc = ensure_sidecar()
+    except Exception as e:
+        print(f"⚠️ 批量推理服务启动失败，设备将各自推理: {e}")
+
+    try:
+        return _run_device_processes(device_serials, scripts, task_id)
+    finally:
+        if sidecar_proc is not None:
+            sidecar_proc.terminate()
+
+
+def _run_device_processes(device_serials, scripts, task_id=None):
+    """为每台设备启动独立进程执行回放，返回 (results_dict, device_report_dirs_list)"""
     # 使用Manager创建共享结果字典
     with Manager() as manager:
         shared_results = manager.dict()
@@ -44,16 +44,29 @@ class SystemResourceStatus:
 class MySQLDistributedAccountManager:
     """MySQL分布式账号管理器"""
 
-    def __init__(self, mysql_config: dict = None):
+    # 可用账号计数缓存有效期（秒），期间按本进程的分配/释放增减
+    AVAILABLE_COUNT_TTL = 30.0
+
+    def __init__(self, mysql_config: dict = None, connection_pool=None):
         """
         初始化MySQL分布式账号管理器
 
         Args:
             mysql_config: MySQL配置字典，如果为None则从config.ini读取
+            connection_pool: 已有连接池（提供 connection() 方法），传入时不再创建MySQL连接池
         """
-        self.mysql_config = mysql_config or self._load_mysql_config()
-        self.connection_pool = self._create_connection_pool()
+        if connection_pool is not None:
+            self.mysql_config = mysql_config or {}
+            self.connection_pool = connection_pool
+        else:
+            self.mysql_config = mysql_config or self._load_mysql_config()
+            self.connection_pool = self._create_connection_pool()
         self.lock = threading.Lock()
+        self.dialect = self._detect_dialect()
+        self._pool_checked = False
+        self._available_lock = threading.Lock()
+        self._available_count: Optional[int] = None
+        self._available_checked_at = 0.0
 
     def _load_mysql_config(self) -> dict:
         """从config.ini加载MySQL配置"""
@@ -112,31 +125,69 @@ class MySQLDistributedAccountManager:
             print(f"❌ 创建MySQL连接池失败: {e}")
             raise
 
-    def allocate_account_batch(self, device_serials: List[str]) -> Dict[str, dict]:
+    def _detect_dialect(self) -> str:
+        """
+        探测数据库类型，决定抢占账号时的加锁方式
+        mysql_skip_locked: MySQL 8.0.1+ / MariaDB 10.6+，支持 FOR UPDATE SKIP LOCKED
+        mysql:             旧版本 MySQL，退化为 FOR UPDATE
+        sqlite:            测试用 SQLite，写事务本身串行（BEGIN IMMEDIATE），不加锁子句
         """
-        批量分配账号，原子性操作避免冲突
+        conn = self.connection_pool.connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT VERSION() AS version")
+            except Exception:
+                cursor.execute("SELECT sqlite_version()")
+                return 'sqlite'
+            row = cursor.fetchone()
+            version = str(row.get('version') if isinstance(row, dict) else row[0])
+            numbers = [int(n) for n in version.split('-')[0].split('.')[:3] if n.isdigit()]
+            minimum = [10, 6, 0] if 'mariadb' in version.lower() else [8, 0, 1]
+            return 'mysql_skip_locked' if numbers >= minimum else 'mysql'
+        except Exception as e:
+            print(f"⚠️ 探测数据库版本失败，按不支持 SKIP LOCKED 处理: {e}")
+            return 'mysql'
+        finally:
+            conn.close()
 
-        Args:
-            device_serials: 设备序列号列表
+    def _sql(self, query: str) -> str:
+        """按数据库类型调整占位符"""
+        return query.replace('%s', '?') if self.dialect == 'sqlite' else query
 
-        Returns:
-            Dict[str, dict]: {device_serial: account_info, ...}
-        """
+    def _begin(self, conn, cursor):
+        if self.dialect == 'sqlite':
+            cursor.execute("BEGIN IMMEDIATE")
+        else:
+            conn.begin()
+
+    @staticmethod
+    def _rows(cursor) -> List[Dict]:
+        """统一为字典行（MySQL 使用 DictCursor，SQLite 按列名转换）"""
+        rows = cursor.fetchall() or []
+        if rows and not isinstance(rows[0], dict):
+            columns = [d[0] for d in cursor.description]
+            rows = [dict(zip(columns, row)) for row in rows]
+        return list(rows)
+
+    def _ensure_account_pool(self):
+        """进程内首次分配前检查账户表，为空时从JSON自动导入（只检查一次）"""
+        if self._pool_checked:
+            return
         with self.lock:
-            # 在分配前进行一次懒加载迁移：当账户表为空时自动从JSON导入
+            if self._pool_checked:
+                return
+            conn = self.connection_pool.connection()
+            cursor = conn.cursor()
             try:
-                conn_probe = self.connection_pool.connection()
-                cur_probe = conn_probe.cursor()
-                cur_probe.execute("SELECT COUNT(*) AS c FROM ai_game_accounts")
-                row = cur_probe.fetchone()
-                total_accounts = int(row.get('c', 0) if isinstance(row, dict) else (row[0] if row else 0))
+                cursor.execute("SELECT COUNT(*) AS c FROM ai_game_accounts")
+                rows = self._rows(cursor)
+                total_accounts = int(rows[0]['c']) if rows else 0
             except Exception:
                 total_accounts = -1
             finally:
-                try:
-                    cur_probe.close(); conn_probe.close()
-                except Exception:
-                    pass
+                cursor.close()
+                conn.close()
             if total_accounts == 0:
                 # 自动迁移一次；失败则忽略，继续正常流程
                 try:
@@ -144,108 +195,144 @@ class MySQLDistributedAccountManager:
                     self.migrate_accounts_from_json()
                 except Exception as _auto_mig_e:
                     print(f"⚠️ 自动导入账号池失败: {_auto_mig_e}")
+            self._pool_checked = True
+        # 初始化可用账号计数缓存，之后按分配/释放增减
+        self.get_available_accounts_count(refresh=True)
 
-            conn = self.connection_pool.connection()
+    def _adjust_available(self, delta: int, exhausted: bool = False):
+        """更新可用账号计数缓存（其它进程的变化在缓存过期后刷新）"""
+        with self._available_lock:
+            if self._available_count is None:
+                return
+            self._available_count = 0 if exhausted else max(0, self._available_count + delta)
 
-            try:
-                conn.begin()
-                cursor = conn.cursor()
+    def allocate_account_batch(self, device_serials: List[str]) -> Dict[str, dict]:
+        """
+        批量分配账号，一个事务内按集合完成：
+        1. 一次查询已持有账号的设备；
+        2. 一次 SELECT ... LIMIT n FOR UPDATE SKIP LOCKED 抢占 n 个空闲账号，
+           其它进程正在抢占的行被跳过而不是等待；
+        3. 一条 UPDATE ... CASE 写入全部设备的锁定信息。
 
-                allocations = {}
+        Args:
+            device_serials: 设备序列号列表
 
-                for device_serial in device_serials:
-                    # 检查设备是否已有分配
-                    cursor.execute("""
-                        SELECT account_id, username, password, phone
-                        FROM ai_game_accounts
-                        WHERE locked_by = %s AND status = 'in_use'
-                    """, (device_serial,))
-
-                    existing_account = cursor.fetchone()
-
-                    if existing_account:
-                        # 设备已有分配，返回现有账号
-                        allocations[device_serial] = existing_account
-                        print(f"✅ 设备 {device_serial} 已分配账号: {existing_account['username']}")
-                        continue
-                    # 查找可用账号
-                    cursor.execute("""
-                        SELECT account_id, username, password, phone
-                        FROM ai_game_accounts
-                        WHERE status = 'available'
-                        AND locked_by IS NULL
-                        ORDER BY account_id
-                        LIMIT 1 FOR UPDATE
-                    """)
-
-                    account = cursor.fetchone()
-
-                    if account:                        # 锁定账号
-                        cursor.execute("""
-                            UPDATE ai_game_accounts
-                            SET status = 'in_use', locked_by = %s, lock_time = NOW()
-                            WHERE account_id = %s
-                        """, (device_serial, account['account_id']))
+        Returns:
+            Dict[str, dict]: {device_serial: account_info, ...}
+        """
+        serials = list(dict.fromkeys(s for s in device_serials if s))
+        if not serials:
+            return {}
+        self._ensure_account_pool()
 
+        conn = self.connection_pool.connection()
+        cursor = conn.cursor()
+        try:
+            self._begin(conn, cursor)
+            placeholders = ', '.join(['%s'] * len(serials))
+
+            # 已有分配的设备直接返回现有账号
+            cursor.execute(self._sql(f"""
+                SELECT account_id, username, password, phone, locked_by
+                FROM ai_game_accounts
+                WHERE status = 'in_use' AND locked_by IN ({placeholders})
+            """), serials)
+            allocations = {}
+            for row in self._rows(cursor):
+                allocations[row.pop('locked_by')] = row
+            for device_serial, account in allocations.items():
+                print(f"✅ 设备 {device_serial} 已分配账号: {account['username']}")
+
+            pending = [s for s in serials if s not in allocations]
+            newly_allocated = 0
+            if pending:
+                lock_clause = {
+                    'mysql_skip_locked': 'FOR UPDATE SKIP LOCKED',
+                    'mysql': 'FOR UPDATE',
+                }.get(self.dialect, '')
+                cursor.execute(self._sql(f"""
+                    SELECT account_id, username, password, phone
+                    FROM ai_game_accounts
+                    WHERE status = 'available'
+                    AND locked_by IS NULL
+                    ORDER BY account_id
+                    LIMIT %s {lock_clause}
+                """), (len(pending),))
+                accounts = self._rows(cursor)
+                pairs = list(zip(pending, accounts))
+
+                if pairs:
+                    case_sql = ' '.join(['WHEN %s THEN %s'] * len(pairs))
+                    id_placeholders = ', '.join(['%s'] * len(pairs))
+                    params = [v for serial, account in pairs for v in (account['account_id'], serial)]
+                    params += [account['account_id'] for _, account in pairs]
+                    cursor.execute(self._sql(f"""
+                        UPDATE ai_game_accounts
+                        SET status = 'in_use',
+                            locked_by = CASE account_id {case_sql} END,
+                            lock_time = CURRENT_TIMESTAMP
+                        WHERE account_id IN ({id_placeholders}) AND status = 'available'
+                    """), params)
+                    if cursor.rowcount != len(pairs):
+                        raise AccountAllocationError(
+                            f"锁定账号数不一致: 期望 {len(pairs)}，实际 {cursor.rowcount}")
+                    for device_serial, account in pairs:
                         allocations[device_serial] = account
                         print(f"✅ 为设备 {device_serial} 分配账号: {account['username']}")
+                    newly_allocated = len(pairs)
 
-                    else:
-                        print(f"❌ 没有可用账号分配给设备 {device_serial}")
+                for device_serial in pending[len(pairs):]:
+                    print(f"❌ 没有可用账号分配给设备 {device_serial}")
 
-                conn.commit()
-                print(f"✅ 批量分配完成，成功分配 {len(allocations)} 个账号")
-                return allocations
+            conn.commit()
+            self._adjust_available(-newly_allocated, exhausted=len(allocations) < len(serials))
+            print(f"✅ 批量分配完成，成功分配 {len(allocations)} 个账号")
+            return allocations
 
-            except Exception as e:
-                conn.rollback()
-                error_msg = f"账号分配失败: {e}"
-                print(f"❌ {error_msg}")
-                raise AccountAllocationError(error_msg)
+        except Exception as e:
+            conn.rollback()
+            error_msg = f"账号分配失败: {e}"
+            print(f"❌ {error_msg}")
+            raise AccountAllocationError(error_msg)
 
-            finally:
-                cursor.close()
-                conn.close()
+        finally:
+            cursor.close()
+            conn.close()
 
     def release_account_batch(self, device_serials: List[str]):
         """
-        批量释放账号
+        批量释放账号（一条 UPDATE ... WHERE locked_by IN (...)）
 
         Args:
             device_serials: 设备序列号列表
         """
-        with self.lock:
-            conn = self.connection_pool.connection()
-
-            try:
-                conn.begin()
-                cursor = conn.cursor()
-
-                released_count = 0
-
-                for device_serial in device_serials:
-                    cursor.execute("""
-                        UPDATE ai_game_accounts
-                        SET status = 'available', locked_by = NULL, lock_time = NULL
-                        WHERE locked_by = %s AND status = 'in_use'
-                    """, (device_serial,))
-
-                    if cursor.rowcount > 0:
-                        released_count += 1
-                        print(f"✅ 释放设备 {device_serial} 的账号")
-
-                conn.commit()
-                print(f"✅ 批量释放完成，共释放 {released_count} 个账号")
+        serials = list(dict.fromkeys(s for s in device_serials if s))
+        if not serials:
+            return
+        conn = self.connection_pool.connection()
+        cursor = conn.cursor()
+        try:
+            self._begin(conn, cursor)
+            placeholders = ', '.join(['%s'] * len(serials))
+            cursor.execute(self._sql(f"""
+                UPDATE ai_game_accounts
+                SET status = 'available', locked_by = NULL, lock_time = NULL
+                WHERE status = 'in_use' AND locked_by IN ({placeholders})
+            """), serials)
+            released_count = cursor.rowcount
+            conn.commit()
+            self._adjust_available(released_count)
+            print(f"✅ 批量释放完成，共释放 {released_count} 个账号")
 
-            except Exception as e:
-                conn.rollback()
-                error_msg = f"账号释放失败: {e}"
-                print(f"❌ {error_msg}")
-                raise AccountReleaseError(error_msg)
+        except Exception as e:
+            conn.rollback()
+            error_msg = f"账号释放失败: {e}"
+            print(f"❌ {error_msg}")
+            raise AccountReleaseError(error_msg)
 
-            finally:
-                cursor.close()
-                conn.close()
+        finally:
+            cursor.close()
+            conn.close()
 
     def allocate_account(self, device_serial: str) -> Optional[Dict]:
         """
@@ -326,25 +413,33 @@ class MySQLDistributedAccountManager:
             cursor.close()
             conn.close()
 
-    def get_available_accounts_count(self) -> int:
+    def get_available_accounts_count(self, refresh: bool = False) -> int:
         """
-        获取可用账号数量
+        获取可用账号数量（缓存计数，过期或 refresh=True 时才执行 COUNT）
 
         Returns:
             int: 可用账号数量
         """
-        conn = self.connection_pool.connection()
+        with self._available_lock:
+            if (not refresh and self._available_count is not None
+                    and time.time() - self._available_checked_at < self.AVAILABLE_COUNT_TTL):
+                return self._available_count
 
+        conn = self.connection_pool.connection()
+        cursor = conn.cursor()
         try:
-            cursor = conn.cursor()
             cursor.execute("""
                 SELECT COUNT(*) as count
                 FROM ai_game_accounts
                 WHERE status = 'available' AND locked_by IS NULL
             """)
 
-            result = cursor.fetchone()
-            return result['count'] if result else 0
+            rows = self._rows(cursor)
+            count = int(rows[0]['count']) if rows else 0
+            with self._available_lock:
+                self._available_count = count
+                self._available_checked_at = time.time()
+            return count
 
         except Exception as e:
             print(f"❌ 获取可用账号数量失败: {e}")
@@ -369,6 +464,7 @@ class MySQLDistributedAccountManager:
                 """)
 
                 conn.commit()
+                self._adjust_available(cursor.rowcount)
                 print(f"✅ 已清空所有账号分配，共释放 {cursor.rowcount} 个账号")
 
             except Exception as e:
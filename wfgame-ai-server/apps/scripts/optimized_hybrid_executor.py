@@ -104,8 +104,9 @@ def _device_worker_with_account(device_serial: str, scripts: List[dict],
         detect_buttons_func = None
         try:
             from replay_script import detect_buttons, load_yolo_model_for_detection
-            # 初始化YOLO模型
-            if load_yolo_model_for_detection():
+            from batch_inference import sidecar_available
+            # 初始化YOLO模型（进程内只加载一次；sidecar 批量推理服务可用时不加载）
+            if sidecar_available() or load_yolo_model_for_detection():
                 detect_buttons_func = detect_buttons
                 print(f"[Worker-{process_id}][{timestamp}] 设备 {device_serial} AI检测功能已加载")
             else:
@@ -368,6 +369,8 @@ def _device_worker_with_account(device_serial: str, scripts: List[dict],
                 shared_tracker._batch_upload_and_fill()
         except Exception:
             pass
+        if shared_tracker is not None:
+            shared_tracker.release_primary()
         try:
             if task_id is not None:
                 from replay_script import write_result as _write_result
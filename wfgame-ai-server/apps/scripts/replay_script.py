@@ -42,6 +42,20 @@ except Exception:
     Task = None
     print("⚠️ 未能导入 ORM 模型，设备、报告、任务的数据库查询将被跳过")
 
+try:
+    from replay_step_store import (
+        ReplayStepStore, list_devices as list_step_devices, load_records as load_step_records,
+    )
+except ImportError:
+    from apps.scripts.replay_step_store import (
+        ReplayStepStore, list_devices as list_step_devices, load_records as load_step_records,
+    )
+
+try:
+    from apps.tasks.replay_executor import publish_device_result
+except Exception:
+    publish_device_result = None
+
 # 懒加载 Socket 客户端（HTTP API 方式）
 _SOCKET_CLIENT = None
 ERROR_LOGS: List[str] = []  # 全局执行过程错误收集（非步骤级）
@@ -49,6 +63,8 @@ ERROR_LOGS: List[str] = []  # 全局执行过程错误收集（非步骤级）
 GLOBAL_REPLAY_TOTAL_STEPS: Optional[int] = None
 GLOBAL_REPLAY_SINGLE_DEVICE_STEPS: Optional[int] = None
 GLOBAL_INITIAL_DEVICE_COUNT: Optional[int] = None
+# 主设备租约时长（毫秒）：主设备进程异常退出后，其它设备最迟在此时长后接管事件推送
+PRIMARY_LEASE_TTL_MS = 15000
 
 
 def _get_socket_client():
@@ -67,6 +83,15 @@ def _get_socket_client():
         ERROR_LOGS.append(msg)
         return None
 
+
+def _publish_live_frame(room: str, image) -> bool:
+    """交给实时画面推流器，推流关闭或不可用时返回 False"""
+    try:
+        from utils.frame_streamer import publish_live_frame
+        return publish_live_frame(room, image)
+    except Exception:
+        return False
+
 # 轻量文件日志包装，避免未定义错误
 # 移除文件日志相关类（用户不需要），保留占位注释避免未来误添加
 
@@ -216,7 +241,7 @@ def parse_script_arguments(args_list):
 
 
 class StepTracker:
-    """固定 Redis Key 方案: wfgame:replay:task:<task_id>:device:<serial>:steps
+    """步骤追加写入 Redis（见 replay_step_store）: 每步一个 LIST 元素，状态变化按下标原地更新
 
     TODO(入库适配): 后续在这里增加一个 flush_to_db()，把 self.records 转换为 report_detail 表结构：
       - 一条脚本执行记录对应 report_detail 主记录
@@ -236,6 +261,9 @@ class StepTracker:
             self.redis_client = getattr(settings.REDIS, 'client', None)
         except Exception:
             self.redis_client = None
+        self._step_store = ReplayStepStore(self.redis_client, task_id, device_serial) if self.redis_client else None
+        # 主设备租约选举（首次推送事件时启动）
+        self._leader_election = None
         # 不再使用 socket_client，这里移除以减少依赖
         self.socket_client = None
         # 设备主键缓存与活跃设备集合快照，用于事件载荷
@@ -251,10 +279,11 @@ class StepTracker:
             # 设备路径标识：优先使用 Device 主键，失败回退到序列号
             self._device_key = str(self.device_serial)
             try:
-                dev = Device.objects.filter(device_id=self.device_serial).only('id').first()
-                if dev and getattr(dev, 'id', None) is not None:
-                    self._device_key = str(dev.id)
-                    self.device_pk = dev.id
+                from apps.devices.metadata_cache import get_device_pk
+                dev_pk = get_device_pk(self.device_serial)
+                if dev_pk is not None:
+                    self._device_key = str(dev_pk)
+                    self.device_pk = dev_pk
                 else:
                     self.device_pk = None
             except Exception:
@@ -308,18 +337,10 @@ class StepTracker:
                         completed_all = 0
                 else:
                     # 回退到按设备计数（在某些版本中仍保留历史数据）
-                    pattern = f"wfgame:replay:task:{self.task_id}:device:*:steps"
-                    for key in self.redis_client.scan_iter(match=pattern):
+                    for serial in list_step_devices(self.redis_client, self.task_id):
                         try:
-                            key_str = key.decode('utf-8') if isinstance(key, bytes) else str(key)
-                            parts = key_str.split(':')
-                            if len(parts) >= 2:
-                                devices_found.add(parts[-2])
-                            raw = self.redis_client.get(key)
-                            if not raw:
-                                continue
-                            val = raw.decode('utf-8') if isinstance(raw, bytes) else raw
-                            records = json.loads(val)
+                            devices_found.add(serial)
+                            records = load_step_records(self.redis_client, self.task_id, serial)
                             for rec in records or []:
                                 for s in rec.get('steps', []) or []:
                                     st = (s.get('result') or {}).get('status')
@@ -447,11 +468,10 @@ class StepTracker:
             return None
 
     def _redis_key(self):
-        """返回用于Redis的key，格式: wfgame:replay:task:<task_id>:device:<serial>:steps"""
-        try:
-            return f"wfgame:replay:task:{self.task_id}:device:{self.device_serial}:steps"
-        except Exception:
-            return f"wfgame:replay:task:unknown:device:{self.device_serial}:steps"
+        """返回步骤 LIST 的key，格式: wfgame:replay:task:<task_id>:device:<serial>:step_items"""
+        if self._step_store:
+            return self._step_store.steps_key
+        return f"wfgame:replay:task:{self.task_id}:device:{self.device_serial}:step_items"
 
     @property
     def detail(self):
@@ -467,7 +487,7 @@ class StepTracker:
         try:
             # 删除设备级快照
             key = self._redis_key()
-            self.redis_client.delete(key)
+            self._step_store.clear()
             # 删除聚合计数（总完成步数）和设备完成计数
             try:
                 completed_key = f"wfgame:replay:task:{self.task_id}:completed_total"
@@ -481,20 +501,31 @@ class StepTracker:
             track_error(f"⚠️ 清理 Redis 数据失败: {e}")
             track_error(f"⚠️ 清理 Redis 数据失败: {e}")
 
-    def _flush_to_redis(self):
-        """更新实时快照。
+    def _store_script(self):
+        """新脚本开始：追加脚本头与全部步骤（前端刷新时通过 HTTP 接口获取快照）"""
+        try:
+            if not self._step_store:
+                return
+            self._step_store.append_script(self.records[-1])
+            print_realtime(f"🧪 Redis追加: key={self._redis_key()} 步骤数={len(self.records[-1]['steps'])}")
+        except Exception as e:
+            track_error(f"⚠️ Redis写入失败: {e}")
 
-        改动：不再通过 Socket 推送 replay_snapshot（前端仅在刷新时通过 HTTP 接口获取快照）。
-        保留 Redis 写入，用于接口回退与历史查看。
-        """
-        # 仅写入 Redis（如配置了的话），供接口或诊断使用
+    def _store_step(self, idx: int, with_summary: bool = False):
+        """按下标原地更新当前脚本的一个步骤，写入量与已执行步数无关"""
         try:
-            if not self.redis_client:
+            if not self._step_store:
                 return
-            payload = json.dumps(self.records, ensure_ascii=False)
-            # 统一设置 7 天过期，避免历史无限增长
-            self.redis_client.set(self._redis_key(), payload, ex=7*24*3600)
-            print_realtime(f"🧪 Redis更新: key={self._redis_key()} 大小={len(payload)}")
+            self._step_store.update_step(len(self.records) - 1, self.records[-1], idx, with_summary=with_summary)
+        except Exception as e:
+            track_error(f"⚠️ Redis写入失败: {e}")
+
+    def _flush_to_redis(self):
+        """整体重写 Redis 快照（仅在批量回填远端地址后调用一次）"""
+        try:
+            if not self._step_store:
+                return
+            self._step_store.rewrite(self.records)
         except Exception as e:
             track_error(f"⚠️ Redis写入失败: {e}")
 
@@ -506,18 +537,18 @@ class StepTracker:
             return "wfgame:replay:task:unknown:primary_device"
 
     def _get_primary_device(self) -> Optional[str]:
-        try:
-            if not self.redis_client:
-                return None
-            raw = self.redis_client.get(self._primary_device_key())
-            if not raw:
-                return None
-            return raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else str(raw)
-        except Exception:
+        if not self._leader_election:
             return None
+        return self._leader_election.current_leader()
+
+    def _on_primary_change(self, is_leader: bool, token: int):
+        if is_leader:
+            print_realtime(f"🌟 设定主设备: {self.device_serial} (任期令牌 {token})")
+        else:
+            print_realtime(f"🔕 设备 {self.device_serial} 失去主设备租约")
 
     def _ensure_primary_device(self):
-        """若尚未设置主设备，则以当前设备设为主设备 (首次执行脚本/步骤)。"""
+        """参与主设备选举（首次执行脚本/步骤时启动，租约由心跳线程续期）。"""
         try:
             if not self.redis_client:
                 # 无 Redis 场景：直接视当前设备为主设备（仅一次打印）
@@ -525,24 +556,33 @@ class StepTracker:
                     print_realtime(f"🌟 [NO-REDIS] 默认主设备: {self.device_serial}")
                     self._primary_logged = True
                 return
-            if self._get_primary_device():
-                return
-            # 设置主设备，TTL 可适当设置防止遗留 (6 小时)
-            self.redis_client.set(self._primary_device_key(), str(self.device_serial), ex=6 * 3600)
-            print_realtime(f"🌟 设定主设备: {self.device_serial}")
+            if self._leader_election is None:
+                from utils.redis_helper import LeaderElection
+                self._leader_election = LeaderElection(
+                    self.redis_client, self._primary_device_key(), str(self.device_serial),
+                    ttl_ms=PRIMARY_LEASE_TTL_MS, on_change=self._on_primary_change,
+                )
+            self._leader_election.start()
         except Exception as e:
             track_error(f"⚠️ 设置主设备失败: {e}")
 
     def _is_primary_device(self) -> bool:
-        pd = self._get_primary_device()
-        is_primary = (pd is None) or (str(pd) == str(self.device_serial))
+        """只读本地租约状态，不访问 Redis；主设备掉线后其它设备在租约时长内接管"""
+        if not self._leader_election:
+            return True
+        is_primary = self._leader_election.is_leader()
         if not is_primary:
             # 只在首次被判非主设备时输出一次，避免刷屏
             if not hasattr(self, '_primary_warned'):
-                print_realtime(f"🔕 非主设备跳过事件推送: self={self.device_serial}, primary={pd}")
+                print_realtime(f"🔕 非主设备跳过事件推送: self={self.device_serial}, primary={self._get_primary_device()}")
                 self._primary_warned = True
         return is_primary
 
+    def release_primary(self):
+        """设备回放结束时退出选举并释放租约，其它设备立即接管"""
+        if self._leader_election:
+            self._leader_election.stop(release=True)
+
     def _push_progress_event(self, *, script_id: int, completed_steps: int = None, total_steps: int = None):
         """向 socket 房间推送进度事件（后端计算进度避免前端计算异常）"""
         try:
@@ -651,57 +691,10 @@ class StepTracker:
         except Exception as e:
             track_error(f"⚠️ 单步事件推送异常: {e}")
 
-    def _leader_key(self):
-        try:
-            return f"wfgame:replay:task:{self.task_id}:leader_device"
-        except Exception:
-            return "wfgame:replay:task:unknown:leader_device"
-
     def _am_i_leader(self) -> bool:
-        """基于当前任务所有设备的完成进度选出“领先设备”。完成步数多者为领先；持平时按设备序列号字典序选择。
-        仅领先设备负责推送 socket 更新，避免前端显示竞争。"""
-        try:
-            if not self.redis_client:
-                return True  # 未配置Redis则不做限制
-            pattern = f"wfgame:replay:task:{self.task_id}:device:*:steps"
-            leader_serial = None
-            leader_done = -1
-            for key in self.redis_client.scan_iter(match=pattern):
-                try:
-                    raw = self.redis_client.get(key)
-                    if not raw:
-                        continue
-                    try:
-                        val = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else raw
-                        records = json.loads(val)
-                    except Exception:
-                        records = []
-                    # 统计完成步数
-                    done = 0
-                    for rec in records or []:
-                        for s in rec.get('steps', []) or []:
-                            st = (s.get('result') or {}).get('status')
-                            if st in ("success", "failed"):
-                                done += 1
-                    # 提取设备序列号
-                    parts = (key.decode('utf-8') if isinstance(key, (bytes, bytearray)) else str(key)).split(':')
-                    serial = parts[-2] if len(parts) >= 2 else ''
-                    if done > leader_done or (done == leader_done and serial < (leader_serial or serial)):
-                        leader_done = done
-                        leader_serial = serial
-                except Exception:
-                    continue
-            if not leader_serial:
-                # 没有可比对的数据时，默认允许推送
-                return True
-            # 记录leader，短TTL即可；无需强一致
-            try:
-                self.redis_client.set(self._leader_key(), leader_serial, ex=300)
-            except Exception:
-                pass
-            return str(self.device_serial) == str(leader_serial)
-        except Exception:
-            return True
+        """是否为当前任务的领先（主）设备，由租约选举决定（不再扫描键空间）"""
+        self._ensure_primary_device()
+        return self._is_primary_device()
 
     def start_script(self, *, meta: dict, steps: list):
         """
@@ -781,7 +774,7 @@ class StepTracker:
         except Exception:
             pass
 
-        self._flush_to_redis()
+        self._store_script()
         # 不推送初始化事件；由后续 step_started/step_finished 产生的 replay_step 驱动前端更新
 
     def step_started(self, step_index: int, **kwargs):
@@ -803,7 +796,7 @@ class StepTracker:
         })
         st['result'] = res
 
-        self._flush_to_redis()
+        self._store_step(idx)
         # 推送单步“执行中”事件
         try:
             self._push_step_event(
@@ -899,7 +892,7 @@ class StepTracker:
         except Exception as e:
             track_error(f"⚠️ Redis进度更新失败: {e}")
 
-        self._flush_to_redis()
+        self._store_step(idx, with_summary=True)
         # 推送单步“完成/失败”事件（仅主设备）
         try:
             if self._is_primary_device():
@@ -919,11 +912,11 @@ class StepTracker:
                 # 新规范：不再推送 device_image；统一由 device_<pk> 房间 frame 事件承担
                 try:
                     lp = res.get('local_pic_pth')
-                    b64 = None
+                    pic_bytes = None
                     # 首选：直接读取本地图片
                     if lp and isinstance(lp, str) and os.path.isfile(lp):
                         with open(lp, 'rb') as f:
-                            b64 = base64.b64encode(f.read()).decode('utf-8')
+                            pic_bytes = f.read()
                     else:
                         # 兜底：基于 oss_pic_pth 反推设备报告目录中的相对路径，尝试读取本地文件
                         op = res.get('oss_pic_pth')
@@ -939,37 +932,39 @@ class StepTracker:
                                 cand = os.path.join(str(self.device_report_dir), rel)
                                 if os.path.isfile(cand):
                                     with open(cand, 'rb') as f:
-                                        b64 = base64.b64encode(f.read()).decode('utf-8')
+                                        pic_bytes = f.read()
                             except Exception:
-                                b64 = None
-                    if b64:
+                                pic_bytes = None
+                    if pic_bytes:
                         # 仅推送到设备主键ID对应的房间
                         room_dev_pk = None
                         try:
                             if Device:
-                                # 通过设备序列号字段定位设备，拿到其主键ID
-                                dev_obj = Device.objects.filter(device_id=self.device_serial).only('id', 'device_id').first()
-                                if dev_obj:
+                                # 通过设备序列号从进程内元数据缓存拿到其主键ID
+                                from apps.devices.metadata_cache import get_device_metadata
+                                dev_meta = get_device_metadata(self.device_serial)
+                                if dev_meta:
                                     # 前端房间命名使用 device_<primary_key>
-                                    room_dev_pk = f"device_{dev_obj.id}".strip()
+                                    room_dev_pk = dev_meta.room
                         except Exception as _room_dev_err:
                             track_error(f"⚠️ 查询设备ID用于房间名失败: {_room_dev_err}")
                         # 推送：device_<pk> 房间；并兼容性推送 device_<serial>（便于前端尚未拿到pk时展示）
+                        # 优先交给实时画面推流器（按房间节流、无人观看不编码），推流关闭时回退为 base64 JSON
+                        rooms = [room_dev_pk] if room_dev_pk else []
+                        rooms.append(f"device_{str(self.device_serial).strip()}")
                         client_tmp = _get_socket_client()
-                        if client_tmp:
-                            # 优先 pk 房间
-                            if room_dev_pk:
-                                try:
-                                    _ = client_tmp.emit(room=room_dev_pk, module='replay', event='frame', data=b64)
-                                except Exception as _push_err2:
-                                    track_error(f"⚠️ 推送 frame 到 {room_dev_pk} 失败: {_push_err2}")
-                            # 兼容性：同时推送到序列号房间 device_<serial>
+                        b64 = None
+                        for room_dev in rooms:
                             try:
-                                room_dev_serial = f"device_{str(self.device_serial).strip()}"
-                                _ = client_tmp.emit(room=room_dev_serial, module='replay', event='frame', data=b64)
-                            except Exception as _push_err3:
-                                # 降级失败不影响主流程
-                                pass
+                                if _publish_live_frame(room_dev, pic_bytes) or not client_tmp:
+                                    continue
+                                if b64 is None:
+                                    b64 = base64.b64encode(pic_bytes).decode('utf-8')
+                                _ = client_tmp.emit(room=room_dev, module='replay', event='frame', data=b64)
+                            except Exception as _push_err2:
+                                # 序列号房间为兼容性推送，失败不影响主流程
+                                if room_dev == room_dev_pk:
+                                    track_error(f"⚠️ 推送 frame 到 {room_dev} 失败: {_push_err2}")
                 except Exception as _b64_err:
                     track_error(f"⚠️ 设备截图 base64 推送失败: {_b64_err}")
             # debug print removed
@@ -983,7 +978,6 @@ class StepTracker:
         end_ts = datetime.now(timezone.utc)
         # 不再计算 summary 的 duration，保持最小字段
         _ = datetime.now(timezone.utc)
-        self._flush_to_redis()
 
         # 脚本结束后，检查是否所有脚本步骤都已完成，若是则推送完成状态
         try:
@@ -1194,6 +1188,11 @@ def write_result(log_dir, device_serial, result_data):
         }
         with open(result_file, 'w', encoding='utf-8') as f:
             json.dump(fallback_data, f, ensure_ascii=False, indent=4)
+        result_data = fallback_data
+
+    # 在回放执行器下运行时，结果同时写入任务结果 Stream，Celery 侧无需再扫描结果文件
+    if publish_device_result:
+        publish_device_result(device_serial, result_data)
 
 
 from airtest.core.api import set_logdir, auto_setup
@@ -1203,14 +1202,12 @@ import numpy as np
 import json
 import time
 import os
-import subprocess
 from threading import Thread, Event, Lock
 import queue
 import sys
 import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import shutil
-import io
 import re
 import glob
 from adbutils import adb
@@ -1431,6 +1428,7 @@ except Exception as e:
 
 # 全局YOLO模型变量
 model = None
+MODEL_LOAD_LOCK = Lock()
 
 
 
@@ -1451,12 +1449,23 @@ except ImportError:
         load_yolo_model = None
 
 
-def load_yolo_model_for_detection():
-    """只从config.ini的[paths]段读取model_path加载YOLO模型，未找到直接抛异常。禁止使用绝对路径。"""
+def load_yolo_model_for_detection(force_reload=False):
+    """只从config.ini的[paths]段读取model_path加载YOLO模型，未找到直接抛异常。禁止使用绝对路径。
+
+    进程内只加载一次：并发的设备线程共享同一个模型实例（force_reload 强制重新加载）。
+    """
     global model
     if YOLO is None:
         print_realtime("❌ 无法加载YOLO模型：ultralytics未正确导入")
         raise RuntimeError("YOLO未正确导入")
+    with MODEL_LOAD_LOCK:
+        if model is not None and not force_reload:
+            return True
+        return _load_yolo_model_locked()
+
+
+def _load_yolo_model_locked():
+    global model
     try:
         # 获取项目根目录并定位 config.ini
         from pathlib import Path
@@ -1503,100 +1512,60 @@ def load_yolo_model_for_detection():
         model = None
         raise
 
-def detect_buttons(frame, target_class=None, conf_threshold=None):
+def detect_frame(frame, conf_threshold=None, frame_scale=1.0):
     """
-    检测按钮，使用YOLO模型进行推理。
+    对一帧执行一次YOLO推理，返回全部类别的 FrameDetections（设备坐标），
+    同一帧上的多个步骤通过 find(class_name, conf) 查询，不再重复推理。
+    模型未加载（且无可用的 sidecar 批量推理服务）时抛出 RuntimeError。
+    """
+    if conf_threshold is None:
+        conf_threshold = get_confidence_threshold_from_config()
+    # 按配置走直接推理、进程内批量服务或 sidecar 批量服务
+    from batch_inference import discard_remote_backend, get_inference_backend
+    backend = get_inference_backend(model)
+    if backend is None:
+        raise RuntimeError("YOLO模型未加载")
+    try:
+        return backend.detect_all(frame, conf_threshold, frame_scale=frame_scale)
+    except (EOFError, OSError, ConnectionError) as e:
+        if not discard_remote_backend(backend):
+            raise
+        # sidecar 不可用：设备进程启动时未加载模型，此时懒加载本地模型改为进程内推理
+        print_realtime(f"⚠️ 批量推理服务连接中断({e})，改用本地YOLO模型推理")
+        load_yolo_model_for_detection()
+        backend = get_inference_backend(model)
+        if backend is None:
+            raise RuntimeError("YOLO模型未加载")
+        return backend.detect_all(frame, conf_threshold, frame_scale=frame_scale)
+
+
+def detect_buttons(frame, target_class=None, conf_threshold=None, frame_scale=1.0):
+    """
+    检测按钮，使用YOLO模型进行内存推理（不落盘）。
     坐标逆变换、类别匹配、置信度阈值等均支持灵活配置。
-    - frame: 输入的原始图像（numpy数组）
+    - frame: 输入的原始图像（BGR numpy数组），或 frame_grabber.Frame（自动降采样）
     - target_class: 目标类别名（如'button'）
     - conf_threshold: 置信度阈值（可选，优先级高于配置文件）
+    - frame_scale: frame 相对设备分辨率的缩放比，检测框按此映射回设备坐标
     返回: (success, (x, y, detected_class))
     """
-    global model
-
-    if model is None:
-        print_realtime("❌ 错误：YOLO模型未加载，无法进行检测")
-        return False, (None, None, None)
-
     try:
         print_realtime(f"🔍 开始检测目标类别: {target_class}")
-        import tempfile
-        import os
 
         # 优先使用传入参数，否则从config读取
         if conf_threshold is None:
             conf_threshold = get_confidence_threshold_from_config()
 
-        # 将frame保存为临时图片，供YOLO模型推理
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            temp_path = temp_file.name
-            cv2.imwrite(temp_path, frame)
-
-        try:
-            # 选择推理设备
-            device = "cuda" if hasattr(model, 'device') and 'cuda' in str(model.device) else "cpu"
-            # 执行YOLO推理，传入图片路径和相关参数
-            results = model.predict(
-                source=temp_path,      # 输入图片路径，YOLO要求文件路径而非numpy数组
-                device=device,         # 推理设备，'cuda'表示GPU，'cpu'表示CPU
-                imgsz=640,             # 推理时图片缩放到的尺寸（YOLO常用640x640）
-                conf=conf_threshold,   # 置信度阈值，低于该值的目标会被过滤
-                iou=0.6,               # NMS（非极大值抑制）IoU阈值，控制重叠框的合并
-                half=True if device == "cuda" else False,  # 是否使用半精度加速，仅GPU可用
-                max_det=300,           # 最大检测目标数，防止极端场景下过多框
-                verbose=False          # 是否输出详细推理日志
-            )
+        # 内存推理：letterbox/归一化在复用缓冲中完成，返回设备坐标
+        det = detect_frame(frame, conf_threshold, frame_scale=frame_scale).find(target_class)
+        if det is not None:
+            x, y = det.center
+            print_realtime(f"✅ 找到目标类别 {target_class}，中心坐标: ({x:.2f}, {y:.2f})，置信度: {det.confidence:.3f}")
+            return True, (x, y, det.class_name)
 
-            # 检查预测结果是否有效
-            if results is None or len(results) == 0:
-                # 如果模型推理结果为空，直接返回失败
-                print_realtime("⚠️ 警告：模型预测结果为空")
-                return False, (None, None, None)
-
-            # 检查结果中是否有boxes属性且不为None
-            if not hasattr(results[0], 'boxes') or results[0].boxes is None:
-                # 如果没有检测框，返回失败
-                print_realtime("⚠️ 警告：预测结果中没有检测框")
-                return False, (None, None, None)
-
-            # 获取原始图片的高和宽，用于坐标逆变换
-            orig_h, orig_w = frame.shape[:2]
-            print_realtime(f"📏 原始图片尺寸: {orig_w}x{orig_h}")
-
-
-            # 遍历所有检测到的目标框
-            for box in results[0].boxes:
-                # print_realtime(f"🔍 检测到目标框: {box.xyxy[0].tolist()}, 置信度: {box.conf.item():.3f}, 类别ID: {int(box.cls.item())}")
-                cls_id = int(box.cls.item())  # 获取类别ID
-                # 检查模型是否有类别名映射
-                if hasattr(model, 'names') and model.names is not None:
-                    detected_class = model.names[cls_id]  # 获取类别名
-                else:
-                    detected_class = f"class_{cls_id}"
-                # 判断检测到的类别是否为目标类别
-                if detected_class == target_class:
-                    # 取检测框的左上和右下坐标，计算中心点坐标
-                    box_coords = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-                    # print_realtime(f"🔍 检测到目标类别: {detected_class}, 坐标: {box_coords}")
-                    x = (box_coords[0] + box_coords[2]) / 2  # 中心点x
-                    y = (box_coords[1] + box_coords[3]) / 2  # 中心点y
-                    # print_realtime(f"🔍 计算得到中心点坐标: ({x:.2f}, {y:.2f})")
-
-                    # 打印检测到目标的日志，包括类别和置信度
-                    print_realtime(f"✅ 找到目标类别 {target_class}，中心坐标: ({x:.2f}, {y:.2f})，置信度: {box.conf.item():.3f}")
-                    # 返回检测成功和中心点坐标、类别名
-                    return True, (x, y, detected_class)
-
-            # 如果没有找到目标类别，返回失败
-            print_realtime(f"❌ 未找到目标类别: {target_class} ❌")
-            return False, (None, None, None)
-
-        finally:
-            # 清理临时文件
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        # 如果没有找到目标类别，返回失败
+        print_realtime(f"❌ 未找到目标类别: {target_class} ❌")
+        return False, (None, None, None)
 
     except Exception as e:
         print_realtime(f"按钮检测失败: {e}")
@@ -1749,23 +1718,19 @@ def parse_script_arguments(args_list):
     }
 
 
-def get_device_screenshot(device):
-    """获取设备截图的辅助函数 - 增强版 (整合)"""
-    # 1. 尝试 subprocess (最快)
+def get_device_screenshot(device, max_age=None):
+    """获取设备截图的辅助函数 - 增强版 (整合)
+
+    max_age: 可接受的帧陈旧秒数，None（默认）表示一个采集周期内的最新帧，0 表示调用之后开始采集的帧（输入操作之后使用）
+    """
+    # 1. 读取常驻帧采集器的最新帧（最快，不再每帧启动 adb 进程）
     try:
-        import subprocess
-        import io
-        from PIL import Image
-        result = subprocess.run(
-            f"adb -s {device.serial} exec-out screencap -p",
-            shell=True,
-            capture_output=True,
-            timeout=10
-        )
-        if result.returncode == 0 and result.stdout:
-            return Image.open(io.BytesIO(result.stdout))
+        from frame_grabber import grab_frame
+        frame = grab_frame(device.serial, max_age=max_age)
+        if frame is not None:
+            return frame.to_pil()
     except Exception as e:
-        print_realtime(f"⚠️ subprocess截图失败: {e}")
+        print_realtime(f"⚠️ 帧采集器截图失败: {e}")
 
     # 2. 尝试 Airtest (备用)
     try:
@@ -1876,41 +1841,50 @@ def process_priority_based_script(device, steps, meta, device_report_dir, action
     # 读取停滞控制参数
     stagnation_threshold = meta.get('stagnation_threshold')
     stagnation_tolerance = meta.get('stagnation_tolerance', 0.05)  # 默认0.05
-    prev_screenshot = None
+    prev_signature = None
     stagnation_counter = 0
 
+    # 帧变化门控：停滞判断比较缩略灰度签名；画面与上次推理时一致则沿用上次检测结果
+    from frame_change_gate import get_frame_change_gate
+    frame_gate = get_frame_change_gate()
+    gate_key = f"{device.serial}:priority"
+    frame_gate.invalidate(gate_key, reset_stats=True)
+
+    # 每轮仅推理一次：以配置阈值推理全部类别，各步骤再按自身置信度过滤
+    base_confidence = get_confidence_threshold_from_config()
+    cycle_timing_totals = {"capture_ms": 0.0, "inference_ms": 0.0, "query_ms": 0.0, "cycles": 0}
+
     while max_duration is None or (time.time() - priority_start_time) <= max_duration:
         cycle_count += 1
         print_realtime(f"🔄 第 {cycle_count} 轮检测循环开始")
+        cycle_timing = {"capture_ms": 0.0, "inference_ms": 0.0, "query_ms": 0.0}
 
         # 修复：初始化本轮匹配状态，避免未定义变量引用
         matched_any_target = False
         hit_step = None
 
         # 获取本轮通用截图用于AI检测和停滞检测
+        capture_start = time.perf_counter()
         try:
             base_screenshot = get_device_screenshot(device)
         except Exception:
             base_screenshot = None
+        cycle_timing["capture_ms"] = round((time.perf_counter() - capture_start) * 1000, 2)
 
         # ------------------ 界面停滞检测 ------------------
         current_screenshot = base_screenshot
+        current_signature = frame_gate.signature(current_screenshot)
 
-        # 比较截图相似度，更新停滞计数器
-        if prev_screenshot is not None and current_screenshot is not None and stagnation_threshold:
-            gray_prev = cv2.cvtColor(np.array(prev_screenshot), cv2.COLOR_RGB2GRAY)
-            gray_curr = cv2.cvtColor(np.array(current_screenshot), cv2.COLOR_RGB2GRAY)
-            diff = cv2.absdiff(gray_prev, gray_curr)
-            non_zero = np.count_nonzero(diff > 0)
-            total_pixels = diff.size
-            similarity = 1 - non_zero / total_pixels
+        # 比较截图相似度（签名上未变化像素占比），更新停滞计数器
+        if prev_signature is not None and current_signature is not None and stagnation_threshold:
+            similarity = 1 - frame_gate.compare(prev_signature, current_signature).changed_ratio
             if similarity >= stagnation_tolerance:
                 stagnation_counter += 1
             else:
                 stagnation_counter = 0
         else:
             stagnation_counter = 0
-        prev_screenshot = current_screenshot
+        prev_signature = current_signature
 
         # 达到停滞阈值，执行特殊操作阶段
         if stagnation_threshold and stagnation_counter >= stagnation_threshold:
@@ -1924,45 +1898,64 @@ def process_priority_based_script(device, steps, meta, device_report_dir, action
                     result = action_processor._handle_fallback_click_priority_mode(step, cycle_count, device_report_dir)
                 else:
                     continue
-                # 执行后检测界面变化
+                # 执行后检测界面变化（须为操作之后开始采集的帧）
                 try:
-                    new_screenshot = get_device_screenshot(device)
+                    new_screenshot = get_device_screenshot(device, max_age=0)
                 except Exception:
                     new_screenshot = None
-                if base_screenshot is not None and new_screenshot is not None:
-                    gray_base = cv2.cvtColor(np.array(base_screenshot), cv2.COLOR_RGB2GRAY)
-                    gray_new = cv2.cvtColor(np.array(new_screenshot), cv2.COLOR_RGB2GRAY)
-                    diff2 = cv2.absdiff(gray_base, gray_new)
-                    non_zero2 = np.count_nonzero(diff2 > 0)
-                    similarity2 = 1 - non_zero2 / diff2.size
+                new_signature = frame_gate.signature(new_screenshot)
+                if current_signature is not None and new_signature is not None:
+                    similarity2 = 1 - frame_gate.compare(current_signature, new_signature).changed_ratio
                     if similarity2 < stagnation_tolerance:
                         print_realtime("🔄 界面已变化，重置停滞计数，重新进入常规循环")
                         stagnation_counter = 0
-                        prev_screenshot = new_screenshot
+                        prev_signature = new_signature
                         matched_any_target = False
                         break
             continue  # 跳过本轮常规检测，进入下一轮
 
         # ------------------ Phase 1: AI 检测 ------------------
         print_realtime("🎯 [阶段1] 执行AI检测步骤")
-        for step_idx, step in enumerate(ai_detection_steps):
-            # 将截图转换并缓存
+        frame_detections = None
+        if ai_detection_steps:
             if base_screenshot is None:
-                screenshot = get_device_screenshot(device)
-            else:
-                screenshot = base_screenshot
-            frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+                base_screenshot = get_device_screenshot(device)
+                current_signature = frame_gate.signature(base_screenshot)
+            try:
+                if base_screenshot is None:
+                    raise RuntimeError("无法获取设备屏幕截图")
+                cache_hit, cached_detections = frame_gate.lookup(gate_key, current_signature)
+                if cache_hit:
+                    frame_detections = cached_detections
+                    print_realtime(f"  [Replay] 画面未变化，沿用上次检测结果: {frame_detections.classes}")
+                else:
+                    frame = cv2.cvtColor(np.array(base_screenshot), cv2.COLOR_RGB2BGR)
+                    # 本轮唯一一次推理，得到全部类别的检测结果
+                    frame_detections = detect_frame(frame, base_confidence)
+                    frame_gate.store(gate_key, current_signature, frame_detections)
+                    detection_count += 1
+                    cycle_timing["inference_ms"] = frame_detections.inference_ms
+                    print_realtime(
+                        f"  [Replay] 本轮推理 {frame_detections.inference_ms:.1f}ms，"
+                        f"检测到类别: {frame_detections.classes}"
+                    )
+            except Exception as e:
+                print_realtime(f"  ❌ [Replay] AI检测异常: {e}")
 
+        query_start = time.perf_counter()
+        for step_idx, step in enumerate(ai_detection_steps if frame_detections is not None else []):
             step_class = step.get('yolo_class')
             priority = step.get('Priority', 999)
             print_realtime(f"  [Replay] 尝试AI检测 P{priority}: {step_class}")
             try:
-                # 使用批量检测或一次性调用detect_buttons
-                success, detection_result = action_processor.detect_buttons(frame, target_class=step_class)
-                detection_count += 1
-                if success and detection_result[0] is not None:
-                    # 命中，执行点击和日志记录
-                    result = action_processor._handle_ai_detection_click_priority_mode(step, cycle_count, device_report_dir)
+                step_confidence = max(base_confidence, step.get('confidence', 0.6))
+                detection = frame_detections.find(step_class, conf=step_confidence)
+                if detection is not None:
+                    # 命中，复用本轮检测结果执行点击和日志记录
+                    x, y = detection.center
+                    result = action_processor._handle_ai_detection_click_priority_mode(
+                        step, cycle_count, device_report_dir, detection_result=(x, y, detection.class_name)
+                    )
                     if result.success and result.executed:
                         matched_any_target = True
                         hit_step = step
@@ -1973,7 +1966,15 @@ def process_priority_based_script(device, steps, meta, device_report_dir, action
                     print_realtime(f"  ❌ [Replay] AI检测未命中: {step_class}")
             except Exception as e:
                 print_realtime(f"  ❌ [Replay] AI检测异常: {e}")
-                detection_count += 1
+        cycle_timing["query_ms"] = round((time.perf_counter() - query_start) * 1000, 2)
+
+        for key in ("capture_ms", "inference_ms", "query_ms"):
+            cycle_timing_totals[key] += cycle_timing[key]
+        cycle_timing_totals["cycles"] += 1
+        print_realtime(
+            f"⏱️ 第 {cycle_count} 轮耗时: 截图 {cycle_timing['capture_ms']:.1f}ms, "
+            f"推理 {cycle_timing['inference_ms']:.1f}ms, 步骤查询 {cycle_timing['query_ms']:.1f}ms"
+        )
 
         # 如果AI检测有命中，记录日志并继续下一轮
         if matched_any_target and hit_step:
@@ -2033,6 +2034,18 @@ def process_priority_based_script(device, steps, meta, device_report_dir, action
 
         time.sleep(0.5)
 
+    timed_cycles = cycle_timing_totals["cycles"]
+    if timed_cycles:
+        print_realtime(
+            f"⏱️ 平均每轮: 截图 {cycle_timing_totals['capture_ms'] / timed_cycles:.1f}ms, "
+            f"推理 {cycle_timing_totals['inference_ms'] / timed_cycles:.1f}ms, "
+            f"步骤查询 {cycle_timing_totals['query_ms'] / timed_cycles:.1f}ms, 推理次数 {detection_count}"
+        )
+    gate_stats = frame_gate.stats(gate_key)
+    print_realtime(
+        f"📊 帧变化门控: 检查 {gate_stats['checks']} 次，画面未变化跳过推理 {gate_stats['skips']} 次 "
+        f"(跳过率 {gate_stats['skip_rate']}%)"
+    )
     print_realtime(f"优先级模式执行完成，共执行 {cycle_count} 个循环")
     return cycle_count > 0
 
@@ -2507,6 +2520,8 @@ def replay_device(device, scripts, screenshot_queue, action_queue, click_queue,
             print_realtime("📤 已批量上传当前设备报告目录到远端，并填充步骤中的 oss_pic_pth")
     except Exception as _up_e:
         track_error(f"⚠️ 批量上传设备报告目录失败: {_up_e}")
+    if tracker:
+        tracker.release_primary()
     if device_account:
         try:
             account_manager = get_account_manager()
@@ -2515,6 +2530,31 @@ def replay_device(device, scripts, screenshot_queue, action_queue, click_queue,
         except Exception as e:
             print_realtime(f"❌ 账号释放失败: {e}")
 
+    try:
+        from frame_grabber import stop_frame_grabber
+        stop_frame_grabber(device.serial)
+    except Exception:
+        pass
+
+    try:
+        from apps.devices.metadata_cache import device_metadata_cache
+        meta_stats = device_metadata_cache.stats()
+        print_realtime(
+            f"📊 设备元数据缓存: 命中 {meta_stats['hits']} 次，数据库查询 {meta_stats['db_queries']} 次"
+        )
+    except Exception:
+        pass
+
+    try:
+        from utils.frame_streamer import live_frame_stats
+        for room_name, stream_stats in live_frame_stats().items():
+            print_realtime(
+                f"📊 实时画面 {room_name}: 提交 {stream_stats['submitted']} 帧，发送 {stream_stats['sent']} 帧，"
+                f"丢弃旧帧 {stream_stats['dropped']}，无人观看跳过 {stream_stats['no_viewer']}"
+            )
+    except Exception:
+        pass
+
     print_realtime(f"🎉 设备 {device_name} 回放完成，总执行脚本数: {total_executed}")
     stop_event.set()
 
@@ -3229,7 +3269,7 @@ def main():
                     try:
                         print_realtime(f"🎯 开始处理设备: {device_name}")
                         if task_id is not None:
-                            print_realtime(f"🧵 Redis步骤Key: wfgame:replay:task:{task_id}:device:{device_name}:steps")
+                            print_realtime(f"🧵 Redis步骤Key: wfgame:replay:task:{task_id}:device:{device_name}:step_items")
 
                         # 确定日志目录
                         device_log_dir = log_dir if log_dir else None
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+回放步骤的 Redis 存储（追加写 + 增量读取）
+每台设备的 Key（前缀 wfgame:replay:task:<task_id>:device:<serial>）:
+    :step_items  LIST，每个步骤一个 JSON 元素，按脚本先后顺序追加
+    :scripts     HASH，脚本序号 -> JSON {"meta", "summary", "start", "count"}
+    :changes     ZSET，成员 s:<步骤下标> / h:<脚本序号> / e:error（设备错误），分数为最后一次修改的序号
+    :seq         修改序号计数器（单调递增，清理时不删除）
+    :base        最近一次清理时的序号，早于它的游标必须重新取全量
+任务级索引 wfgame:replay:task:<task_id>:devices（SET）记录有数据的设备，
+读取方据此枚举设备，不再扫描键空间。
+
+脚本开始时一次性追加其全部步骤；步骤状态变化按下标 LSET 原地更新，
+脚本统计只改对应 HASH 字段。每步写入量与已执行步数无关。
+读取方可带上次返回的游标，只取之后新增/修改的步骤（read_device）。
+每台设备只有一个写入方（所属回放进程），修改按序号顺序落库。
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+# 统一 7 天过期，避免历史无限增长
+STEP_TTL = 7 * 24 * 3600
+
+
+def _device_prefix(task_id, serial) -> str:
+    return f"wfgame:replay:task:{task_id}:device:{serial}"
+
+
+def steps_key(task_id, serial) -> str:
+    return f"{_device_prefix(task_id, serial)}:step_items"
+
+
+def scripts_key(task_id, serial) -> str:
+    return f"{_device_prefix(task_id, serial)}:scripts"
+
+
+def error_key(task_id, serial) -> str:
+    return f"{_device_prefix(task_id, serial)}:error"
+
+
+def devices_index_key(task_id) -> str:
+    return f"wfgame:replay:task:{task_id}:devices"
+
+
+def serial_from_key(key) -> str:
+    """从 ...:device:<serial>:<suffix> 中取出设备序列号"""
+    key = key.decode('utf-8') if isinstance(key, (bytes, bytearray)) else str(key)
+    parts = key.split(':')
+    return parts[-2] if len(parts) >= 2 else ''
+
+
+def _text(raw) -> str:
+    return raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else str(raw)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _loads(raw, default):
+    if raw is None:
+        return default
+    try:
+        return json.loads(_text(raw))
+    except Exception:
+        return default
+
+
+def _header(record: dict, start: int) -> dict:
+    return {
+        "meta": record.get("meta", {}),
+        "summary": record.get("summary", {}),
+        "start": start,
+        "count": len(record.get("steps", [])),
+    }
+
+
+class ReplayStepStore:
+    """单台设备的步骤存储（写入方）"""
+
+    def __init__(self, redis_client, task_id, serial):
+        self.redis_client = redis_client
+        self.task_id = task_id
+        self.serial = serial
+        prefix = _device_prefix(task_id, serial)
+        self.steps_key = f"{prefix}:step_items"
+        self.scripts_key = f"{prefix}:scripts"
+        self.changes_key = f"{prefix}:changes"
+        self.seq_key = f"{prefix}:seq"
+        self.base_key = f"{prefix}:base"
+        self.index_key = devices_index_key(task_id)
+        # 每个脚本第一个步骤在 LIST 中的下标
+        self._starts: List[int] = []
+        self._length = 0
+
+    def _next_seq(self) -> int:
+        seq = self.redis_client.incr(self.seq_key)
+        if seq == 1:
+            self.redis_client.expire(self.seq_key, STEP_TTL)
+        return seq
+
+    def _expire_all(self, pipe):
+        for key in (self.steps_key, self.scripts_key, self.changes_key, self.seq_key, self.index_key):
+            pipe.expire(key, STEP_TTL)
+
+    def clear(self):
+        """清空设备数据；序号保留并记为 base，使旧游标失效"""
+        seq = self._next_seq()
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.delete(self.steps_key, self.scripts_key, self.changes_key)
+        pipe.set(self.base_key, seq, ex=STEP_TTL)
+        pipe.execute()
+        self._starts = []
+        self._length = 0
+
+    def append_script(self, record: dict):
+        """追加一个脚本：写入脚本头并一次性追加其全部步骤"""
+        start = self._length
+        record_no = len(self._starts)
+        steps = record.get("steps", [])
+        seq = self._next_seq()
+        changes = {f"s:{start + i}": seq for i in range(len(steps))}
+        changes[f"h:{record_no}"] = seq
+        pipe = self.redis_client.pipeline(transaction=True)
+        if steps:
+            pipe.rpush(self.steps_key, *[_dumps(s) for s in steps])
+        pipe.hset(self.scripts_key, str(record_no), _dumps(_header(record, start)))
+        pipe.zadd(self.changes_key, changes)
+        pipe.sadd(self.index_key, str(self.serial))
+        self._expire_all(pipe)
+        pipe.execute()
+        self._starts.append(start)
+        self._length += len(steps)
+
+    def update_step(self, record_no: int, record: dict, step_idx: int, with_summary: bool = False):
+        """按下标原地更新一个步骤，with_summary 时同时更新脚本统计"""
+        start = self._starts[record_no]
+        seq = self._next_seq()
+        changes = {f"s:{start + step_idx}": seq}
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lset(self.steps_key, start + step_idx, _dumps(record["steps"][step_idx]))
+        if with_summary:
+            pipe.hset(self.scripts_key, str(record_no), _dumps(_header(record, start)))
+            changes[f"h:{record_no}"] = seq
+        pipe.zadd(self.changes_key, changes)
+        pipe.execute()
+
+    def rewrite(self, records: List[dict]):
+        """整体重写（仅用于任务结束后批量回填远端地址等一次性修改）"""
+        seq = self._next_seq()
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.delete(self.steps_key, self.scripts_key, self.changes_key)
+        starts, length, changes = [], 0, {}
+        for record_no, record in enumerate(records):
+            steps = record.get("steps", [])
+            if steps:
+                pipe.rpush(self.steps_key, *[_dumps(s) for s in steps])
+            pipe.hset(self.scripts_key, str(record_no), _dumps(_header(record, length)))
+            changes.update({f"s:{length + i}": seq for i in range(len(steps))})
+            changes[f"h:{record_no}"] = seq
+            starts.append(length)
+            length += len(steps)
+        if changes:
+            pipe.zadd(self.changes_key, changes)
+        pipe.sadd(self.index_key, str(self.serial))
+        self._expire_all(pipe)
+        pipe.execute()
+        self._starts, self._length = starts, length
+
+
+def assemble_records(items: List[Any], headers: Dict[Any, Any]) -> List[Dict[str, Any]]:
+    """把 LIST 步骤与脚本头还原为 [{"meta", "steps", "summary"}, ...]"""
+    steps = [_loads(item, {}) for item in items or []]
+    records = []
+    for record_no in sorted((headers or {}).keys(), key=lambda k: int(k)):
+        header = _loads(headers[record_no], {})
+        start = int(header.get("start", 0))
+        records.append({
+            "meta": header.get("meta", {}),
+            "steps": steps[start:start + int(header.get("count", 0))],
+            "summary": header.get("summary", {}),
+        })
+    return records
+
+
+def load_records(redis_client, task_id, serial) -> List[Dict[str, Any]]:
+    """读取设备的全部脚本记录（一次 LRANGE + HGETALL）"""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(steps_key(task_id, serial), 0, -1)
+    pipe.hgetall(scripts_key(task_id, serial))
+    items, headers = pipe.execute()
+    return assemble_records(items, headers)
+
+
+def list_devices(redis_client, task_id) -> List[str]:
+    """任务下有数据的设备（读索引集合，不扫描键空间）"""
+    return sorted(_text(m) for m in redis_client.smembers(devices_index_key(task_id)) or ())
+
+
+def set_device_error(redis_client, task_id, serial, error_text: str):
+    """
+    记录设备级错误信息，并把设备登记到任务索引，无步骤记录的设备也能出现在快照中
+    错误同样记为一次修改（推进 :seq），带游标的读取方会收到含 error_message 的增量而不是 unchanged
+    """
+    store = ReplayStepStore(redis_client, task_id, serial)
+    seq = store._next_seq()
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.set(error_key(task_id, serial), error_text, ex=STEP_TTL)
+    pipe.zadd(store.changes_key, {"e:error": seq})
+    pipe.sadd(store.index_key, str(serial))
+    store._expire_all(pipe)
+    pipe.execute()
+
+
+def read_device(redis_client, task_id, serial, cursor: Optional[int] = None) -> Dict[str, Any]:
+    """
+    读取设备快照，cursor 为上次返回的游标
+
+    Returns:
+        {"device", "cursor", "mode", "error_message", ...}
+        mode=full:      "records" 为全量记录（无游标、游标已失效或数据被清理后）
+        mode=delta:     "scripts" 为有变化的脚本头 {"script_no", "meta", "summary", "start", "count"}，
+                        "steps" 为有变化的步骤 {"script_no", "step_no", "step"}
+        mode=unchanged: 游标之后没有任何修改
+    """
+    prefix = _device_prefix(task_id, serial)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.get(f"{prefix}:seq")
+    pipe.get(f"{prefix}:base")
+    pipe.get(error_key(task_id, serial))
+    seq_raw, base_raw, error_raw = pipe.execute()
+    seq, base = int(seq_raw or 0), int(base_raw or 0)
+    entry = {"device": serial, "error_message": _text(error_raw) if error_raw else ""}
+
+    if cursor is not None and base <= cursor <= seq:
+        if cursor == seq:
+            return dict(entry, cursor=cursor, mode="unchanged")
+        changed = redis_client.zrangebyscore(f"{prefix}:changes", f"({cursor}", "+inf", withscores=True)
+        if not changed:
+            return dict(entry, cursor=cursor, mode="unchanged")
+        step_indexes = []
+        script_nos = set()
+        for member, score in changed:
+            kind, _, number = _text(member).partition(":")
+            if kind == "s":
+                step_indexes.append(int(number))
+            elif kind == "h":
+                script_nos.add(int(number))
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hgetall(f"{prefix}:scripts")
+        for index in step_indexes:
+            pipe.lindex(f"{prefix}:step_items", index)
+        results = pipe.execute()
+        headers = {int(k): _loads(v, {}) for k, v in (results[0] or {}).items()}
+        # 步骤下标 -> (脚本序号, 脚本内序号)
+        spans = sorted((h.get("start", 0), no, h.get("count", 0)) for no, h in headers.items())
+        steps = []
+        for index, raw in zip(step_indexes, results[1:]):
+            for start, no, count in spans:
+                if start <= index < start + count:
+                    steps.append({"script_no": no, "step_no": index - start, "step": _loads(raw, {})})
+                    break
+        scripts = [dict(headers[no], script_no=no) for no in sorted(script_nos) if no in headers]
+        # 游标取本次实际读到的最大修改序号，未落库的修改下次仍会返回
+        new_cursor = int(max(score for _, score in changed))
+        return dict(entry, cursor=new_cursor, mode="delta", scripts=scripts, steps=steps)
+
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(f"{prefix}:step_items", 0, -1)
+    pipe.hgetall(f"{prefix}:scripts")
+    pipe.zrevrange(f"{prefix}:changes", 0, 0, withscores=True)
+    items, headers, latest = pipe.execute()
+    # 与全量数据同一事务读取的最大序号，保证游标之前的修改都已包含在 records 中
+    new_cursor = int(latest[0][1]) if latest else base
+    return dict(entry, cursor=new_cursor, mode="full", records=assemble_records(items, headers))
+
+
+def delete_task_keys(redis_client, task_id):
+    """清理任务下所有设备的步骤存储与错误信息（按索引集合定位，不扫描键空间）"""
+    for serial in list_devices(redis_client, task_id):
+        ReplayStepStore(redis_client, task_id, serial).clear()
+        redis_client.delete(error_key(task_id, serial))
+    redis_client.delete(devices_index_key(task_id))
+
+
+__all__ = [
+    "ReplayStepStore",
+    "assemble_records",
+    "delete_task_keys",
+    "list_devices",
+    "load_records",
+    "read_device",
+    "serial_from_key",
+    "set_device_error",
+]
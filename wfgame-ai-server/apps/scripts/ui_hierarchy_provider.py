@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+UI层次结构缓存
+每台设备一个 provider：uiautomator dump 经 adb exec-out 直接从 stdout 流式读取
+（不再 dump 到设备文件再 adb pull），并把结果与 dump 前一帧的屏幕签名一起缓存。
+之后的查询只需取一帧比较签名，画面未变化即复用上次的 XML；
+任何输入操作（invalidate）或画面变化都会使缓存失效。
+
+配置（config.ini [settings]）:
+    ui_hierarchy_cache_enabled  是否复用缓存（关闭后每次查询都重新 dump，仍走流式读取）
+    ui_hierarchy_cache_max_age  缓存最长复用秒数
+"""
+
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# 流式 dump 命令，按顺序尝试，记住设备上第一个成功的
+STREAM_DUMP_COMMANDS = (
+    "uiautomator dump /dev/stdout",
+    "uiautomator dump /proc/self/fd/1",
+    # 部分 ROM 不允许写 stdout：dump 到临时文件后在同一次会话内 cat，仍只需一次 adb 往返
+    "uiautomator dump /data/local/tmp/wfgame_ui_dump.xml >/dev/null && "
+    "cat /data/local/tmp/wfgame_ui_dump.xml",
+)
+DUMP_TIMEOUT = 15
+DEFAULT_MAX_AGE = 10.0
+# 连续多少次流式 dump 全部失败后改用文件方式
+STREAM_FAILURE_LIMIT = 2
+# 无法取得屏幕签名时，缓存仅在该秒数内有效
+UNVERIFIED_TTL = 1.0
+# 校验签名时可接受的帧陈旧秒数
+SIGNATURE_FRAME_MAX_AGE = 0.2
+SIGNATURE_FRAME_TIMEOUT = 3.0
+
+
+def load_ui_cache_settings() -> Dict[str, object]:
+    """读取 config.ini [settings] 中的UI层次结构缓存配置（Django 不可用时使用默认值）"""
+    values = {"enabled": True, "max_age": DEFAULT_MAX_AGE}
+    try:
+        from django.conf import settings
+
+        config = settings.CFG._config
+        values["enabled"] = config.getboolean("settings", "ui_hierarchy_cache_enabled", fallback=True)
+        values["max_age"] = config.getfloat(
+            "settings", "ui_hierarchy_cache_max_age", fallback=DEFAULT_MAX_AGE)
+    except Exception:
+        pass
+    return values
+
+
+def extract_hierarchy_xml(output: str) -> Optional[str]:
+    """从 dump 输出中截取 XML（去掉 “UI hierchary dumped to ...” 等提示行）"""
+    start = output.find("<?xml")
+    if start < 0:
+        start = output.find("<hierarchy")
+    end = output.rfind("</hierarchy>")
+    if start < 0 or end < start:
+        return None
+    xml_content = output[start:end + len("</hierarchy>")]
+    return xml_content if len(xml_content) > 100 else None
+
+
+class UiHierarchyProvider:
+    """单台设备的UI层次结构缓存"""
+
+    def __init__(self, serial: Optional[str], enabled: bool = True,
+                 max_age: float = DEFAULT_MAX_AGE, adb_path: str = "adb"):
+        self.serial = serial
+        self.enabled = enabled
+        self.max_age = max_age
+        self.adb_prefix = [adb_path] + (["-s", serial] if serial else [])
+        self._lock = threading.Lock()
+        self._xml: Optional[str] = None
+        self._signature = None
+        self._dumped_at = 0.0
+        self._command_index = 0
+        self._stream_failures = 0
+        self._stats = {"requests": 0, "hits": 0, "dumps": 0, "invalidations": 0, "dump_ms": 0.0}
+
+    def _screen_signature(self):
+        """取当前屏幕签名，采集失败返回 None"""
+        if not self.serial:
+            return None
+        try:
+            from frame_change_gate import get_frame_change_gate
+            from frame_grabber import grab_frame
+
+            frame = grab_frame(self.serial, max_age=SIGNATURE_FRAME_MAX_AGE, timeout=SIGNATURE_FRAME_TIMEOUT)
+            return get_frame_change_gate().signature(frame)
+        except Exception:
+            return None
+
+    def _is_fresh(self, signature) -> bool:
+        if not self.enabled or self._xml is None:
+            return False
+        age = time.time() - self._dumped_at
+        if age > self.max_age:
+            return False
+        if signature is None or self._signature is None:
+            return age <= UNVERIFIED_TTL
+        from frame_change_gate import get_frame_change_gate
+
+        return get_frame_change_gate().is_same(self._signature, signature)
+
+    def _dump_stream(self) -> Optional[str]:
+        """经 exec-out 流式 dump，从上次成功的命令开始尝试"""
+        if self._stream_failures >= STREAM_FAILURE_LIMIT:
+            return None
+        for offset in range(len(STREAM_DUMP_COMMANDS)):
+            index = (self._command_index + offset) % len(STREAM_DUMP_COMMANDS)
+            try:
+                result = subprocess.run(
+                    self.adb_prefix + ["exec-out", STREAM_DUMP_COMMANDS[index]],
+                    capture_output=True, timeout=DUMP_TIMEOUT,
+                )
+            except subprocess.TimeoutExpired:
+                print(f"⚠️ UI dump超时: {STREAM_DUMP_COMMANDS[index]}")
+                continue
+            except Exception as e:
+                print(f"⚠️ UI dump执行失败: {e}")
+                break
+            xml_content = extract_hierarchy_xml(result.stdout.decode("utf-8", errors="replace"))
+            if xml_content:
+                self._command_index = index
+                self._stream_failures = 0
+                return xml_content
+        self._stream_failures += 1
+        if self._stream_failures >= STREAM_FAILURE_LIMIT:
+            print("⚠️ 设备不支持流式UI dump，改用文件方式")
+        return None
+
+    def get(self, fallback: Optional[Callable[[], Optional[str]]] = None,
+            force: bool = False) -> Optional[str]:
+        """
+        获取UI层次结构XML
+
+        Args:
+            fallback: 流式 dump 不可用时的获取方法（如 dump 到文件再 pull）
+            force: 忽略缓存，强制重新 dump
+        """
+        with self._lock:
+            self._stats["requests"] += 1
+            # dump 前取签名：dump 期间画面若有变化，下次查询必然重新 dump；
+            # 缓存关闭或强制 dump 时不使用签名，不额外截图
+            use_cache = self.enabled and not force
+            signature = self._screen_signature() if use_cache else None
+            if use_cache and self._is_fresh(signature):
+                self._stats["hits"] += 1
+                print("♻️ 画面未变化，复用UI层次结构缓存")
+                return self._xml
+
+            start = time.perf_counter()
+            xml_content = self._dump_stream()
+            if xml_content is None and fallback is not None:
+                xml_content = fallback()
+            self._stats["dumps"] += 1
+            self._stats["dump_ms"] += (time.perf_counter() - start) * 1000
+            self._xml = xml_content
+            self._signature = signature
+            self._dumped_at = time.time()
+            return xml_content
+
+    def invalidate(self):
+        """输入操作后调用，下一次查询重新 dump"""
+        with self._lock:
+            if self._xml is not None:
+                self._stats["invalidations"] += 1
+            self._xml = None
+            self._signature = None
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stats = dict(self._stats)
+        dumps = stats["dumps"]
+        stats["avg_dump_ms"] = round(stats.pop("dump_ms") / dumps, 1) if dumps else 0.0
+        stats["hit_rate"] = round(stats["hits"] / stats["requests"] * 100, 1) if stats["requests"] else 0.0
+        return stats
+
+
+_PROVIDERS: Dict[Optional[str], UiHierarchyProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_ui_hierarchy_provider(serial: Optional[str]) -> UiHierarchyProvider:
+    """获取（必要时创建）设备的UI层次结构缓存，进程内每台设备只保留一个"""
+    with _PROVIDERS_LOCK:
+        provider = _PROVIDERS.get(serial)
+        if provider is None:
+            provider = _PROVIDERS[serial] = UiHierarchyProvider(serial, **load_ui_cache_settings())
+        return provider
+
+
+def invalidate_ui_hierarchy(serial: Optional[str]):
+    """使设备的UI层次结构缓存失效（对设备执行输入操作后调用）"""
+    with _PROVIDERS_LOCK:
+        provider = _PROVIDERS.get(serial)
+    if provider is not None:
+        provider.invalidate()
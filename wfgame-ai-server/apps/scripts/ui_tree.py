@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+内存UI树
+由 uiautomator dump 的 XML 字符串一次解析而成，按 text、resource-id、class、
+content-desc 建立哈希索引，另有归一化文本索引用于模糊匹配。
+元素查询为 O(1)（精确）或 O(k)（k 为不同文本数，模糊），全程无临时文件读写；
+同一份 XML 在进程内只解析一次（get_ui_tree 按 XML 内容缓存）。
+"""
+
+import re
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 进程内缓存的UI树数量
+TREE_CACHE_SIZE = 4
+
+_BOUNDS_RE = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """模糊匹配用的归一化文本：全半角统一、小写、去空白"""
+    if not text:
+        return ""
+    return _WHITESPACE_RE.sub("", unicodedata.normalize("NFKC", text)).lower()
+
+
+def bounds_center(bounds: str) -> Optional[Tuple[int, int]]:
+    """解析 "[x1,y1][x2,y2]"，返回中心点坐标"""
+    match = _BOUNDS_RE.match(bounds or "")
+    if not match:
+        return None
+    x1, y1, x2, y2 = map(int, match.groups())
+    return (x1 + x2) // 2, (y1 + y2) // 2
+
+
+def _is_true(value: Optional[str]) -> bool:
+    return (value or "false").lower() == "true"
+
+
+class UiElementList(list):
+    """_parse_ui_xml 返回的元素列表，附带来源UI树以便按类别索引查询"""
+
+    def __init__(self, elements: Iterable[Dict[str, Any]] = (), tree: Optional["UiTree"] = None):
+        super().__init__(elements)
+        self.tree = tree
+
+
+class UiTree:
+    """
+    解析后的UI层次结构
+
+    nodes 为全部节点的原始属性（文档顺序，与递归先序遍历一致），
+    elements 为回放系统使用的元素字典（仅保留有文本、可点击或输入框/按钮类节点）。
+    """
+
+    def __init__(self, xml_content: str):
+        self.root = ET.fromstring(xml_content)
+        self.nodes: List[Dict[str, str]] = [node.attrib for node in self.root.iter()]
+        self._by_text: Dict[str, List[int]] = {}
+        self._by_resource_id: Dict[str, List[int]] = {}
+        self._by_class: Dict[str, List[int]] = {}
+        self._by_content_desc: Dict[str, List[int]] = {}
+        self._by_normalized_text: Dict[str, List[int]] = {}
+        for index, attrs in enumerate(self.nodes):
+            text = attrs.get('text', '')
+            if text:
+                self._by_text.setdefault(text, []).append(index)
+                stripped = text.strip()
+                if stripped != text:
+                    self._by_text.setdefault(stripped, []).append(index)
+            for value, table in ((attrs.get('resource-id'), self._by_resource_id),
+                                 (attrs.get('class'), self._by_class),
+                                 (attrs.get('content-desc'), self._by_content_desc)):
+                if value:
+                    table.setdefault(value, []).append(index)
+            for value in (text, attrs.get('content-desc', '')):
+                normalized = normalize_text(value)
+                if normalized:
+                    bucket = self._by_normalized_text.setdefault(normalized, [])
+                    if not bucket or bucket[-1] != index:
+                        bucket.append(index)
+        self._elements: Optional[UiElementList] = None
+        self._element_order: Dict[int, int] = {}
+        self._elements_by_class: Dict[str, List[Dict[str, Any]]] = {}
+
+    # ---- 原始节点查询 ----
+
+    def _first(self, indexes: Optional[List[int]], clickable: Optional[bool] = None) -> Optional[Dict[str, str]]:
+        for index in indexes or ():
+            attrs = self.nodes[index]
+            if clickable is None or _is_true(attrs.get('clickable')) == clickable:
+                return attrs
+        return None
+
+    def find_by_text(self, text: str, clickable: Optional[bool] = None) -> Optional[Dict[str, str]]:
+        """按文本精确查找第一个节点（文本两端空白忽略）"""
+        return self._first(self._by_text.get(text), clickable)
+
+    def find_by_resource_id(self, resource_id: str, clickable: Optional[bool] = None) -> Optional[Dict[str, str]]:
+        return self._first(self._by_resource_id.get(resource_id), clickable)
+
+    def find_by_content_desc(self, content_desc: str, clickable: Optional[bool] = None) -> Optional[Dict[str, str]]:
+        return self._first(self._by_content_desc.get(content_desc), clickable)
+
+    def find_all_by_class(self, class_name: str) -> List[Dict[str, str]]:
+        return [self.nodes[i] for i in self._by_class.get(class_name, ())]
+
+    def find_by_text_fuzzy(self, keyword: str, clickable: Optional[bool] = None) -> Optional[Dict[str, str]]:
+        """
+        模糊查找文本或 content-desc 包含关键字的节点
+        先查归一化后的精确索引，未命中再扫描各不同文本（O(k)）
+        """
+        normalized = normalize_text(keyword)
+        if not normalized:
+            return None
+        exact = self._first(self._by_normalized_text.get(normalized), clickable)
+        if exact is not None:
+            return exact
+        # 按文档顺序返回最靠前的匹配节点
+        indexes = sorted(
+            index for key, bucket in self._by_normalized_text.items() if normalized in key
+            for index in bucket
+        )
+        return self._first(indexes, clickable)
+
+    def contains(self, text: Optional[str] = None, resource_id: Optional[str] = None) -> bool:
+        """是否存在指定文本或 resource-id 的节点（空文本视为匹配无文本节点）"""
+        if text is not None and (self._by_text.get(text) if text else len(self.nodes) > 0):
+            return True
+        return bool(resource_id and self._by_resource_id.get(resource_id))
+
+    # ---- 回放系统元素字典 ----
+
+    def element_list(self) -> UiElementList:
+        """元素字典列表的副本（元素字典共享），调用方可自由增删"""
+        return UiElementList(self.elements, tree=self)
+
+    @property
+    def elements(self) -> UiElementList:
+        """回放系统使用的元素字典列表（首次访问时生成并缓存）"""
+        if self._elements is None:
+            elements = []
+            for attrs in self.nodes:
+                class_name = attrs.get('class', '')
+                text = attrs.get('text', '').strip()
+                clickable = _is_true(attrs.get('clickable'))
+                # 只保留有用的元素
+                if not (text or clickable or 'EditText' in class_name or 'Button' in class_name):
+                    continue
+                element = {
+                    'text': text,
+                    'hint': attrs.get('hint', ''),
+                    'resource_id': attrs.get('resource-id', ''),
+                    'class': class_name,
+                    'content_desc': attrs.get('content-desc', ''),
+                    'bounds': attrs.get('bounds', ''),
+                    'clickable': clickable,
+                    'focusable': _is_true(attrs.get('focusable')),
+                    'focused': _is_true(attrs.get('focused')),
+                    'enabled': _is_true(attrs.get('enabled')),
+                    'password': _is_true(attrs.get('password')),
+                    'checkable': _is_true(attrs.get('checkable')),
+                    'checked': _is_true(attrs.get('checked')),
+                    'scrollable': _is_true(attrs.get('scrollable')),
+                    'package': attrs.get('package', ''),
+                }
+                self._element_order[id(element)] = len(elements)
+                self._elements_by_class.setdefault(class_name, []).append(element)
+                elements.append(element)
+            self._elements = UiElementList(elements, tree=self)
+        return self._elements
+
+    def elements_of_classes(self, class_types: Iterable[str]) -> List[Dict[str, Any]]:
+        """按类别索引取元素字典，保持文档顺序"""
+        self.elements  # 确保索引已生成
+        class_types = list(dict.fromkeys(class_types))
+        if len(class_types) == 1:
+            return list(self._elements_by_class.get(class_types[0], ()))
+        selected = [e for c in class_types for e in self._elements_by_class.get(c, ())]
+        selected.sort(key=lambda e: self._element_order[id(e)])
+        return selected
+
+
+_TREES: "OrderedDict[str, UiTree]" = OrderedDict()
+_TREES_LOCK = threading.Lock()
+
+
+def get_ui_tree(xml_content: str) -> UiTree:
+    """
+    获取 XML 对应的UI树，同一份 XML 只解析一次
+    解析失败时抛出 xml.etree.ElementTree.ParseError
+    """
+    with _TREES_LOCK:
+        tree = _TREES.get(xml_content)
+        if tree is not None:
+            _TREES.move_to_end(xml_content)
+            return tree
+    tree = UiTree(xml_content)
+    with _TREES_LOCK:
+        _TREES[xml_content] = tree
+        while len(_TREES) > TREE_CACHE_SIZE:
+            _TREES.popitem(last=False)
+    return tree
+
+
+def elements_of_classes(elements: List[Dict[str, Any]], class_types: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    从元素列表中取指定类别的元素（文档顺序）
+    元素列表来自 UiTree 时走类别索引，否则线性过滤
+    """
+    tree = getattr(elements, 'tree', None)
+    if tree is not None and len(elements) == len(tree.elements):
+        return tree.elements_of_classes(class_types)
+    class_types = set(class_types)
+    return [e for e in elements if e.get('class') in class_types]
@@ -58,6 +58,7 @@ from django.conf import settings
 from .models import (
     Script, ScriptCategory, ScriptVersion, ScriptExecution
 )
+from .replay_step_store import list_devices as list_step_devices, read_device as read_step_device
 from .serializers import (
     ScriptSerializer, ScriptCategorySerializer, ScriptVersionSerializer,
     ScriptExecutionSerializer, ScriptCreateSerializer, ScriptUpdateSerializer
@@ -1688,15 +1689,22 @@ def get_replay_snapshot(request):
     请求体:
     {
       "task_id": "<taskId>",
-      "device": "<optional device serial>"
+      "device": "<optional device serial>",
+      "cursors": {"<serial>": <上次返回的游标>}   // 可选，带上后只返回增量
     }
 
     响应:
     {
       "task_id": "...",
-      "devices": [{"device": "serial", "records": [...]}],
+      "devices": [{"device": "serial", "mode": "full", "records": [...], "cursor": 12},
+                  {"device": "serial", "mode": "delta", "scripts": [...], "steps": [...], "cursor": 15},
+                  {"device": "serial", "mode": "unchanged", "cursor": 9}],
+      "cursors": {"<serial>": <新游标>},
       "ts": <epoch_ms>
     }
+    delta 中 steps 为 {"script_no", "step_no", "step"}，按位置替换；scripts 为变化的脚本 meta/summary。
+    全部设备无变化时只返回 {"task_id", "unchanged": true, "cursors", "ts"}。
+    Redis 无数据回退数据库时不返回游标（mode 缺省即全量）。
     """
     try:
         data = request.data or {}
@@ -1704,6 +1712,12 @@ def get_replay_snapshot(request):
         device = str(data.get('device') or '').strip()
         if not task_id:
             return api_response(code=400, msg='缺少 task_id')
+        cursors = {}
+        for serial, cursor in (data.get('cursors') or {}).items():
+            try:
+                cursors[str(serial)] = int(cursor)
+            except (TypeError, ValueError):
+                continue
 
         entries = []
 
@@ -1715,58 +1729,19 @@ def get_replay_snapshot(request):
             redis_client = None
 
         if redis_client:
-            if device:
-                key = f"wfgame:replay:task:{task_id}:device:{device}:steps"
-                raw = redis_client.get(key)
-                records = []
-                if raw:
+            try:
+                # 设备来自任务级索引集合，不扫描键空间
+                serials = [device] if device else list_step_devices(redis_client, task_id)
+                for serial in serials:
+                    cursor = cursors.get(serial)
                     try:
-                        val = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else raw
-                        records = json.loads(val)
-                    except Exception:
-                        records = []
-
-                # 尝试获取 Redis 中的错误信息
-                err_msg = ""
-                try:
-                    err_key = f"wfgame:replay:task:{task_id}:device:{device}:error"
-                    err_raw = redis_client.get(err_key)
-                    if err_raw:
-                        err_msg = err_raw.decode('utf-8') if isinstance(err_raw, (bytes, bytearray)) else str(err_raw)
-                except Exception:
-                    pass
-
-                entries.append({"device": device, "records": records, "error_message": err_msg})
-            else:
-                pattern = f"wfgame:replay:task:{task_id}:device:*:steps"
-                try:
-                    for key in redis_client.scan_iter(match=pattern):
-                        k = key.decode('utf-8') if isinstance(key, (bytes, bytearray)) else str(key)
-                        parts = k.split(':')
-                        serial = parts[-2] if len(parts) >= 2 else ''
-                        raw = redis_client.get(key)
-                        records = []
-                        if raw:
-                            try:
-                                val = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else raw
-                                records = json.loads(val)
-                            except Exception:
-                                records = []
-
-                        # 尝试获取 Redis 中的错误信息
-                        err_msg = ""
-                        try:
-                            err_key = f"wfgame:replay:task:{task_id}:device:{serial}:error"
-                            err_raw = redis_client.get(err_key)
-                            if err_raw:
-                                err_msg = err_raw.decode('utf-8') if isinstance(err_raw, (bytes, bytearray)) else str(err_raw)
-                        except Exception as e:
-                            logger.warning(f"获取Redis错误信息失败: {e}")
-
-                        entries.append({"device": serial, "records": records, "error_message": err_msg})
-                except Exception:
-                    # 忽略扫描 Redis 失败，继续回退逻辑
-                    pass
+                        entries.append(read_step_device(redis_client, task_id, serial, cursor))
+                    except Exception as e:
+                        logger.warning(f"读取设备 {serial} 快照失败: {e}")
+                        entries.append({"device": serial, "records": [], "error_message": "", "mode": "full"})
+            except Exception:
+                # 忽略读取 Redis 失败，继续回退逻辑
+                pass
 
         # 2) 从数据库 ReportDetail（历史快照）补充或回退
         #  - 若 Redis 没有任何数据，则直接使用 DB 快照
@@ -1792,10 +1767,11 @@ def get_replay_snapshot(request):
             except Exception as _db_err:
                 logger.warning(f"读取数据库快照失败: {_db_err}")
         else:
-            # Redis 有 entries 时，追加 DB 的 error_message 信息
+            # Redis 有 entries 时，追加 DB 的 error_message 信息（无变化的设备客户端已有，跳过）
             try:
                 from apps.reports.models import ReportDetail
-                serials = [e.get('device') for e in entries if e.get('device')]
+                serials = [e.get('device') for e in entries
+                           if e.get('device') and e.get('mode') != 'unchanged' and not e.get('error_message')]
                 if serials:
                     qs = (ReportDetail.objects.all_teams()
                           .select_related('report', 'device')
@@ -1817,9 +1793,18 @@ def get_replay_snapshot(request):
             except Exception as _db_err2:
                 logger.debug("补充 error_message 失败: %s", _db_err2)
 
+        if entries and all(e.get('mode') == 'unchanged' for e in entries):
+            # 全部设备无变化：只回游标
+            return api_response(data={
+                'task_id': task_id,
+                'unchanged': True,
+                'cursors': {e['device']: e['cursor'] for e in entries},
+                'ts': int(time.time() * 1000)
+            })
         return api_response(data={
             'task_id': task_id,
             'devices': entries,
+            'cursors': {e['device']: e['cursor'] for e in entries if e.get('cursor') is not None},
             'ts': int(time.time() * 1000)
         })
     except Exception as e:
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+YOLO 内存推理
+直接接收解码后的 BGR ndarray（或 frame_grabber.Frame），在内存中完成
+letterbox、归一化与推理，复用预分配（CUDA 下为锁页）输入缓冲，
+返回已映射回设备坐标的检测框，热路径上没有任何文件读写。
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+LETTERBOX_FILL = 114
+
+
+@dataclass
+class Detection:
+    """单个检测结果（设备坐标）"""
+
+    class_id: int
+    class_name: str
+    confidence: float
+    box: Tuple[float, float, float, float]  # x1, y1, x2, y2
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        x1, y1, x2, y2 = self.box
+        return (x1 + x2) / 2, (y1 + y2) / 2
+
+
+class FrameDetections:
+    """
+    单帧全类别检测结果
+    一次推理得到全部类别的检测框，同一帧上的多个步骤按类别名查询，
+    检测成本与步骤数量无关。
+    """
+
+    def __init__(self, detections: List[Detection], conf: float, inference_ms: float = 0.0):
+        self.detections = detections
+        self.conf = conf  # 推理时使用的最低置信度
+        self.inference_ms = inference_ms
+        self._by_class: Dict[str, List[Detection]] = {}
+        for det in detections:
+            self._by_class.setdefault(det.class_name, []).append(det)
+
+    def __len__(self):
+        return len(self.detections)
+
+    @property
+    def classes(self) -> List[str]:
+        return list(self._by_class)
+
+    def find(self, class_name: str, conf: Optional[float] = None) -> Optional[Detection]:
+        """返回该类别置信度最高且不低于 conf 的检测框，没有则返回 None"""
+        candidates = self._by_class.get(class_name)
+        if not candidates:
+            return None
+        best = candidates[0]  # 已按置信度降序
+        if conf is not None and best.confidence < conf:
+            return None
+        return best
+
+
+class YoloFrameDetector:
+    """
+    基于 ultralytics YOLO 的内存推理器
+    首次调用时借助 predict 初始化 AutoBackend（设备选择、半精度等保持与官方一致），
+    之后每批只做 letterbox -> 缓冲区拷贝 -> 一次前向 -> NMS。
+    支持多帧批量推理（detect_batch），输入缓冲按最大批次预分配并复用。
+    任何快速路径异常都会回退为 model.predict(ndarray 列表)，仍不落盘。
+    """
+
+    def __init__(self, yolo, imgsz: int = 640, iou: float = 0.6, max_det: int = 300):
+        self.yolo = yolo
+        self.imgsz = imgsz
+        self.iou = iou
+        self.max_det = max_det
+        self.device = "cuda" if hasattr(yolo, 'device') and 'cuda' in str(yolo.device) else "cpu"
+        self.half = self.device == "cuda"
+        self._lock = threading.Lock()
+        self._backend = None
+        self._fast_path = True
+        # 预分配的 letterbox 画布、RGB 缓冲与输入张量，按批次容量复用
+        self._capacity = 0
+        self._canvas = None
+        self._rgb = None
+        self._host_input = None
+        self._device_input = None
+
+    @property
+    def names(self):
+        names = getattr(self._backend, 'names', None) or getattr(self.yolo, 'names', None)
+        return names or {}
+
+    def class_name(self, class_id: int) -> str:
+        try:
+            return self.names[class_id]
+        except (KeyError, IndexError, TypeError):
+            return f"class_{class_id}"
+
+    def _predict_kwargs(self, conf: float):
+        return dict(
+            device=self.device,
+            imgsz=self.imgsz,
+            conf=conf,
+            iou=self.iou,
+            half=self.half,
+            max_det=self.max_det,
+            verbose=False,
+        )
+
+    def _ensure_buffers(self, batch_size: int):
+        if batch_size <= self._capacity:
+            return
+        shape = (batch_size, self.imgsz, self.imgsz, 3)
+        self._canvas = np.full(shape, LETTERBOX_FILL, dtype=np.uint8)
+        self._rgb = np.empty_like(self._canvas)
+        if self._backend is not None:
+            import torch
+
+            tensor_shape = (batch_size, 3, self.imgsz, self.imgsz)
+            dtype = torch.float16 if getattr(self._backend, 'fp16', False) else torch.float32
+            use_cuda = str(self._backend.device).startswith("cuda")
+            self._host_input = torch.empty(tensor_shape, dtype=dtype, pin_memory=use_cuda)
+            self._device_input = (
+                torch.empty(tensor_shape, dtype=dtype, device=self._backend.device)
+                if use_cuda else self._host_input
+            )
+        self._capacity = batch_size
+
+    def _ensure_backend(self):
+        if self._backend is not None:
+            return
+        # 用一张空白画布初始化 predictor（加载权重到设备、融合、半精度）
+        blank = np.full((self.imgsz, self.imgsz, 3), LETTERBOX_FILL, dtype=np.uint8)
+        self.yolo.predict(source=blank, **self._predict_kwargs(0.99))
+        self._backend = self.yolo.predictor.model
+        capacity, self._capacity = self._capacity, 0
+        self._ensure_buffers(max(capacity, 1))
+
+    def _letterbox(self, frame: np.ndarray, index: int) -> Tuple[float, int, int]:
+        """将帧等比缩放并居中填充到第 index 块复用画布，返回 (缩放比, x 填充, y 填充)"""
+        height, width = frame.shape[:2]
+        ratio = min(self.imgsz / height, self.imgsz / width)
+        new_w, new_h = max(1, round(width * ratio)), max(1, round(height * ratio))
+        pad_x, pad_y = (self.imgsz - new_w) // 2, (self.imgsz - new_h) // 2
+        interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+        resized = frame if (new_w, new_h) == (width, height) else cv2.resize(
+            frame, (new_w, new_h), interpolation=interpolation
+        )
+        canvas = self._canvas[index]
+        canvas.fill(LETTERBOX_FILL)
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized
+        return ratio, pad_x, pad_y
+
+    def _detect_fast(self, frames: List[np.ndarray], conf: float) -> List[List[Tuple]]:
+        import torch
+        from ultralytics.utils import ops
+
+        self._ensure_backend()
+        batch = len(frames)
+        self._ensure_buffers(batch)
+        letterboxes = []
+        for index, frame in enumerate(frames):
+            letterboxes.append(self._letterbox(frame, index))
+            cv2.cvtColor(self._canvas[index], cv2.COLOR_BGR2RGB, dst=self._rgb[index])
+        host = self._host_input[:batch]
+        host.copy_(torch.from_numpy(self._rgb[:batch]).permute(0, 3, 1, 2))
+        host.mul_(1.0 / 255)
+        device_input = self._device_input[:batch]
+        if self._device_input is not self._host_input:
+            device_input.copy_(host, non_blocking=True)
+
+        with torch.inference_mode():
+            preds = self._backend(device_input)
+        dets = ops.non_max_suppression(preds, conf, self.iou, max_det=self.max_det)
+
+        batch_rows = []
+        for frame, (ratio, pad_x, pad_y), det in zip(frames, letterboxes, dets):
+            rows = []
+            height, width = frame.shape[:2]
+            if det is not None and len(det):
+                for x1, y1, x2, y2, score, cls in det.float().cpu().tolist():
+                    x1 = min(max((x1 - pad_x) / ratio, 0), width)
+                    x2 = min(max((x2 - pad_x) / ratio, 0), width)
+                    y1 = min(max((y1 - pad_y) / ratio, 0), height)
+                    y2 = min(max((y2 - pad_y) / ratio, 0), height)
+                    rows.append((int(cls), score, (x1, y1, x2, y2)))
+            batch_rows.append(rows)
+        return batch_rows
+
+    def _detect_predict(self, frames: List[np.ndarray], conf: float) -> List[List[Tuple]]:
+        results = self.yolo.predict(source=list(frames), **self._predict_kwargs(conf)) or []
+        batch_rows = []
+        for result in results:
+            boxes = getattr(result, 'boxes', None)
+            batch_rows.append([
+                (int(box.cls.item()), float(box.conf.item()), tuple(box.xyxy[0].tolist()))
+                for box in (boxes if boxes is not None else [])
+            ])
+        batch_rows.extend([] for _ in range(len(frames) - len(batch_rows)))
+        return batch_rows
+
+    def _prepare(self, frame, frame_scale: float) -> Tuple[Optional[np.ndarray], float]:
+        if hasattr(frame, 'to_bgr'):
+            return frame.to_bgr(max_side=self.imgsz), frame.scale_for(self.imgsz)
+        if frame is not None and not frame.flags['C_CONTIGUOUS']:
+            frame = np.ascontiguousarray(frame)
+        return frame, frame_scale
+
+    def detect_batch(self, frames: List, confs: List[float],
+                     frame_scales: Optional[List[float]] = None) -> List[List[Detection]]:
+        """
+        一次前向推理多帧（可来自不同设备）
+
+        Args:
+            frames: BGR ndarray 或 frame_grabber.Frame 列表
+            confs: 每帧各自的置信度阈值（以最小值推理，再逐帧过滤）
+            frame_scales: 每帧相对设备分辨率的缩放比
+
+        Returns:
+            与 frames 对应的 Detection 列表（置信度降序，设备坐标）
+        """
+        frame_scales = frame_scales or [1.0] * len(frames)
+        prepared = [self._prepare(f, sc) for f, sc in zip(frames, frame_scales)]
+        valid = [i for i, (f, _) in enumerate(prepared) if f is not None]
+        results: List[List[Detection]] = [[] for _ in frames]
+        if not valid:
+            return results
+        batch_frames = [prepared[i][0] for i in valid]
+        batch_conf = min(confs[i] for i in valid)
+
+        with self._lock:
+            batch_rows = None
+            if self._fast_path:
+                try:
+                    batch_rows = self._detect_fast(batch_frames, batch_conf)
+                except Exception as e:
+                    print(f"⚠️ YOLO内存快速推理不可用，回退为 predict(ndarray): {e}")
+                    self._fast_path = False
+            if batch_rows is None:
+                batch_rows = self._detect_predict(batch_frames, batch_conf)
+
+        for i, rows in zip(valid, batch_rows):
+            scale = prepared[i][1]
+            inv = 1.0 / scale if scale else 1.0
+            detections = [
+                Detection(cls_id, self.class_name(cls_id), float(score),
+                          tuple(v * inv for v in box))
+                for cls_id, score, box in rows
+                if score >= confs[i]
+            ]
+            detections.sort(key=lambda d: d.confidence, reverse=True)
+            results[i] = detections
+        return results
+
+    def detect(self, frame, conf: float, frame_scale: float = 1.0) -> List[Detection]:
+        """
+        检测一帧中的全部目标
+
+        Args:
+            frame: BGR ndarray，或 frame_grabber.Frame（自动按 imgsz 在主机端降采样）
+            conf: 置信度阈值
+            frame_scale: ndarray 相对设备分辨率的缩放比（已降采样的帧 < 1）
+
+        Returns:
+            按置信度降序的 Detection 列表，坐标为设备坐标
+        """
+        return self.detect_batch([frame], [conf], [frame_scale])[0]
+
+    def detect_all(self, frame, conf: float, frame_scale: float = 1.0) -> FrameDetections:
+        """一次推理得到该帧全部类别的检测结果"""
+        start = time.perf_counter()
+        detections = self.detect(frame, conf, frame_scale=frame_scale)
+        return FrameDetections(detections, conf, round((time.perf_counter() - start) * 1000, 2))
+
+
+_DETECTORS = {}
+_DETECTORS_LOCK = threading.Lock()
+
+
+def get_frame_detector(yolo, imgsz: int = 640) -> Optional[YoloFrameDetector]:
+    """按模型实例缓存推理器（模型重新加载后自动新建）"""
+    if yolo is None:
+        return None
+    with _DETECTORS_LOCK:
+        detector = _DETECTORS.get(id(yolo))
+        if detector is None or detector.yolo is not yolo or detector.imgsz != imgsz:
+            detector = YoloFrameDetector(yolo, imgsz=imgsz)
+            _DETECTORS.clear()
+            _DETECTORS[id(yolo)] = detector
+        return detector
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+# @File    : replay_executor
+# @Desc    : 回放执行器：在常驻子进程池中运行 replay_script，设备结果经 Redis Stream 回传
+
+
+"""
+Celery worker 不再在自身进程内调用 replay_script.main()：
+- 回放在常驻子进程（apps/tasks/replay_worker.py）中执行，子进程启动时预加载
+  Django、replay_script 及其依赖（cv2/YOLO 等），后续任务无需重复导入；
+- 回放状态、模型、线程全部留在子进程内，子进程执行若干任务后自动回收，
+  Celery worker 内存与回放隔离；
+- 任务下发与完成通知走 multiprocessing.connection 控制连接（POSIX 为 Unix socket，
+  Windows 为命名管道，与 --pool=solo 的 Windows Celery worker 兼容），
+  与回放日志输出（stdout/stderr）互不干扰；
+- 每台设备的结果由 replay_script.write_result 写入 Redis Stream（回放进程派生的
+  子进程同样可写），执行器边执行边读取，不再扫描磁盘上的 result.json。
+
+配置（config.ini [settings]）:
+    replay_worker_pool_size      子进程数量上限（每个 Celery worker 进程）
+    replay_worker_max_jobs       单个子进程执行多少个任务后回收
+    replay_worker_start_timeout  子进程预加载超时（秒）
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from multiprocessing.connection import Listener
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 回放进程通过该环境变量得知结果 Stream 的 Key（派生的子进程自动继承）
+RESULT_STREAM_ENV = "WFGAME_REPLAY_RESULT_STREAM"
+# 控制连接认证密钥（经环境变量传递，不出现在命令行中）
+WORKER_AUTHKEY_ENV = "WFGAME_REPLAY_WORKER_AUTHKEY"
+RESULT_STREAM_TTL = 24 * 3600
+RESULT_STREAM_MAXLEN = 10000
+DEFAULT_POOL_SIZE = 1
+DEFAULT_MAX_JOBS = 20
+DEFAULT_START_TIMEOUT = 300.0
+POLL_INTERVAL = 0.5
+
+SERVER_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replay_worker.py')
+
+
+def load_executor_settings() -> Dict[str, Any]:
+    """读取 config.ini [settings] 中的回放执行器配置（Django 不可用时使用默认值）"""
+    values = {
+        "pool_size": DEFAULT_POOL_SIZE,
+        "max_jobs": DEFAULT_MAX_JOBS,
+        "start_timeout": DEFAULT_START_TIMEOUT,
+    }
+    try:
+        from django.conf import settings
+
+        config = settings.CFG._config
+        values["pool_size"] = config.getint("settings", "replay_worker_pool_size", fallback=DEFAULT_POOL_SIZE)
+        values["max_jobs"] = config.getint("settings", "replay_worker_max_jobs", fallback=DEFAULT_MAX_JOBS)
+        values["start_timeout"] = config.getfloat(
+            "settings", "replay_worker_start_timeout", fallback=DEFAULT_START_TIMEOUT)
+    except Exception:
+        pass
+    return values
+
+
+def _redis_client():
+    try:
+        from django.conf import settings
+        return getattr(getattr(settings, 'REDIS', None), 'client', None)
+    except Exception:
+        return None
+
+
+def result_stream_key(task_id: int, run_id: str) -> str:
+    return f"wfgame:replay:task:{task_id}:results:{run_id}"
+
+
+def publish_device_result(device_serial: str, payload: Dict[str, Any]) -> bool:
+    """
+    回放进程内调用：把设备结果写入当前任务的结果 Stream
+
+    Returns:
+        False 表示不在执行器下运行（未设置 Stream）或 Redis 不可用
+    """
+    key = os.environ.get(RESULT_STREAM_ENV)
+    redis_client = _redis_client() if key else None
+    if not redis_client:
+        return False
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xadd(key, {"device": str(device_serial), "payload": json.dumps(payload, ensure_ascii=False, default=str)},
+                  maxlen=RESULT_STREAM_MAXLEN, approximate=True)
+        pipe.expire(key, RESULT_STREAM_TTL)
+        pipe.execute()
+        return True
+    except Exception as e:
+        logger.warning("写入设备结果 Stream 失败: device=%s err=%s", device_serial, e)
+        return False
+
+
+class ReplayRunResult:
+    """一次回放的执行结果"""
+
+    def __init__(self):
+        self.error: Optional[str] = None
+        self.device_results: Dict[str, Dict[str, Any]] = {}
+        self.duration: float = 0.0
+
+
+class ReplayWorkerProcess:
+    """单个常驻回放子进程（启动时预加载回放模块）"""
+
+    def __init__(self, start_timeout: float = DEFAULT_START_TIMEOUT):
+        authkey = os.urandom(32)
+        listener = Listener(authkey=authkey)
+        env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'wfgame_ai_server_main.settings')
+        env[WORKER_AUTHKEY_ENV] = authkey.hex()
+        self.conn = None
+        self.jobs = 0
+        try:
+            self.proc = subprocess.Popen(
+                [sys.executable, WORKER_SCRIPT, '--address', str(listener.address)],
+                stdin=subprocess.DEVNULL, cwd=SERVER_ROOT, env=env,
+            )
+            self.conn = self._accept(listener, start_timeout)
+        finally:
+            listener.close()
+        message = self.read_message(start_timeout) if self.conn else None
+        if not message or message.get('type') != 'ready':
+            self.kill()
+            raise RuntimeError(f"回放子进程启动失败: {message or 'timeout'}")
+        logger.warning("回放子进程已就绪: pid=%s 预加载耗时 %.1fs", self.proc.pid, message.get('preload_seconds', 0))
+
+    def _accept(self, listener: Listener, timeout: float):
+        """等待子进程连入控制连接（Listener.accept 无超时参数，放到辅助线程中等待）"""
+        accepted = {}
+
+        def _target():
+            try:
+                accepted['conn'] = listener.accept()
+            except Exception as e:
+                accepted['error'] = e
+
+        thread = threading.Thread(target=_target, name='replay-worker-accept', daemon=True)
+        thread.start()
+        deadline = time.monotonic() + timeout
+        while thread.is_alive() and time.monotonic() < deadline and self.alive:
+            thread.join(POLL_INTERVAL)
+        if 'error' in accepted:
+            logger.warning("回放子进程控制连接失败: %s", accepted['error'])
+        return accepted.get('conn')
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def send(self, job: Dict[str, Any]):
+        self.conn.send(job)
+        self.jobs += 1
+
+    def read_message(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """读取一条控制消息，超时或子进程退出返回 None"""
+        try:
+            if not self.conn.poll(timeout):
+                return None
+            message = self.conn.recv()
+        except (EOFError, OSError):
+            return None
+        return message if isinstance(message, dict) else None
+
+    def close(self, timeout: float = 10.0):
+        """关闭控制连接通知子进程退出，超时则强制结束"""
+        try:
+            if self.conn:
+                self.conn.close()
+            self.proc.wait(timeout=timeout)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        try:
+            if self.conn:
+                self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class ReplayExecutor:
+    """回放子进程池"""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, max_jobs: int = DEFAULT_MAX_JOBS,
+                 start_timeout: float = DEFAULT_START_TIMEOUT):
+        self.pool_size = max(1, pool_size)
+        self.max_jobs = max(1, max_jobs)
+        self.start_timeout = start_timeout
+        self._cond = threading.Condition()
+        self._idle: List[ReplayWorkerProcess] = []
+        self._total = 0
+
+    def _acquire(self) -> ReplayWorkerProcess:
+        with self._cond:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive:
+                        return worker
+                    self._total -= 1
+                if self._total < self.pool_size:
+                    self._total += 1
+                    break
+                self._cond.wait()
+        try:
+            return ReplayWorkerProcess(self.start_timeout)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, worker: ReplayWorkerProcess, healthy: bool):
+        retire = not healthy or not worker.alive or worker.jobs >= self.max_jobs
+        if retire:
+            # 回收子进程：释放回放期间累积的模型、缓存与线程
+            if worker.alive:
+                worker.close()
+            else:
+                worker.kill()
+        with self._cond:
+            if retire:
+                self._total -= 1
+            else:
+                self._idle.append(worker)
+            self._cond.notify()
+
+    def run(self, task_id: int, argv: List[str],
+            on_device_result: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+            timeout: Optional[float] = None) -> ReplayRunResult:
+        """
+        在子进程中执行一次回放，阻塞直到完成
+
+        Args:
+            argv: replay_script 命令行参数（argv[0] 为脚本路径）
+            on_device_result: 每收到一台设备的结果时回调 (serial, payload)
+            timeout: 超时秒数，超时后强制结束子进程
+        """
+        result = ReplayRunResult()
+        started = time.monotonic()
+        stream_key = result_stream_key(task_id, uuid.uuid4().hex[:12])
+        redis_client = _redis_client()
+        last_id = '0-0'
+
+        def drain():
+            nonlocal last_id
+            if not redis_client:
+                return
+            try:
+                entries = redis_client.xread({stream_key: last_id}, count=100) or []
+            except Exception as e:
+                logger.warning("读取设备结果 Stream 失败: %s", e)
+                return
+            for _, messages in entries:
+                for message_id, fields in messages:
+                    last_id = message_id
+                    serial = fields.get('device')
+                    try:
+                        payload = json.loads(fields.get('payload') or '{}')
+                    except ValueError:
+                        payload = {}
+                    result.device_results[serial] = payload
+                    if on_device_result:
+                        try:
+                            on_device_result(serial, payload)
+                        except Exception:
+                            logger.exception("处理设备结果回调失败: %s", serial)
+
+        try:
+            worker = self._acquire()
+        except Exception as e:
+            logger.exception("获取回放子进程失败")
+            result.error = str(e)
+            return result
+
+        healthy = False
+        try:
+            worker.send({"job_id": stream_key, "argv": argv, "env": {RESULT_STREAM_ENV: stream_key}})
+            while True:
+                message = worker.read_message(POLL_INTERVAL)
+                drain()
+                if message and message.get('type') == 'done' and message.get('job_id') == stream_key:
+                    result.error = message.get('error')
+                    healthy = True
+                    break
+                if not worker.alive:
+                    result.error = f"回放子进程异常退出: exit_code={worker.proc.returncode}"
+                    break
+                if timeout and time.monotonic() - started > timeout:
+                    result.error = f"回放执行超时({timeout}s)"
+                    worker.kill()
+                    break
+            drain()
+        except Exception as e:
+            logger.exception("回放子进程通信失败")
+            result.error = str(e)
+        finally:
+            self._release(worker, healthy)
+            if redis_client:
+                try:
+                    redis_client.delete(stream_key)
+                except Exception:
+                    pass
+        result.duration = time.monotonic() - started
+        return result
+
+    def shutdown(self):
+        with self._cond:
+            workers, self._idle = self._idle, []
+            self._total -= len(workers)
+        for worker in workers:
+            worker.close()
+
+
+_EXECUTOR: Optional[ReplayExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_replay_executor() -> ReplayExecutor:
+    """获取（必要时创建）当前进程的回放执行器"""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ReplayExecutor(**load_executor_settings())
+        return _EXECUTOR
+
+
+__all__ = [
+    "RESULT_STREAM_ENV",
+    "ReplayExecutor",
+    "ReplayRunResult",
+    "get_replay_executor",
+    "load_executor_settings",
+    "publish_device_result",
+]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# @File    : replay_worker
+# @Desc    : 常驻回放子进程入口（由 replay_executor 启动，勿直接运行）
+
+
+"""
+启动时连入执行器的控制连接并预加载 Django 与 replay_script，随后逐条接收任务：
+    {"job_id": str, "argv": [...], "env": {...}}
+每个任务执行 replay_script.main()，完成后回传：
+    {"type": "done", "job_id": str, "error": Optional[str]}
+控制连接关闭时退出。
+"""
+
+import argparse
+import os
+import sys
+import time
+import traceback
+from multiprocessing.connection import Client
+
+SERVER_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# 每次任务前重置的 replay_script 模块级状态
+_RESET_GLOBALS = ('GLOBAL_REPLAY_TOTAL_STEPS', 'GLOBAL_REPLAY_SINGLE_DEVICE_STEPS', 'GLOBAL_INITIAL_DEVICE_COUNT')
+
+
+def _preload():
+    """预加载 Django 与回放模块（含 cv2/YOLO 等重型依赖）"""
+    if SERVER_ROOT not in sys.path:
+        sys.path.insert(0, SERVER_ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wfgame_ai_server_main.settings')
+    import django
+    django.setup()
+    from apps.scripts import replay_script
+    return replay_script
+
+
+def _run_job(replay_script, job: dict):
+    """执行一次回放，返回错误描述（成功为 None）"""
+    for name in _RESET_GLOBALS:
+        if hasattr(replay_script, name):
+            setattr(replay_script, name, None)
+    replay_script.ERROR_LOGS.clear()
+    os.environ.update({k: str(v) for k, v in (job.get('env') or {}).items()})
+    old_argv = list(sys.argv)
+    try:
+        sys.argv = list(job['argv'])
+        replay_script.main()
+        return None
+    except SystemExit as e:
+        return None if e.code in (None, 0) else f"SystemExit({e.code})"
+    except Exception as e:
+        traceback.print_exc()
+        return repr(e)
+    finally:
+        sys.argv = old_argv
+        for key in (job.get('env') or {}):
+            os.environ.pop(key, None)
+        try:
+            from django.db import close_old_connections
+            close_old_connections()
+        except Exception:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WFGameAI 常驻回放子进程')
+    parser.add_argument('--address', required=True, help='执行器控制连接地址')
+    args = parser.parse_args()
+    authkey = bytes.fromhex(os.environ.pop('WFGAME_REPLAY_WORKER_AUTHKEY', ''))
+    conn = Client(args.address, authkey=authkey)
+
+    started = time.monotonic()
+    try:
+        replay_script = _preload()
+    except Exception as e:
+        traceback.print_exc()
+        conn.send({"type": "error", "error": repr(e)})
+        return 1
+    conn.send({"type": "ready", "pid": os.getpid(), "preload_seconds": round(time.monotonic() - started, 2)})
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if not isinstance(job, dict):
+            continue
+        error = _run_job(replay_script, job)
+        conn.send({"type": "done", "job_id": job.get('job_id'), "error": error})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
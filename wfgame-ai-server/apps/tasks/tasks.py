@@ -8,7 +8,6 @@
 
 import logging
 import os
-import sys
 from datetime import datetime
 from typing import List, Tuple, Optional, Any, Dict
 
@@ -142,20 +141,20 @@ def _get_task_devices(task: Task) -> List[str]:
     return serials
 
 
-def _invoke_replay_main(argv: List[str]) -> Optional[Exception]:
-    """在同一进程内调用 replay_script.main()，并临时设置 sys.argv"""
-    # 延迟导入，防止Celery worker启动时加载重型依赖
-    from apps.scripts import replay_script as _replay_mod  # type: ignore
-    old_argv = list(sys.argv)
-    try:
-        sys.argv = argv
-        _replay_mod.main()
-        return None
-    except Exception as e:
-        logger.exception("replay_script.main 执行异常: %s", e)
-        return e
-    finally:
-        sys.argv = old_argv
+def _invoke_replay_main(task_id: int, argv: List[str]) -> Tuple[Optional[str], Dict[str, Dict[str, Any]]]:
+    """在常驻回放子进程中执行 replay_script.main()，返回 (系统错误, {设备: 结果})
+
+    设备结果经 Redis Stream 边执行边回传；Redis 不可用或个别设备缺失时由调用方回退读取结果文件
+    """
+    # 延迟导入，Celery worker 进程本身不加载回放依赖
+    from apps.tasks.replay_executor import get_replay_executor
+
+    run = get_replay_executor().run(task_id, argv)
+    if run.error:
+        logger.error("回放子进程执行异常: task=%s err=%s", task_id, run.error)
+    logger.warning("回放执行结束: task=%s 耗时 %.1fs, 收到设备结果 %d 条",
+                   task_id, run.duration, len(run.device_results))
+    return run.error, run.device_results
 
 
 def _read_device_result_payload(task_id: int, device_serial: str) -> Optional[Dict[str, Any]]:
@@ -230,13 +229,9 @@ def replay_task(task_id: int):
     task.save(update_fields=['status', 'start_time'])
 
     if device_serials:
-        tds = (TaskDevice.objects.all_teams()
-               .filter(task=task, device__device_id__in=device_serials)
-               .select_related('device'))
-        for td in tds:
-            td.status = 'running'
-            td.start_time = now
-            td.save(update_fields=['status', 'start_time'])
+        (TaskDevice.objects.all_teams()
+         .filter(task=task, device__device_id__in=device_serials)
+         .update(status='running', start_time=now, updated_at=now))
 
     device_results: List[Dict[str, Any]] = []
     any_failed = False
@@ -245,11 +240,33 @@ def replay_task(task_id: int):
         # 构建命令行参数并执行（多设备 + 多脚本）
         argv = _build_replay_argv(task_id, specs, device_serials, base_log_dir)
         logger.warning("执行回放命令: %s", ' '.join(argv))
-        err = _invoke_replay_main(argv)
+        err, stream_results = _invoke_replay_main(task_id, argv)
+
+        from apps.reports.models import ReportDetail
+        # 报告详情中的设备错误一次查出，作为结果缺失或未含错误时的回退
+        report_errors: Dict[str, str] = {}
+        try:
+            for serial, message in (ReportDetail.objects.all_teams()
+                                    .filter(report__task_id=task_id, device__device_id__in=device_serials)
+                                    .exclude(error_message__isnull=True).exclude(error_message='')
+                                    .values_list('device__device_id', 'error_message')):
+                report_errors.setdefault(serial, message)
+        except Exception:
+            logger.exception("查询 ReportDetail 错误信息失败: task=%s", task_id)
 
-        # 汇总每台设备结果并更新状态
+        tds_by_serial = {
+            td.device.device_id: td
+            for td in (TaskDevice.objects.all_teams()
+                       .filter(task=task, device__device_id__in=device_serials)
+                       .select_related('device'))
+        }
+        changed_tds: List[TaskDevice] = []
+        device_errors: Dict[str, str] = {}
+        end_ts = datetime.now()
+
+        # 汇总每台设备结果
         for serial in device_serials:
-            payload = _read_device_result_payload(task_id, serial)
+            payload = stream_results.get(serial) or _read_device_result_payload(task_id, serial)
             exit_code: Optional[int] = None
             error_text: Optional[str] = None
             if isinstance(payload, dict):
@@ -258,79 +275,79 @@ def replay_task(task_id: int):
                 except Exception:
                     exit_code = None
                 error_text = payload.get('error_msg')
-            # 结果文件缺失或未包含错误时，回退到报告详情中的错误信息
-            if not error_text:
-                try:
-                    from apps.reports.models import ReportDetail
-                    rd = (ReportDetail.objects.all_teams()
-                          .select_related('report', 'device')
-                          .filter(report__task_id=task_id, device__device_id=serial)
-                          .only('error_message')
-                          .first())
-                    if rd and getattr(rd, 'error_message', ''):
-                        error_text = rd.error_message
-                        # 若来源于DB错误，则将 exit_code 视为 -1
-                        exit_code = -1 if exit_code in (None, 0) else exit_code
-                except Exception:
-                    pass
-            try:
-                td = (TaskDevice.objects.all_teams()
-                      .filter(task=task, device__device_id=serial)
-                      .select_related('device').first())
-                if td:
-                    end_ts = datetime.now()
-                    if td.start_time:
-                        td.execution_time = (end_ts - td.start_time).total_seconds()
-                    elif td.created_at:
-                        td.execution_time = (end_ts - td.created_at).total_seconds()
-                    # 成功条件需同时满足：无系统 err、exit_code 正常、且无设备级 error_text
-                    if err is None and (exit_code is None or exit_code == 0) and not error_text:
-                        td.status = 'completed'
-                    else:
-                        td.status = 'failed'
-                        td.error_message = error_text or f"exit_code={exit_code}, err={repr(err) if err else ''}"
-                    if not td.error_message and error_text:
-                        td.error_message = error_text
-                    td.save(update_fields=['status', 'execution_time', 'error_message', 'updated_at'])
-                    try:
-                        if error_text:
-                            from apps.reports.models import ReportDetail
-                            ReportDetail.objects.all_teams().filter(report__task_id=task_id, device__device_id=serial).update(error_message=error_text)
-                            # 同步推送系统级错误到前端
-                            _emit_task_sys_error(task_id, serial, error_text)
-
-                            # 同步更新 Redis 错误信息，确保快照能获取到
-                            try:
-                                from django.conf import settings
-                                redis_client = None
-                                if hasattr(settings, 'REDIS'):
-                                    redis_client = getattr(settings.REDIS, 'client', None)
-
-                                if redis_client:
-                                    key = f"wfgame:replay:task:{task_id}:device:{serial}:error"
-                                    redis_client.set(key, error_text, ex=7*24*3600)
-                                    # Ensure steps key exists
-                                    steps_key = f"wfgame:replay:task:{task_id}:device:{serial}:steps"
-                                    if not redis_client.exists(steps_key) or not redis_client.get(steps_key):
-                                        redis_client.set(steps_key, "[]", ex=7*24*3600)
-                            except Exception:
-                                pass
-                    except Exception:
-                        logger.exception("更新 ReportDetail 错误信息失败: %s", serial)
-            except Exception:
-                logger.exception("更新设备状态失败: %s", serial)
+            # 结果缺失或未包含错误时，回退到报告详情中的错误信息
+            if not error_text and report_errors.get(serial):
+                error_text = report_errors[serial]
+                # 若来源于DB错误，则将 exit_code 视为 -1
+                exit_code = -1 if exit_code in (None, 0) else exit_code
+
+            td = tds_by_serial.get(serial)
+            if td:
+                if td.start_time:
+                    td.execution_time = (end_ts - td.start_time).total_seconds()
+                elif td.created_at:
+                    td.execution_time = (end_ts - td.created_at).total_seconds()
+                # 成功条件需同时满足：无系统 err、exit_code 正常、且无设备级 error_text
+                if err is None and (exit_code is None or exit_code == 0) and not error_text:
+                    td.status = 'completed'
+                else:
+                    td.status = 'failed'
+                    td.error_message = error_text or f"exit_code={exit_code}, err={err or ''}"
+                if not td.error_message and error_text:
+                    td.error_message = error_text
+                td.updated_at = end_ts  # bulk_update 不触发 auto_now
+                changed_tds.append(td)
+            if error_text:
+                device_errors[serial] = error_text
+
             # 若存在设备级错误文本，也视为失败
             failed = bool(error_text) or not (err is None and (exit_code is None or exit_code == 0))
             any_failed = any_failed or failed
             device_results.append({
                 'device': serial,
                 'exit_code': exit_code,
-                'error_msg': (error_text or (repr(err) if err else None)),
+                'error_msg': (error_text or err),
             })
+
+        try:
+            if changed_tds:
+                TaskDevice.objects.all_teams().bulk_update(
+                    changed_tds, ['status', 'execution_time', 'error_message', 'updated_at'])
+        except Exception:
+            logger.exception("批量更新设备状态失败: task=%s", task_id)
+
+        if device_errors:
+            try:
+                details = list(ReportDetail.objects.all_teams()
+                               .filter(report__task_id=task_id, device__device_id__in=list(device_errors))
+                               .select_related('device').only('id', 'device', 'device__device_id', 'error_message'))
+                for rd in details:
+                    rd.error_message = device_errors[rd.device.device_id]
+                if details:
+                    ReportDetail.objects.all_teams().bulk_update(details, ['error_message'])
+            except Exception:
+                logger.exception("批量更新 ReportDetail 错误信息失败: task=%s", task_id)
+
+            redis_client = None
+            try:
+                from django.conf import settings
+                redis_client = getattr(getattr(settings, 'REDIS', None), 'client', None)
+            except Exception:
+                pass
+            for serial, error_text in device_errors.items():
+                # 同步推送系统级错误到前端
+                _emit_task_sys_error(task_id, serial, error_text)
+                # 同步更新 Redis 错误信息，无步骤记录的设备也能出现在快照中
+                if redis_client:
+                    try:
+                        from apps.scripts.replay_step_store import set_device_error
+                        set_device_error(redis_client, task_id, serial, error_text)
+                    except Exception:
+                        pass
     else:
         argv = _build_replay_argv(task_id, specs, [], base_log_dir)
         logger.warning("执行回放命令(无设备): %s", ' '.join(argv))
-        err = _invoke_replay_main(argv)
+        err, _ = _invoke_replay_main(task_id, argv)
         any_failed = any_failed or (err is not None)
 
     # 汇总任务状态（移除 end_time 字段使用 execution_time 计算逻辑，保留执行耗时计算）
@@ -18,6 +18,7 @@ from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from apps.reports.models import Report, ReportDetail
+from apps.scripts.replay_step_store import delete_task_keys
 
 from .models import TaskGroup, Task, TaskScript, TaskDevice
 from ..devices.models import Device
@@ -127,23 +128,12 @@ class TaskViewSet(CustomResponseModelViewSet):
                 redis_client = getattr(settings.REDIS, 'client', None)
                 if redis_client:
                     try:
-                        pattern = f"wfgame:replay:task:{task.id}:device:*:steps"
-                        for key in redis_client.scan_iter(match=pattern):
-                            try:
-                                redis_client.delete(key)
-                            except Exception:
-                                pass
+                        # 步骤存储与错误信息 Key（按任务设备索引定位）
+                        delete_task_keys(redis_client, task.id)
                         try:
                             redis_client.delete(f"wfgame:replay:task:{task.id}:primary_device")
                         except Exception:
                             pass
-                        # 同时清理错误信息 Key
-                        pattern_error = f"wfgame:replay:task:{task.id}:device:*:error"
-                        for key in redis_client.scan_iter(match=pattern_error):
-                            try:
-                                redis_client.delete(key)
-                            except Exception:
-                                pass
                     except Exception:
                         logger.warning("启动任务时清理Redis缓存失败")
 
@@ -378,23 +368,12 @@ class TaskViewSet(CustomResponseModelViewSet):
                 redis_client = getattr(settings.REDIS, 'client', None)
                 if redis_client:
                     try:
-                        pattern = f"wfgame:replay:task:{task.id}:device:*:steps"
-                        for key in redis_client.scan_iter(match=pattern):
-                            try:
-                                redis_client.delete(key)
-                            except Exception:
-                                pass
+                        # 步骤存储与错误信息 Key（按任务设备索引定位）
+                        delete_task_keys(redis_client, task.id)
                         try:
                             redis_client.delete(f"wfgame:replay:task:{task.id}:primary_device")
                         except Exception:
                             pass
-                        # 同时清理错误信息 Key
-                        pattern_error = f"wfgame:replay:task:{task.id}:device:*:error"
-                        for key in redis_client.scan_iter(match=pattern_error):
-                            try:
-                                redis_client.delete(key)
-                            except Exception:
-                                pass
                     except Exception:
                         logger.warning("重启任务时清理Redis缓存失败")
 
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# @File    : frame_streamer.py
+# @Desc    : 实时画面推流（回放进程侧）：按房间节流、只推最新帧、无人观看时不编码
+
+"""
+回放进程把截图交给房间对应的推流器后立即返回（只保存引用，不做任何编码）。
+推流器后台线程按目标帧率取“最新一帧”：
+- 房间内无观看者时直接丢弃，不解码也不编码；
+- 有观看者时缩放并编码为 JPEG/WebP，以二进制 POST 到 Socket.IO 服务 /api/socketio/frame，
+  由服务端作为二进制附件发给房间内各观看者；
+- 发送期间到达的新帧覆盖旧帧，旧帧直接丢弃，推送永远不会排队积压。
+
+配置（config.ini [socketio]）:
+    frame_stream_enabled  是否启用二进制推流，关闭后回退为 base64 JSON 推送
+    frame_stream_format   jpeg | webp
+    frame_stream_quality  编码质量 1-100
+    frame_stream_fps      每个房间的目标帧率
+    frame_stream_max_side 推流画面最长边，0 表示不缩放
+"""
+
+import base64
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+DEFAULT_FPS = 5.0
+DEFAULT_QUALITY = 70
+DEFAULT_MAX_SIDE = 1280
+# 观看者数量的缓存秒数（无人观看时按此间隔复查）
+VIEWER_CHECK_INTERVAL = 1.0
+SEND_TIMEOUT = 5
+
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+
+def load_stream_settings() -> Dict[str, Any]:
+    """读取 config.ini [socketio] 中的推流配置（Django 不可用时使用默认值）"""
+    values = {
+        "enabled": True,
+        "image_format": "jpeg",
+        "quality": DEFAULT_QUALITY,
+        "fps": DEFAULT_FPS,
+        "max_side": DEFAULT_MAX_SIDE,
+        "api_base_url": "http://127.0.0.1:13838/api/socketio",
+    }
+    try:
+        from django.conf import settings
+
+        config = settings.CFG._config
+        values["enabled"] = config.getboolean("socketio", "frame_stream_enabled", fallback=True)
+        values["image_format"] = config.get("socketio", "frame_stream_format", fallback="jpeg").strip().lower()
+        values["quality"] = config.getint("socketio", "frame_stream_quality", fallback=DEFAULT_QUALITY)
+        values["fps"] = config.getfloat("socketio", "frame_stream_fps", fallback=DEFAULT_FPS)
+        values["max_side"] = config.getint("socketio", "frame_stream_max_side", fallback=DEFAULT_MAX_SIDE)
+        port = settings.CFG.getint("socketio", "port", fallback=13838)
+        values["api_base_url"] = settings.CFG.get(
+            "socketio", "api_base_url", fallback=f"http://127.0.0.1:{port}/api/socketio").rstrip("/")
+    except Exception:
+        pass
+    if values["image_format"] not in IMAGE_FORMATS:
+        print(f"⚠️ 不支持的推流格式 {values['image_format']}，改用 jpeg")
+        values["image_format"] = "jpeg"
+    return values
+
+
+def _to_bgr(image, max_side: Optional[int]):
+    """把 Frame / PIL.Image / ndarray / 图片字节 / base64 字符串转换为缩放后的 BGR ndarray"""
+    import cv2
+    import numpy as np
+
+    if hasattr(image, "to_bgr"):
+        # frame_grabber.Frame：与检测共用同尺寸的缩放缓存
+        return image.to_bgr(max_side=max_side or None)
+    if isinstance(image, str):
+        if image.startswith("data:image") and "," in image:
+            image = image.split(",", 1)[1]
+        image = base64.b64decode(image)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        bgr = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    elif hasattr(image, "convert") and hasattr(image, "thumbnail"):
+        # PIL 先在原图上缩放再转 ndarray
+        image = image.convert("RGB")
+        if max_side:
+            image.thumbnail((max_side, max_side))
+        bgr = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+    else:
+        bgr = np.asarray(image)
+        if bgr.ndim == 3 and bgr.shape[2] == 4:
+            bgr = cv2.cvtColor(bgr, cv2.COLOR_BGRA2BGR)
+    if bgr is None or bgr.size == 0:
+        return None
+    height, width = bgr.shape[:2]
+    if max_side and max(width, height) > max_side:
+        scale = max_side / float(max(width, height))
+        bgr = cv2.resize(bgr, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    return bgr
+
+
+def encode_frame(image, image_format: str = "jpeg", quality: int = DEFAULT_QUALITY,
+                 max_side: Optional[int] = DEFAULT_MAX_SIDE) -> Optional[bytes]:
+    """缩放并编码为 JPEG/WebP 字节，失败返回 None"""
+    import cv2
+
+    bgr = _to_bgr(image, max_side)
+    if bgr is None:
+        return None
+    extension = IMAGE_FORMATS[image_format][0]
+    flag = cv2.IMWRITE_WEBP_QUALITY if image_format == "webp" else cv2.IMWRITE_JPEG_QUALITY
+    ok, encoded = cv2.imencode(extension, bgr, [int(flag), int(quality)])
+    return encoded.tobytes() if ok else None
+
+
+class LiveFrameStreamer:
+    """单个 Socket.IO 房间的实时画面推流器（最新帧优先，按帧率节流）"""
+
+    def __init__(self, room: str, api_base_url: str, fps: float = DEFAULT_FPS,
+                 image_format: str = "jpeg", quality: int = DEFAULT_QUALITY,
+                 max_side: int = DEFAULT_MAX_SIDE, enabled: bool = True):
+        self.room = room
+        self.api_base_url = api_base_url.rstrip("/")
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.image_format = image_format
+        self.mime = IMAGE_FORMATS[image_format][1]
+        self.quality = quality
+        self.max_side = max_side
+        self.enabled = enabled
+        self._cond = threading.Condition()
+        self._pending = None
+        self._thread: Optional[threading.Thread] = None
+        self._session = requests.Session()
+        self._viewers = 0
+        self._viewers_checked = 0.0
+        self._stats = {"submitted": 0, "sent": 0, "dropped": 0, "no_viewer": 0, "errors": 0, "bytes": 0}
+
+    def submit(self, image) -> None:
+        """提交一帧（只保存引用），尚未发送的上一帧被覆盖丢弃"""
+        with self._cond:
+            self._stats["submitted"] += 1
+            if self._pending is not None:
+                self._stats["dropped"] += 1
+            self._pending = image
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"frame-stream-{self.room}", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _has_viewers(self) -> bool:
+        """房间内是否有观看者（结果缓存 VIEWER_CHECK_INTERVAL 秒）"""
+        now = time.monotonic()
+        if now - self._viewers_checked < VIEWER_CHECK_INTERVAL:
+            return self._viewers > 0
+        try:
+            resp = self._session.get(f"{self.api_base_url}/viewers", params={"room": self.room},
+                                     timeout=SEND_TIMEOUT)
+            resp.raise_for_status()
+            self._viewers = int((resp.json().get("data") or {}).get("viewers", 0))
+        except Exception:
+            # 服务不可用时视为无人观看，间隔后再查
+            self._viewers = 0
+        self._viewers_checked = now
+        return self._viewers > 0
+
+    def _send(self, image) -> None:
+        data = encode_frame(image, self.image_format, self.quality, self.max_side)
+        if not data:
+            self._stats["errors"] += 1
+            return
+        try:
+            resp = self._session.post(
+                f"{self.api_base_url}/frame",
+                params={"room": self.room, "mime": self.mime},
+                data=data,
+                headers={"Content-Type": "application/octet-stream"},
+                timeout=SEND_TIMEOUT,
+            )
+            resp.raise_for_status()
+            # 服务端顺带返回当前观看者数量，省去下一次查询
+            self._viewers = int((resp.json().get("data") or {}).get("viewers", 0))
+            self._viewers_checked = time.monotonic()
+            self._stats["sent"] += 1
+            self._stats["bytes"] += len(data)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"⚠️ 推送实时画面到 {self.room} 失败: {e}")
+
+    def _run(self):
+        next_send = 0.0
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+            # 节流：等待期间到达的新帧会覆盖旧帧，醒来后只发最新的一帧
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self._cond:
+                image, self._pending = self._pending, None
+            if not self._has_viewers():
+                self._stats["no_viewer"] += 1
+                continue
+            self._send(image)
+            next_send = time.monotonic() + self.interval
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats)
+
+
+_STREAMERS: Dict[str, LiveFrameStreamer] = {}
+_STREAMERS_LOCK = threading.Lock()
+_SETTINGS: Optional[Dict[str, Any]] = None
+
+
+def get_live_frame_streamer(room: str) -> LiveFrameStreamer:
+    """获取（必要时创建）房间的推流器，进程内每个房间只保留一个"""
+    global _SETTINGS
+    with _STREAMERS_LOCK:
+        streamer = _STREAMERS.get(room)
+        if streamer is None:
+            if _SETTINGS is None:
+                _SETTINGS = load_stream_settings()
+            streamer = _STREAMERS[room] = LiveFrameStreamer(room, **_SETTINGS)
+        return streamer
+
+
+def publish_live_frame(room: str, image) -> bool:
+    """
+    把截图交给房间的推流器，调用方无需等待
+
+    Returns:
+        False 表示推流已关闭或参数无效，调用方应回退为 base64 JSON 推送
+    """
+    if not room or image is None:
+        return False
+    streamer = get_live_frame_streamer(str(room))
+    if not streamer.enabled:
+        return False
+    streamer.submit(image)
+    return True
+
+
+def live_frame_stats() -> Dict[str, Dict[str, int]]:
+    """各房间推流统计"""
+    with _STREAMERS_LOCK:
+        streamers = list(_STREAMERS.values())
+    return {s.room: s.stats() for s in streamers if s.enabled}
+
+
+__all__ = [
+    "LiveFrameStreamer",
+    "encode_frame",
+    "get_live_frame_streamer",
+    "live_frame_stats",
+    "load_stream_settings",
+    "publish_live_frame",
+]
@@ -18,6 +18,8 @@ from django.conf import settings
 from minio import Minio
 from minio.error import S3Error
 
+from utils.minio_transfer import MinioTransferEngine
+
 
 # 读取全局配置（config.ini）
 def _get_minio_conf() -> dict:
@@ -133,6 +135,9 @@ class MinioService:
         )
         self.default_bucket = conf.get('default_bucket') or ''
         self.server_url = conf.get('server_url') or conf.get('endpoint')
+        # 文件夹传输引擎：并行、分片、跳过未变化文件、失败重试
+        self.transfer = MinioTransferEngine.from_settings(self.client)
+        self.last_transfer_report = None
 
     # ---------- bucket ----------
     def ensure_bucket(self, bucket: str | None = None) -> Optional[str]:
@@ -229,46 +234,28 @@ class MinioService:
         if not base.is_dir():
             print(f"[minio] upload_folder: 不是有效目录 {local_dir}")
             return []
-        keys: list[str] = []
-        root = (object_root_path or '').lstrip('/')
-        for path in base.rglob('*'):
-            if path.is_dir():
-                continue
-            if not include_hidden and any(part.startswith('.') for part in path.parts):
-                continue
-            rel = path.relative_to(base).as_posix()
-            key = f'{root}/{rel}' if root else rel
-            ct = _guess_mime(path)
-            try:
-                self.client.fput_object(b, key, str(path), content_type=ct)
-                keys.append(key)
-            except Exception as e:
-                print(f"[minio] upload_folder 单文件失败 {path}: {e}")
-        return keys
+        report = self.transfer.upload_folder(b, local_dir, object_root_path, include_hidden)
+        self.last_transfer_report = report
+        print(f"[minio] upload_folder {report.summary()}")
+        failed = {key for key, _ in report.failed}
+        return [key for key in report.keys if key not in failed]
 
     def download_folder(self, bucket: str | None, object_root_path: str, local_dir: str) -> list[str]:
         b = self.ensure_bucket(bucket)
         if not b:
             return []
-        dest_root = Path(local_dir)
-        dest_root.mkdir(parents=True, exist_ok=True)
-        saved: list[str] = []
-        prefix = (object_root_path or '').lstrip('/')
         try:
-            for obj in self.client.list_objects(b, prefix=prefix, recursive=True):
-                if obj.object_name.endswith('/'):
-                    continue
-                rel = obj.object_name[len(prefix):].lstrip('/') if prefix else obj.object_name
-                local_path = dest_root / rel
-                local_path.parent.mkdir(parents=True, exist_ok=True)
-                try:
-                    self.client.fget_object(b, obj.object_name, str(local_path))
-                    saved.append(str(local_path))
-                except Exception as e:
-                    print(f"[minio] 下载失败 {obj.object_name}: {e}")
+            report = self.transfer.download_folder(b, object_root_path, local_dir)
         except Exception as e:
             print(f"[minio] 列举对象失败: {e}")
-        return saved
+            return []
+        self.last_transfer_report = report
+        print(f"[minio] download_folder {report.summary()}")
+        failed = {key for key, _ in report.failed}
+        prefix = (object_root_path or '').lstrip('/')
+        dest_root = Path(local_dir)
+        failed_paths = {str(dest_root / (k[len(prefix):].lstrip('/') if prefix else k)) for k in failed}
+        return [path for path in report.keys if path not in failed_paths]
 
     # ---------- 查询 ----------
     def list_objects(self, bucket: str | None, object_root_path: str = '') -> list[str]:
@@ -432,25 +419,13 @@ def upload_folder(bucket: str, local_dir: str, object_root_path: str,
         raise NotADirectoryError(f"不是有效目录: {local_dir}")
     if not ensure_bucket(bucket):
         return []
-    keys: list[str] = []
-    root = (object_root_path or '').lstrip('/')
-    for path in base.rglob('*'):
-        if path.is_dir():
-            continue
-        if not include_hidden and any(part.startswith('.') for part in path.parts):
-            continue
-        rel = path.relative_to(base).as_posix()
-        key = f"{root}/{rel}" if root else rel
-        ct = _guess_mime(path)
-        client = _client()
-        if not client:
-            return keys
-        try:
-            client.fput_object(bucket, key, str(path), content_type=ct)
-            keys.append(key)
-        except Exception as e:
-            print(f"[minio] upload_folder 单文件失败 {path}: {e}")
-    return keys
+    client = _client()
+    if not client:
+        return []
+    report = MinioTransferEngine.from_settings(client).upload_folder(bucket, local_dir, object_root_path, include_hidden)
+    print(f"[minio] upload_folder {report.summary()}")
+    failed = {key for key, _ in report.failed}
+    return [key for key in report.keys if key not in failed]
 
 
 def download_folder(bucket: str, object_root_path: str, local_dir: str) -> list[str]:
@@ -461,25 +436,14 @@ def download_folder(bucket: str, object_root_path: str, local_dir: str) -> list[
       - local_dir: 本地保存根目录
     返回：本地保存的文件绝对路径列表。
     """
-    dest_root = Path(local_dir)
-    dest_root.mkdir(parents=True, exist_ok=True)
-    saved: list[str] = []
-    prefix = (object_root_path or '').lstrip('/')
+    Path(local_dir).mkdir(parents=True, exist_ok=True)
     client = _client()
     if not client:
-        return saved
-    for obj in client.list_objects(bucket, prefix=prefix, recursive=True):
-        if obj.object_name.endswith('/'):
-            continue
-        rel = obj.object_name[len(prefix):].lstrip('/') if prefix else obj.object_name
-        local_path = dest_root / rel
-        local_path.parent.mkdir(parents=True, exist_ok=True)
-        try:
-            client.fget_object(bucket, obj.object_name, str(local_path))
-        except Exception as e:
-            print(f"[minio] 下载失败 {obj.object_name}: {e}")
-        saved.append(str(local_path))
-    return saved
+        return []
+    report = MinioTransferEngine.from_settings(client).download_folder(bucket, object_root_path, local_dir)
+    print(f"[minio] download_folder {report.summary()}")
+    # 与旧行为一致：返回全部本地路径（含下载失败的）
+    return report.keys
 
 
 def list_objects(bucket: str, object_root_path: str = '') -> list[str]:
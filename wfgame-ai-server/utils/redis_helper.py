@@ -8,6 +8,8 @@
 
 import redis
 import json
+import threading
+import time
 from typing import Dict, ClassVar, Any, Optional
 from utils.config_helper import RedisConfigObj
 
@@ -410,3 +412,142 @@ class RedisHelper:
         """
         return FallbackPipeline(self)
 
+
+
+class LeaderElection:
+    """
+    基于租约的领导者选举（SET NX PX + 心跳续租 + 防护令牌）
+    - 竞选：Lua 脚本内键不存在时才 INCR 令牌计数器并 SET key "<identity>|<token>" PX ttl，
+      只有竞选成功才消耗令牌，跟随者心跳不会推高令牌；
+    - 心跳：后台线程每 ttl/3 续租一次，只有值仍属于自己时才 PEXPIRE（Lua 比较后续期）；
+    - 续租失败或本地租约到期即视为失去领导权，其余候选在 ttl 内接管；
+    - 判断是否为领导者只读本地状态，不访问 Redis，也与键空间大小无关。
+    下游写操作可携带 fencing_token，拒绝比已见令牌更小的请求，防止旧领导者在失联后误写。
+    """
+
+    _ACQUIRE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+    local token = redis.call('INCR', KEYS[2])
+    redis.call('SET', KEYS[1], ARGV[1] .. '|' .. token, 'PX', ARGV[2])
+    return token
+    """
+    _RENEW_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    _RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client, key: str, identity: str, ttl_ms: int = 10000,
+                 heartbeat_interval: Optional[float] = None, on_change=None):
+        """
+        :param client: redis 客户端（decode_responses=True）
+        :param key: 领导者键，防护令牌计数器为 key + ":fence"
+        :param identity: 候选者标识（如设备序列号），不能包含 "|"
+        :param ttl_ms: 租约时长（毫秒），即最长故障切换时间
+        :param heartbeat_interval: 心跳间隔（秒），默认 ttl/3
+        :param on_change: 领导权变化回调 on_change(is_leader: bool, token: int)
+        """
+        self.client = client
+        self.key = key
+        self.fence_key = f"{key}:fence"
+        self.identity = str(identity)
+        self.ttl_ms = int(ttl_ms)
+        self.heartbeat_interval = heartbeat_interval or self.ttl_ms / 3000.0
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._value: Optional[str] = None
+        self._token = 0
+        self._lease_deadline = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def fencing_token(self) -> int:
+        """当前领导任期的防护令牌，非领导者为 0"""
+        return self._token if self.is_leader() else 0
+
+    def is_leader(self) -> bool:
+        """本地判断：持有租约且未到本地租约截止时间（扣除心跳间隔作为时钟漂移余量）"""
+        with self._lock:
+            return self._value is not None and time.monotonic() < self._lease_deadline
+
+    def _set_state(self, value: Optional[str], token: int, deadline: float):
+        with self._lock:
+            was_leader = self._value is not None
+            self._value, self._token, self._lease_deadline = value, token, deadline
+        if self.on_change and was_leader != (value is not None):
+            try:
+                self.on_change(value is not None, token)
+            except Exception as e:
+                print(f"LeaderElection 回调失败: {e}")
+
+    def try_acquire(self) -> bool:
+        """竞选或续租一次，返回当前是否为领导者"""
+        started = time.monotonic()
+        deadline = started + self.ttl_ms / 1000.0 - self.heartbeat_interval
+        try:
+            with self._lock:
+                value = self._value
+            if value is not None:
+                if self.client.eval(self._RENEW_SCRIPT, 1, self.key, value, self.ttl_ms):
+                    self._set_state(value, self._token, deadline)
+                    return True
+                self._set_state(None, 0, 0.0)
+            token = int(self.client.eval(
+                self._ACQUIRE_SCRIPT, 2, self.key, self.fence_key, self.identity, self.ttl_ms) or 0)
+            if token:
+                self._set_state(f"{self.identity}|{token}", token, deadline)
+                return True
+            return False
+        except Exception as e:
+            print(f"LeaderElection 竞选失败: {e}")
+            # Redis 不可用时无法续租，本地租约到期后自动失去领导权
+            return self.is_leader()
+
+    def current_leader(self) -> Optional[str]:
+        """当前领导者标识（读 Redis）"""
+        try:
+            raw = self.client.get(self.key)
+        except Exception:
+            return None
+        if not raw:
+            return None
+        raw = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else str(raw)
+        return raw.rsplit('|', 1)[0]
+
+    def start(self) -> "LeaderElection":
+        """立即竞选一次并启动心跳线程（重复调用无副作用）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self.try_acquire()
+            self._thread = threading.Thread(target=self._heartbeat, name=f"leader-{self.key}", daemon=True)
+            self._thread.start()
+        return self
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.try_acquire()
+
+    def stop(self, release: bool = True):
+        """停止心跳；release 时若仍持有租约则立即释放，其他候选无需等待租约到期"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.heartbeat_interval + 1)
+            self._thread = None
+        with self._lock:
+            value = self._value
+        if release and value is not None:
+            try:
+                self.client.eval(self._RELEASE_SCRIPT, 1, self.key, value)
+            except Exception as e:
+                print(f"LeaderElection 释放失败: {e}")
+        self._set_state(None, 0, 0.0)
@@ -39,7 +39,7 @@ ALLOWED_EVENTS: Set[str] = {
 # 事件到含义的映射（文档用）
 EVENT_DOCS: Dict[str, str] = {
     "status": "业务主体状态",
-    "frame": "实时截图帧（base64或URL）",
+    "frame": "实时截图帧（二进制 {room, mime, image, ts}，或 base64/URL）",
     "step": "单步骤运行状态（pending/running/success/failed）",
     "progress": "任务级聚合进度",
     "complete": "任务或脚本全部完成通知",
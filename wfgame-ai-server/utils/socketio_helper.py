@@ -4,13 +4,16 @@
 # @File    : socketio_helper.py
 # @Desc    : 基于socket.io 的 通知服务（redis消息群发以及async异步处理）
 
+import atexit
 import base64
 import os
 import sys
+import threading
 import time
+from collections import deque
 from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import Any, Optional, List, Dict
+from typing import Any, Optional, List, Dict, Deque
 
 # 1) 先设置 Django 配置模块环境变量
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wfgame_ai_server_main.settings')
@@ -53,6 +56,64 @@ class SocketResponse:
         return asdict(self)
 
 
+class LiveFrameRelay:
+    """
+    实时画面中继（服务端）
+    每个观看者一个“最新帧”槽位与一个发送协程：上一帧未被客户端确认（ack）前，
+    新帧只覆盖槽位，不排队；观看者跟不上时旧帧直接丢弃，始终只看到最新画面。
+    未回 ack 的旧版客户端按 ack_timeout 节奏收帧。
+    """
+
+    def __init__(self, sio, ack_timeout: float = 1.0):
+        self.sio = sio
+        self.ack_timeout = ack_timeout
+        self._pending: Dict[str, dict] = {}
+        self._senders: Dict[str, asyncio.Task] = {}
+        self.stats = {"received": 0, "sent": 0, "dropped": 0, "timeouts": 0}
+
+    def viewers(self, room: str) -> List[str]:
+        """房间内的观看者 sid（仅默认命名空间）"""
+        try:
+            members = self.sio.manager.rooms.get('/', {}).get(room) or {}
+            return list(members)
+        except Exception:
+            return []
+
+    def publish(self, room: str, payload: dict) -> int:
+        """把一帧放入房间内每个观看者的槽位，返回观看者数量"""
+        self.stats["received"] += 1
+        sids = self.viewers(room)
+        for sid in sids:
+            if sid in self._pending:
+                self.stats["dropped"] += 1
+            self._pending[sid] = payload
+            sender = self._senders.get(sid)
+            if sender is None or sender.done():
+                self._senders[sid] = asyncio.ensure_future(self._drain(sid))
+        return len(sids)
+
+    async def _drain(self, sid: str):
+        while True:
+            payload = self._pending.pop(sid, None)
+            if payload is None:
+                self._senders.pop(sid, None)
+                return
+            try:
+                await self.sio.call("frame", payload, sid=sid, timeout=self.ack_timeout)
+                self.stats["sent"] += 1
+            except socketio.exceptions.TimeoutError:
+                self.stats["timeouts"] += 1
+            except Exception:
+                # 客户端已断开等：丢弃该观看者的槽位
+                self.forget(sid)
+                return
+
+    def forget(self, sid: str):
+        """观看者断开后清理槽位"""
+        self._pending.pop(sid, None)
+        self._senders.pop(sid, None)
+
+
 class SocketIOHelper:
     def __init__(self):
         self.port = settings.CFG.getint("socketio", "port", fallback=13838)
@@ -61,6 +122,7 @@ class SocketIOHelper:
         self.sio = None
         self.app = None
         self.redis_url = settings.REDIS_CFG.redis_url
+        self.frame_relay = None
 
     async def setup(self):
         self.redis = aioredis.from_url(self.redis_url)
@@ -75,6 +137,8 @@ class SocketIOHelper:
         # 提升 aiohttp 请求体上限，避免大帧被拒（base64 有额外开销）
         self.app = web.Application(client_max_size=25 * 1024 * 1024)
         self.sio.attach(self.app)
+        self.frame_relay = LiveFrameRelay(
+            self.sio, ack_timeout=settings.CFG.getfloat("socketio", "frame_ack_timeout", fallback=1.0))
         # todo 注册 event 事件
         self.sio.on('connect', self.handle_connect)
         self.sio.on('disconnect', self.handle_disconnect)
@@ -85,6 +149,10 @@ class SocketIOHelper:
     # 移除旧的 'replay' 事件处理，统一采用 /api/socketio/emit 接口 + 新事件名 'frame'
     # 注册统一 HTTP 推送接口 (旧 push_* 接口已移除)
         self.app.router.add_post("/api/socketio/emit", self.http_emit)
+        self.app.router.add_post("/api/socketio/emit_batch", self.http_emit_batch)
+        # 实时画面：二进制帧推送与观看者查询（见 utils/frame_streamer.py）
+        self.app.router.add_post("/api/socketio/frame", self.http_frame)
+        self.app.router.add_get("/api/socketio/viewers", self.http_viewers)
         self.app["SocketIO"] = self
 
     def _get_server_info(self):
@@ -171,6 +239,8 @@ class SocketIOHelper:
                 sid = sid_or_ns
 
         info = self.conn_info.pop(sid, {})
+        if self.frame_relay is not None:
+            self.frame_relay.forget(sid)
         client_ip = info.get('client_ip', '未知IP')
         client_port = info.get('client_port', '未知端口')
         server_info = info.get('server_info', self._get_server_info())
@@ -298,6 +368,23 @@ class SocketIOHelper:
 
     # ========== 外部可调用 http 接口 ==========
 
+    async def _emit_payload(self, payload: dict) -> dict:
+        """校验并发送单个 HTTP 推送事件，返回结果对象"""
+        room = str(payload.get("room")) if payload.get("room") is not None else None
+        module = (payload.get("module") or '').strip()
+        event = (payload.get("event") or '').strip()
+        data = payload.get("data") or {}
+        # 放宽 module 校验，仅校验事件名；module 仅作服务端内部分类使用
+        if event not in ALLOWED_EVENTS:
+            return {"code": -2, "msg": "非法 event", "allowed_events": list(ALLOWED_EVENTS)}
+        # 事件数据结构校验
+        ok, err = validate_event_data(event, data)
+        if not ok:
+            return {"code": -3, "msg": f"数据校验失败: {err}", "event": event}
+        # 真实发送：直接以事件名发送 data（frame 可为字符串或对象，参见 schema 容忍）
+        await self.emit_event(room=room, event=event, data=data)
+        return {"code": 0, "msg": "ok", "data": {"room": room, "event": event}}
+
     async def http_emit(self, request):
         """统一事件推送接口 (module + event)
         请求 JSON:
@@ -311,23 +398,56 @@ class SocketIOHelper:
         """
         try:
             payload = await request.json()
-            room = str(payload.get("room")) if payload.get("room") is not None else None
-            module = (payload.get("module") or '').strip()
-            event = (payload.get("event") or '').strip()
-            data = payload.get("data") or {}
-            # 放宽 module 校验，仅校验事件名；module 仅作服务端内部分类使用
-            if event not in ALLOWED_EVENTS:
-                return web.json_response({"code": -2, "msg": "非法 event", "allowed_events": list(ALLOWED_EVENTS)})
-            # 事件数据结构校验
-            ok, err = validate_event_data(event, data)
-            if not ok:
-                return web.json_response({"code": -3, "msg": f"数据校验失败: {err}", "event": event})
-            # 真实发送：直接以事件名发送 data（frame 可为字符串或对象，参见 schema 容忍）
-            await self.emit_event(room=room, event=event, data=data)
-            return web.json_response({"code": 0, "msg": "ok", "data": {"room": room, "event": event}})
+            return web.json_response(await self._emit_payload(payload))
         except Exception as e:
             return web.json_response({"code": -1, "msg": f"emit失败: {e}"})
 
+    async def http_emit_batch(self, request):
+        """批量事件推送接口，按顺序逐个发送
+        请求 JSON: {"events": [<与 /emit 相同的事件对象>, ...]}
+        响应: {"code": 0, "data": {"total": n, "failed": m}}，单个事件失败不影响其余事件
+        """
+        try:
+            body = await request.json()
+            events = body.get("events") or []
+            failed = 0
+            for payload in events:
+                try:
+                    result = await self._emit_payload(payload or {})
+                except Exception as e:
+                    result = {"code": -1, "msg": str(e)}
+                if result.get("code") != 0:
+                    failed += 1
+                    print(f"❌ [emit_batch] 事件发送失败: {payload.get('event') if isinstance(payload, dict) else payload} {result.get('msg')}")
+            return web.json_response({"code": 0, "msg": "ok", "data": {"total": len(events), "failed": failed}})
+        except Exception as e:
+            return web.json_response({"code": -1, "msg": f"emit_batch失败: {e}"})
+
+    async def http_frame(self, request):
+        """实时画面推送接口
+        请求: POST /api/socketio/frame?room=device_7&mime=image/jpeg，body 为编码后的图片字节
+        以二进制附件发送 frame 事件: {"room", "mime", "image": <bytes>, "ts"}
+        房间内无观看者时直接丢弃；返回当前观看者数量供推流端决定是否继续编码
+        """
+        try:
+            room = (request.query.get("room") or "").strip()
+            if not room:
+                return web.json_response({"code": -2, "msg": "缺少 room"})
+            mime = request.query.get("mime") or "image/jpeg"
+            image = await request.read()
+            if not image:
+                return web.json_response({"code": -3, "msg": "帧数据为空"})
+            payload = {"room": room, "mime": mime, "image": image, "ts": int(time.time() * 1000)}
+            viewers = self.frame_relay.publish(room, payload)
+            return web.json_response({"code": 0, "msg": "ok", "data": {"room": room, "viewers": viewers}})
+        except Exception as e:
+            return web.json_response({"code": -1, "msg": f"推送帧失败: {e}"})
+
+    async def http_viewers(self, request):
+        """房间观看者数量: GET /api/socketio/viewers?room=device_7"""
+        room = (request.query.get("room") or "").strip()
+        viewers = len(self.frame_relay.viewers(room)) if room else 0
+        return web.json_response({"code": 0, "msg": "ok", "data": {"room": room, "viewers": viewers}})
 
     # ========== 主函数 ==========
     async def main(self, host='0.0.0.0', port=13838):
@@ -341,8 +461,202 @@ class SocketIOHelper:
         await asyncio.Event().wait()
 
 
+# 背压时可丢弃的低优先级事件（实时画面、日志、进度均会被后续事件覆盖）
+LOW_PRIORITY_EVENTS = {"frame", "log", "progress"}
+
+
+def _redact(obj):
+    """日志脱敏：对可能很大的字段进行缩略，避免刷屏"""
+    try:
+        if isinstance(obj, dict):
+            red = {}
+            for k, v in obj.items():
+                if k in ("base64", "pic_data", "pic_url", "image", "screenshot", "content"):
+                    red[k] = "***"
+                else:
+                    red[k] = _redact(v)
+            return red
+        if isinstance(obj, (list, tuple)):
+            return [_redact(x) for x in obj]
+        if isinstance(obj, str) and len(obj) > 200:
+            return obj[:50] + "***"
+        return obj
+    except Exception:
+        return "***"
+
+
+class SocketIOBatchEmitter:
+    """
+    后台批量推送器（每个进程、每个服务地址一个）
+    - 调用方只把事件放入有界队列后立即返回，不阻塞回放线程；
+    - 后台线程复用同一个 keep-alive 会话，把窗口期内的事件合并为一次 /emit_batch 请求，
+      同一房间的多帧 frame 只保留最新一帧；
+    - 队列满时丢弃低优先级事件（LOW_PRIORITY_EVENTS），高优先级事件挤掉最早的低优先级事件，
+      队列全是高优先级事件时短暂等待，仍满则丢弃并计数。
+    """
+
+    def __init__(self, api_base_url: str, queue_size: int = 1000, batch_size: int = 50,
+                 flush_interval: float = 0.02, put_timeout: float = 1.0):
+        self.api_base_url = api_base_url.rstrip("/")
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: Deque[dict] = deque()
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._session = requests.Session()
+        self._batch_supported = True
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"queued": 0, "sent": 0, "batches": 0, "coalesced": 0, "dropped": 0, "errors": 0}
+
+    def submit(self, payload: dict) -> bool:
+        """入队一个事件，被背压策略丢弃时返回 False"""
+        low = payload.get("event") in LOW_PRIORITY_EVENTS
+        with self._cond:
+            if len(self._queue) >= self.queue_size:
+                if low:
+                    self._stats["dropped"] += 1
+                    return False
+                if not self._evict_low_priority():
+                    deadline = time.monotonic() + self.put_timeout
+                    while len(self._queue) >= self.queue_size and not self._evict_low_priority():
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["dropped"] += 1
+                            print(f"⚠️ Socket.IO 推送队列已满，丢弃事件: {payload.get('event')}")
+                            return False
+                        self._cond.wait(remaining)
+            self._queue.append(payload)
+            self._stats["queued"] += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+        return True
+
+    def _evict_low_priority(self) -> bool:
+        for index, queued in enumerate(self._queue):
+            if queued.get("event") in LOW_PRIORITY_EVENTS:
+                del self._queue[index]
+                self._stats["dropped"] += 1
+                return True
+        return False
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="socketio-emitter", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> List[dict]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # 短暂等待以合并同一时刻的多个事件
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._inflight = len(batch)
+            self._cond.notify_all()
+        return self._coalesce(batch)
+
+    def _coalesce(self, batch: List[dict]) -> List[dict]:
+        """同一房间的 frame 只保留最后一帧，其余事件保持原顺序"""
+        last_frame = {}
+        for index, payload in enumerate(batch):
+            if payload.get("event") == "frame":
+                last_frame[payload.get("room")] = index
+        if len(last_frame) == sum(1 for p in batch if p.get("event") == "frame"):
+            return batch
+        kept = [p for i, p in enumerate(batch) if p.get("event") != "frame" or last_frame[p.get("room")] == i]
+        self._stats["coalesced"] += len(batch) - len(kept)
+        return kept
+
+    def _post_one(self, payload: dict) -> dict:
+        resp = self._session.post(f"{self.api_base_url}/emit", json=payload, timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _send(self, batch: List[dict]):
+        try:
+            if self._batch_supported and len(batch) > 1:
+                resp = self._session.post(f"{self.api_base_url}/emit_batch", json={"events": batch}, timeout=10)
+                if resp.status_code == 404:
+                    # 旧版服务端无批量接口：改为逐条推送（仍复用连接）
+                    self._batch_supported = False
+                else:
+                    resp.raise_for_status()
+                    self._stats["batches"] += 1
+                    self._stats["sent"] += len(batch)
+                    return
+            for payload in batch:
+                self._post_one(payload)
+                self._stats["sent"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"⚠️ Socket.IO 批量推送失败({len(batch)}条): {e} 示例: {_redact(batch[0])}")
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._send(batch)
+            finally:
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
+
+    def send_now(self, payload: dict) -> dict:
+        """同步推送单个事件（需要服务端返回值时使用）"""
+        return self._post_one(payload)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列中的事件发送完毕（进程退出前调用），超时返回 False"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, pending=len(self._queue))
+
+
+_EMITTERS: Dict[str, SocketIOBatchEmitter] = {}
+_EMITTERS_LOCK = threading.Lock()
+
+
+def get_batch_emitter(api_base_url: str) -> SocketIOBatchEmitter:
+    """获取（必要时创建）进程内共享的批量推送器"""
+    with _EMITTERS_LOCK:
+        emitter = _EMITTERS.get(api_base_url)
+        if emitter is None:
+            try:
+                queue_size = settings.CFG.getint("socketio", "emit_queue_size", fallback=1000)
+                batch_size = settings.CFG.getint("socketio", "emit_batch_size", fallback=50)
+                flush_interval = settings.CFG.getint("socketio", "emit_flush_interval_ms", fallback=20) / 1000.0
+            except Exception:
+                queue_size, batch_size, flush_interval = 1000, 50, 0.02
+            emitter = _EMITTERS[api_base_url] = SocketIOBatchEmitter(
+                api_base_url, queue_size=queue_size, batch_size=batch_size, flush_interval=flush_interval)
+        return emitter
+
+
+@atexit.register
+def _flush_emitters():
+    """进程退出前尽量发完队列中的事件（如任务完成/错误通知）"""
+    for emitter in list(_EMITTERS.values()):
+        emitter.flush(timeout=3.0)
+
+
 class SocketIOHttpApiClient:
-    """统一 HTTP API 客户端，仅保留 emit 方法"""
+    """统一 HTTP API 客户端，仅保留 emit 方法（事件经进程内共享的批量推送器异步发送）"""
     def __init__(self):
         # 提供安全的默认地址，避免缺少配置时抛错
         try:
@@ -351,35 +665,22 @@ class SocketIOHttpApiClient:
             port = 13838
         default_base = f"http://127.0.0.1:{port}/api/socketio"
         self.api_base_url = settings.CFG.get("socketio", "api_base_url", fallback=default_base).rstrip("/")
+        self.emitter = get_batch_emitter(self.api_base_url)
 
-    def emit(self, *, room: str, module: str, event: str, data: Dict[str, Any]) -> dict:
-        url = f"{self.api_base_url}/emit"
+    def emit(self, *, room: str, module: str, event: str, data: Dict[str, Any], wait: bool = False) -> dict:
+        """
+        推送事件，默认入队后立即返回
+
+        Args:
+            wait: 同步发送并返回服务端响应
+        """
         payload = {"room": str(room) if room is not None else None, "module": module, "event": event, "data": data}
-        # 日志脱敏：对可能很大的字段进行缩略，避免刷屏
-        def _redact(obj):
-            try:
-                if isinstance(obj, dict):
-                    red = {}
-                    for k, v in obj.items():
-                        if k in ("base64", "pic_data", "pic_url", "image", "screenshot", "content"):
-                            red[k] = "***"
-                        else:
-                            red[k] = _redact(v)
-                    return red
-                if isinstance(obj, (list, tuple)):
-                    return [
-                        _redact(x) for x in (list(obj) if isinstance(obj, list) else list(obj))
-                    ]
-                if isinstance(obj, str) and len(obj) > 200:
-                    return obj[:50] + "***"
-                return obj
-            except Exception:
-                return "***"
-        safe_payload = _redact(payload)
         try:
-            resp = requests.post(url, json=payload, timeout=10)
-            resp.raise_for_status()
-            return resp.json()
+            if wait:
+                return self.emitter.send_now(payload)
+            if self.emitter.submit(payload):
+                return {"code": 0, "msg": "queued"}
+            return {"code": -4, "msg": "推送队列已满，事件已丢弃"}
         except Exception as e:
             return {"code": -1, "msg": f"HTTP请求失败: {e}"}
 
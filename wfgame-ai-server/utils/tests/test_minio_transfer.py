@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# @File    : test_minio_transfer
+# @Desc    : MinioTransferEngine 单元测试（使用内存中的假客户端，不依赖 MinIO 服务）
+
+import hashlib
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from utils.minio_transfer import MinioTransferEngine, _file_etag, etag_matches
+
+
+class FakeS3Error(Exception):
+    """模拟 minio.error.S3Error：带 code 属性"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+class FakeMinioClient:
+    """内存中的 Minio 客户端替身，记录调用并可按对象键注入失败"""
+
+    def __init__(self):
+        self.objects = {}  # 对象键 -> (大小, ETag)
+        self.failures = {}  # 对象键 -> 待抛出的异常列表（按调用顺序依次抛出）
+        self.uploads = []
+        self._lock = threading.Lock()
+
+    def list_objects(self, bucket, prefix='', recursive=False):
+        return [SimpleNamespace(object_name=key, size=size, etag=etag)
+                for key, (size, etag) in self.objects.items() if key.startswith(prefix)]
+
+    def stat_object(self, bucket, key):
+        size, etag = self.objects[key]
+        return SimpleNamespace(object_name=key, size=size, etag=etag)
+
+    def fput_object(self, bucket, key, file_path, content_type=None, part_size=0, num_parallel_uploads=1):
+        with self._lock:
+            self.uploads.append(key)
+            pending = self.failures.get(key)
+            if pending:
+                raise pending.pop(0)
+        data = Path(file_path).read_bytes()
+        self.objects[key] = (len(data), f'"{hashlib.md5(data).hexdigest()}"')
+
+
+class MinioTransferEngineTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.client = FakeMinioClient()
+        self.sleeps = []
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, rel: str, data: bytes, base: Path = None) -> Path:
+        path = (base or self.tmp) / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+    def _engine(self, **kwargs) -> MinioTransferEngine:
+        kwargs.setdefault('workers', 2)
+        kwargs.setdefault('backoff', 0.1)
+        return MinioTransferEngine(self.client, sleep=self.sleeps.append, **kwargs)
+
+    def test_unchanged_files_are_skipped(self):
+        same = self._write('same.txt', b'unchanged')
+        self._write('changed.txt', b'new content')
+        self.client.objects['root/same.txt'] = (same.stat().st_size, f'"{hashlib.md5(b"unchanged").hexdigest()}"')
+        self.client.objects['root/changed.txt'] = (len(b'old content'), f'"{hashlib.md5(b"old content").hexdigest()}"')
+
+        report = self._engine().upload_folder('bucket', str(self.tmp), '/root/')
+
+        self.assertEqual(report.skipped, 1)
+        self.assertEqual(report.transferred, 1)
+        self.assertEqual(self.client.uploads, ['root/changed.txt'])
+        self.assertEqual(sorted(report.keys), ['root/changed.txt', 'root/same.txt'])
+
+    def test_multipart_etag_for_file_larger_than_part_size(self):
+        data = bytes(range(256)) * 10  # 2560 字节，按 1024 分片为 3 片
+        path = self._write('big.bin', data)
+        parts = [data[i:i + 1024] for i in range(0, len(data), 1024)]
+        expected = hashlib.md5(b''.join(hashlib.md5(p).digest() for p in parts)).hexdigest() + '-3'
+
+        self.assertEqual(_file_etag(path, 1024), expected)
+        self.assertTrue(etag_matches(path, len(data), f'"{expected}"', part_sizes=(1024,)))
+        self.assertFalse(etag_matches(path, len(data), f'"{expected}"', part_sizes=(2048,)))
+
+        # 远端为分片 ETag 时按引擎的 part_size 校验并跳过
+        self.client.objects['big.bin'] = (len(data), f'"{expected}"')
+        report = self._engine(part_size=1024).upload_folder('bucket', str(self.tmp), '')
+        self.assertEqual((report.skipped, report.transferred), (1, 0))
+        self.assertEqual(self.client.uploads, [])
+
+    def test_transient_failure_retries_with_backoff(self):
+        self._write('flaky.txt', b'data')
+        self.client.failures['flaky.txt'] = [ConnectionError('reset'), FakeS3Error('SlowDown')]
+
+        report = self._engine(max_retries=3).upload_folder('bucket', str(self.tmp), '')
+
+        self.assertEqual(report.transferred, 1)
+        self.assertEqual(report.failed, [])
+        self.assertEqual(report.retries, 2)
+        self.assertEqual(self.client.uploads, ['flaky.txt'] * 3)
+        # 指数退避（含最多 50% 抖动）：第 1 次 [0.1, 0.15]，第 2 次 [0.2, 0.3]
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(0.1 <= self.sleeps[0] <= 0.15)
+        self.assertTrue(0.2 <= self.sleeps[1] <= 0.3)
+
+    def test_permanent_failure_is_reported(self):
+        self._write('ok.txt', b'ok')
+        self._write('denied.txt', b'denied')
+        self._write('broken.txt', b'broken')
+        self.client.failures['denied.txt'] = [FakeS3Error('AccessDenied')]
+        self.client.failures['broken.txt'] = [ConnectionError('down')] * 3
+
+        report = self._engine(max_retries=2).upload_folder('bucket', str(self.tmp), '')
+
+        self.assertEqual(report.transferred, 1)
+        failed = dict(report.failed)
+        self.assertEqual(sorted(failed), ['broken.txt', 'denied.txt'])
+        self.assertIn('AccessDenied', failed['denied.txt'])
+        # 不可重试的错误只调用一次，可重试的错误用尽重试次数后失败
+        self.assertEqual(self.client.uploads.count('denied.txt'), 1)
+        self.assertEqual(self.client.uploads.count('broken.txt'), 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertIn('失败 2 个', report.summary())
+
+    def test_hidden_files_excluded_by_relative_path(self):
+        # 源目录本身位于隐藏目录下，不应导致全部文件被排除
+        base = self.tmp / '.staging' / 'src'
+        self._write('visible.txt', b'v', base)
+        self._write('sub/data.json', b'{}', base)
+        self._write('.env', b'secret', base)
+        self._write('.git/config', b'cfg', base)
+        self._write('sub/.cache/tmp.bin', b'x', base)
+
+        report = self._engine().upload_folder('bucket', str(base), 'root')
+        self.assertEqual(sorted(self.client.uploads), ['root/sub/data.json', 'root/visible.txt'])
+        self.assertEqual(report.transferred, 2)
+
+        self.client.uploads.clear()
+        report = self._engine(skip_unchanged=False).upload_folder('bucket', str(base), 'root', include_hidden=True)
+        self.assertEqual(report.transferred, 5)
+        self.assertIn('root/.git/config', self.client.uploads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,32 @@ import { io, Socket } from "socket.io-client";
 const ROOM_SOCKET_CACHE: Record<string, Socket> = {};
 const ROOM_EVENT_HANDLERS: Record<string, Record<string, Set<Function>>> = {};
 
+/**
+ * frame 事件负载转为可直接用于 <img> 的地址
+ * - 二进制帧: { mime, image: ArrayBuffer } -> data:<mime>;base64,...
+ * - 旧格式: base64 字符串 / { data: string } / { data: { base64 } }
+ */
+export function frameImageSrc(payload: any): string {
+    if (!payload) return "";
+    if (typeof payload === "string") return payload;
+    const image = payload.image;
+    if (image instanceof ArrayBuffer || ArrayBuffer.isView(image)) {
+        const bytes = image instanceof ArrayBuffer
+            ? new Uint8Array(image)
+            : new Uint8Array(image.buffer, image.byteOffset, image.byteLength);
+        let binary = "";
+        const chunk = 0x8000;
+        for (let i = 0; i < bytes.length; i += chunk) {
+            binary += String.fromCharCode.apply(null, Array.from(bytes.subarray(i, i + chunk)));
+        }
+        return `data:${payload.mime || "image/jpeg"};base64,${btoa(binary)}`;
+    }
+    const d = payload.data;
+    if (typeof d === "string") return d;
+    if (d && typeof d === "object" && typeof d.base64 === "string") return d.base64;
+    return "";
+}
+
 export function connectSocket(
     { room }: { room: string },
     options?: {
@@ -74,15 +100,13 @@ export function connectSocket(
     );
     // 移除全局 onAny 调试日志
 
-    socket.on("frame", payload => {
-        const ts = Date.now();
-        let base64Candidate: any = null;
-        if (payload && (payload.data || typeof payload === "string")) {
-            base64Candidate = payload.data || payload;
-        }
-        if (typeof base64Candidate === 'string') {
-            triggerRoomHandlers(room, "frame", base64Candidate);
+    socket.on("frame", (payload, ack) => {
+        const src = frameImageSrc(payload);
+        if (src) {
+            triggerRoomHandlers(room, "frame", src);
         }
+        // 确认已收到：服务端收到确认后才发送下一帧（期间只保留最新帧）
+        if (typeof ack === "function") ack();
     });
     socket.on("sysMsg", payload => {
         triggerRoomHandlers(room, "sysMsg", payload);